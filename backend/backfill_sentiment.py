@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Sentiment backfill for stored conversations and journals
+Streams records in chunks from local storage or MongoDB, scores them in large batches on all
+cores and writes the scores back with bulk updates. Progress is checkpointed after every
+chunk, so an interrupted run continues where it stopped.
+
+Records are (re)scored when they have no sentiment score or were scored by a different
+sentiment version (older model, backend or normalization logic). The version names the
+inference backend that actually loaded, so scores of a pytorch fallback are tagged pytorch.
+
+Usage:
+    python backfill_sentiment.py --source local --collection all
+    python backfill_sentiment.py --source mongo --collection journal --workers 4
+    python backfill_sentiment.py --source mongo --only-missing --reset
+"""
+from datetime import datetime, timezone
+from multiprocessing import Pool
+from dotenv import load_dotenv
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from llm_handler import analyze_sentiment_batch, get_sentiment_version
+
+DEFAULT_CHECKPOINT_PATH = os.path.join("local_data", "backfill_sentiment_checkpoint.json")
+
+# Text that gets scored for each collection
+TEXT_FIELDS = {
+    "conversation": ("user_input",),
+    "journal": ("title", "entry")
+}
+
+
+def record_text(record, collection_name):
+    """Build the text to score for a record"""
+    parts = [record.get(field) or "" for field in TEXT_FIELDS[collection_name]]
+    return ". ".join(part.strip() for part in parts if part.strip())
+
+
+def needs_scoring(record, only_missing, version):
+    """Check whether a record has no score or was scored by another sentiment version"""
+    if record.get("sentiment_score") is None:
+        return True
+    return not only_missing and record.get("sentiment_version") != version
+
+
+# Checkpoint handling
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_checkpoint(path, checkpoint):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    # Write to a temporary file first so a crash never leaves a half-written checkpoint
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(temporary_path, path)
+
+
+# Scoring workers
+def init_worker(threads_per_worker):
+    """Load the model once per worker process and keep torch from oversubscribing the cores"""
+    try:
+        import torch
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+    from sentiment_model_registry import get_sentiment_pipeline
+    get_sentiment_pipeline()
+
+
+def score_batch(texts):
+    """Score one batch with the transformer model (the lexicon tier is skipped)"""
+    return analyze_sentiment_batch(texts, use_fast_tier=False)
+
+
+class Scorer:
+    """Scores lists of texts in batches, in parallel when more than one worker is used"""
+
+    def __init__(self, workers, batch_size):
+        self.batch_size = batch_size
+        self.pool = None
+        if workers > 1:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // workers)
+            self.pool = Pool(workers, initializer=init_worker, initargs=(threads_per_worker,))
+            # Version of the model the workers actually loaded (asked from a worker, so this
+            # process doesn't load its own copy)
+            self.version = self.pool.apply(get_sentiment_version)
+        else:
+            self.version = get_sentiment_version()
+
+    def score(self, texts):
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if self.pool is not None:
+            results = self.pool.map(score_batch, batches)
+        else:
+            results = [score_batch(batch) for batch in batches]
+        return [score for batch_scores in results for score in batch_scores]
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+
+# Local storage backend
+def backfill_local(collection_name, scorer, chunk_size, only_missing, state, checkpoint_cb):
+    """
+    Backfill records from local JSON storage. The checkpoint is the list offset.
+    """
+    import local_storage
+
+    records = (local_storage.conversations_storage if collection_name == "conversation"
+               else local_storage.journals_storage)
+    offset = state.get("offset", 0)
+
+    while offset < len(records):
+        chunk = records[offset:offset + chunk_size]
+        to_score = [record for record in chunk if needs_scoring(record, only_missing, scorer.version)]
+
+        if to_score:
+            scores = scorer.score([record_text(record, collection_name) for record in to_score])
+            scored_at = datetime.now(timezone.utc).isoformat()
+            for record, score in zip(to_score, scores):
+                record["sentiment_score"] = score
+                record["sentiment_version"] = scorer.version
+                record["sentiment_scored_at"] = scored_at
+            local_storage.save_to_file()
+
+        offset += len(chunk)
+        state["offset"] = offset
+        checkpoint_cb(len(chunk), len(to_score))
+
+
+# MongoDB backend
+def backfill_mongo(collection_name, scorer, chunk_size, only_missing, state, checkpoint_cb):
+    """
+    Backfill records from MongoDB in _id order. The checkpoint is the last processed _id.
+    """
+    from pymongo import MongoClient, UpdateOne
+    from bson import ObjectId
+
+    load_dotenv()
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        raise ValueError("MONGO_URI not found in environment variables")
+
+    # Longer socket timeout than the API uses: bulk writes of a whole chunk take a while
+    client = MongoClient(mongo_uri, connectTimeoutMS=5000, serverSelectionTimeoutMS=5000, socketTimeoutMS=60000)
+    try:
+        collection = client["chatbot_db"][collection_name]
+
+        if only_missing:
+            candidate_query = {"sentiment_score": None}
+        else:
+            candidate_query = {"$or": [{"sentiment_score": None}, {"sentiment_version": {"$ne": scorer.version}}]}
+
+        projection = {field: 1 for field in TEXT_FIELDS[collection_name]}
+
+        while True:
+            query = dict(candidate_query)
+            if state.get("last_id"):
+                query["_id"] = {"$gt": ObjectId(state["last_id"])}
+
+            chunk = list(collection.find(query, projection).sort("_id", 1).limit(chunk_size))
+            if not chunk:
+                break
+
+            scores = scorer.score([record_text(record, collection_name) for record in chunk])
+            scored_at = datetime.now(timezone.utc)
+            collection.bulk_write([
+                UpdateOne({"_id": record["_id"]},
+                          {"$set": {"sentiment_score": score,
+                                    "sentiment_version": scorer.version,
+                                    "sentiment_scored_at": scored_at}})
+                for record, score in zip(chunk, scores)
+            ], ordered=False)
+
+            state["last_id"] = str(chunk[-1]["_id"])
+            checkpoint_cb(len(chunk), len(chunk))
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill sentiment scores for conversations and journals")
+    parser.add_argument("--source", choices=["local", "mongo"], default="local", help="storage backend")
+    parser.add_argument("--collection", choices=["conversation", "journal", "all"], default="all")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="records read and written per chunk")
+    parser.add_argument("--batch-size", type=int, default=64, help="texts per model forward pass")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="scoring processes")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT_PATH, help="checkpoint file")
+    parser.add_argument("--only-missing", action="store_true", help="only score records without a score")
+    parser.add_argument("--reset", action="store_true", help="ignore the checkpoint and start over")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    collections = ["conversation", "journal"] if args.collection == "all" else [args.collection]
+    checkpoint = {} if args.reset else load_checkpoint(args.checkpoint)
+    scorer = Scorer(args.workers, args.batch_size)
+
+    print(f"Backfilling sentiment ({scorer.version}) from {args.source} with {args.workers} worker(s)")
+
+    try:
+        for collection_name in collections:
+            key = f"{args.source}:{collection_name}"
+            state = checkpoint.get(key, {})
+            # A checkpoint from an older scoring version does not apply anymore
+            if state.get("version") != scorer.version:
+                state = {"version": scorer.version}
+            checkpoint[key] = state
+
+            start_time = time.perf_counter()
+            progress = {"read": 0, "updated": 0}
+
+            def checkpoint_cb(read_count, updated_count):
+                progress["read"] += read_count
+                progress["updated"] += updated_count
+                state["processed"] = state.get("processed", 0) + read_count
+                state["updated"] = state.get("updated", 0) + updated_count
+                save_checkpoint(args.checkpoint, checkpoint)
+                elapsed = time.perf_counter() - start_time
+                print(f"   {collection_name}: read {progress['read']}, updated {progress['updated']} "
+                      f"({progress['read'] / elapsed:.1f} records/s)")
+
+            print(f"\n{collection_name}: starting from {state.get('last_id') or state.get('offset') or 'the beginning'}")
+            backfill = backfill_mongo if args.source == "mongo" else backfill_local
+            backfill(collection_name, scorer, args.chunk_size, args.only_missing, state, checkpoint_cb)
+
+            elapsed = time.perf_counter() - start_time
+            rate = progress["read"] / elapsed if elapsed else 0
+            print(f"{collection_name}: done - {progress['updated']} updated out of {progress['read']} "
+                  f"in {elapsed:.1f}s ({rate:.1f} records/s)")
+    finally:
+        scorer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the pooled direct Gemini client against a local stub server.
+Starts a stub generateContent server on localhost and compares the per-call overhead of
+a fresh requests.post per call (the old behaviour) with the shared keep-alive clients of
+direct_gemini_handler (sync, and async with concurrent calls). Also counts the TCP
+connections the server had to accept.
+
+The stub speaks plain HTTP, so the numbers only include the TCP handshake; against the
+real API every new connection also pays for a TLS handshake, so the savings are larger.
+
+Usage:
+    python benchmark_gemini_client.py
+    python benchmark_gemini_client.py --calls 500 --concurrency 20 --delay-ms 5
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+STUB_RESPONSE = json.dumps({
+    "candidates": [{"content": {"parts": [{"text": "It sounds like today has been a lot. I'm here with you."}]}}]
+}).encode("utf-8")
+
+
+class StubGeminiHandler(BaseHTTPRequestHandler):
+    """Answers every POST like generateContent, keeping connections alive"""
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes; without this, Nagle + delayed ACK add ~40ms per call
+    disable_nagle_algorithm = True
+    delay_seconds = 0.0
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        # One handler instance per accepted connection
+        with StubGeminiHandler.lock:
+            StubGeminiHandler.connections += 1
+        super().setup()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.delay_seconds:
+            time.sleep(self.delay_seconds)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(STUB_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(STUB_RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(delay_ms):
+    StubGeminiHandler.delay_seconds = delay_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubGeminiHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def report(name, latencies, wall_seconds, connections):
+    latencies = sorted(latencies)
+    mean_ms = sum(latencies) / len(latencies) * 1000
+    p50_ms = latencies[len(latencies) // 2] * 1000
+    p95_ms = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000
+    print(f"{name:<32} mean={mean_ms:6.2f}ms p50={p50_ms:6.2f}ms p95={p95_ms:6.2f}ms "
+          f"wall={wall_seconds:6.2f}s connections={connections}")
+    return mean_ms
+
+
+def timed_calls(call, count):
+    latencies = []
+    start_time = time.perf_counter()
+    for _ in range(count):
+        call_start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - call_start)
+    return latencies, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pooled direct Gemini client")
+    parser.add_argument("--calls", type=int, default=200, help="calls per scenario")
+    parser.add_argument("--concurrency", type=int, default=10, help="concurrent calls in the async scenario")
+    parser.add_argument("--delay-ms", type=float, default=0, help="stub server processing time per call")
+    args = parser.parse_args()
+
+    server = start_stub_server(args.delay_ms)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1beta"
+
+    # Point the handler at the stub before it is imported
+    os.environ["GEMINI_API_BASE"] = base_url
+    os.environ["GOOGLE_API_KEY"] = "stub-key"
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    import direct_gemini_handler as handler
+
+    prompt = "I feel a bit overwhelmed today."
+    url = f"{base_url}/models/{handler.GEMINI_MODEL}:generateContent?key=stub-key"
+    payload = handler.build_gemini_payload(prompt)
+
+    print(f"{args.calls} calls per scenario against {base_url} "
+          f"(stub delay {args.delay_ms}ms, HTTP/2 {'available' if handler.HTTP2_AVAILABLE else 'not installed'})\n")
+
+    results = {}
+
+    # Old behaviour: a new connection for every call
+    try:
+        import requests
+        connections_before = StubGeminiHandler.connections
+        latencies, wall_seconds = timed_calls(lambda: requests.post(url, json=payload, timeout=45), args.calls)
+        results["fresh"] = report("requests.post per call (old)", latencies, wall_seconds,
+                                  StubGeminiHandler.connections - connections_before)
+    except ImportError:
+        print("requests not installed, skipping the fresh-connection baseline")
+
+    # Shared sync client
+    handler.get_direct_gemini_response(prompt)
+    connections_before = StubGeminiHandler.connections
+    latencies, wall_seconds = timed_calls(lambda: handler.get_direct_gemini_response(prompt), args.calls)
+    results["pooled"] = report("pooled sync client", latencies, wall_seconds,
+                               StubGeminiHandler.connections - connections_before)
+
+    # Shared async client with concurrent calls
+    async def run_async():
+        await handler.get_direct_gemini_response_async(prompt)
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies = []
+
+        async def one_call():
+            async with semaphore:
+                call_start = time.perf_counter()
+                await handler.get_direct_gemini_response_async(prompt)
+                latencies.append(time.perf_counter() - call_start)
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*[one_call() for _ in range(args.calls)])
+        wall_seconds = time.perf_counter() - start_time
+        await handler.close_gemini_http_clients()
+        return latencies, wall_seconds
+
+    connections_before = StubGeminiHandler.connections
+    latencies, wall_seconds = asyncio.run(run_async())
+    report(f"pooled async client (x{args.concurrency})", latencies, wall_seconds,
+           StubGeminiHandler.connections - connections_before)
+
+    if "fresh" in results:
+        print(f"\nPer-call overhead saved by the pooled client: {results['fresh'] - results['pooled']:.2f}ms "
+              f"({results['fresh'] / results['pooled']:.1f}x faster)")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
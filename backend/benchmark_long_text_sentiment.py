@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark of windowed sentiment for long journal entries.
+Builds entries of about 1k, 5k and 20k characters from dummy_data/journal_dummy_data.json and
+reports the windowed latency, the number of windows and how the windowed score compares to
+the old behaviour of scoring only the first 512 tokens.
+
+Usage:
+    python benchmark_long_text_sentiment.py
+    python benchmark_long_text_sentiment.py --sizes 1000 5000 20000 50000 --repeats 10
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sentiment_model_registry import get_sentiment_pipeline, normalize_sentiment
+from long_text_sentiment import analyze_long_text_sentiment_details, MAX_WINDOWS
+
+DUMMY_JOURNALS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   "dummy_data", "journal_dummy_data.json")
+
+
+def build_entry(paragraphs, size):
+    """Repeat the journal paragraphs until the entry is about size characters long"""
+    parts = []
+    length = 0
+    index = 0
+    while length < size:
+        paragraph = paragraphs[index % len(paragraphs)]
+        parts.append(paragraph)
+        length += len(paragraph) + 1
+        index += 1
+    return "\n".join(parts)[:size]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark windowed long-text sentiment")
+    parser.add_argument("--data", default=DUMMY_JOURNALS_PATH, help="journal JSON file")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000], help="entry sizes in characters")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per size")
+    args = parser.parse_args()
+
+    with open(args.data, "r", encoding="utf-8") as file:
+        paragraphs = [journal["entry"] for journal in json.load(file) if journal.get("entry")]
+
+    sentiment_analyzer = get_sentiment_pipeline()
+    sentiment_analyzer(paragraphs[0])
+
+    print(f"Windowed sentiment (max {MAX_WINDOWS} windows per entry), {args.repeats} runs per size\n")
+    print(f"{'chars':>7} {'tokens':>7} {'windows':>8} {'p50 ms':>8} {'max ms':>8} "
+          f"{'truncated ms':>13} {'windowed':>9} {'truncated':>10}")
+
+    for size in args.sizes:
+        entry = build_entry(paragraphs, size)
+
+        latencies = []
+        details = None
+        for _ in range(args.repeats):
+            start_time = time.perf_counter()
+            details = analyze_long_text_sentiment_details(entry)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+
+        # Previous behaviour: only the first 512 tokens are scored
+        start_time = time.perf_counter()
+        result = sentiment_analyzer(entry, truncation=True)[0]
+        truncated_ms = (time.perf_counter() - start_time) * 1000
+        truncated_score = normalize_sentiment(result["label"], result["score"])
+
+        print(f"{len(entry):>7} {details['tokens']:>7} {details['windows']:>8} "
+              f"{percentile(latencies, 0.5):>8.1f} {max(latencies):>8.1f} {truncated_ms:>13.1f} "
+              f"{details['score']:>9.3f} {truncated_score:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
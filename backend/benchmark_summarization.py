@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Benchmark of map-reduce summarization against the single-shot prompt on large synthetic
+histories (many days of chats and journal entries per user).
+
+By default the LLM is simulated, so the benchmark runs offline and is repeatable: a call takes
+    base latency + prompt tokens / prefill rate + output tokens / decode rate
+and its output is about a tenth of the prompt (at most --max-output tokens). The single-shot
+path is one such call over the whole history; map-reduce runs the chunk calls in parallel and
+then the reduce calls. A prompt above --context-tokens is reported as overflowing the model.
+Each history is then extended by one day and summarized again ("+1 day"): like the summary
+memo of llm_handler, the simulated LLM answers text it has already summarized at no cost, so
+map-reduce only redoes the last chunk and the reduce while single-shot redoes everything.
+With --live the real summarize / summarize_records of llm_handler are timed instead (needs
+API keys; clear the summary memo first or set SUMMARY_MEMO_ENABLED=false).
+
+Usage:
+    python benchmark_summarization.py
+    python benchmark_summarization.py --days 30 90 365 --messages-per-day 12 --parallel 4
+    python benchmark_summarization.py --live --days 30
+"""
+from datetime import date, timedelta
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from chat_context import count_tokens
+from map_reduce_summary import summarize_map_reduce, split_records_by_date, SUMMARY_CHUNK_TOKENS
+
+USER_LINES = [
+    "I couldn't sleep again last night, my mind kept racing about work.",
+    "Today was actually okay, I went for a walk and called my sister.",
+    "I feel like nobody at the office notices how much I'm carrying.",
+    "My therapist suggested journaling, so here I am trying it.",
+    "I snapped at my partner and I feel guilty about it.",
+    "Had a good laugh with friends, first time in a while.",
+]
+RESPONSES = [
+    "It sounds like a lot has been weighing on you. What do you think is behind the racing thoughts?",
+    "That walk sounds like it helped. How did it feel to talk with your sister?",
+    "Feeling unseen at work can be really draining. When did you first notice it?",
+    "Writing things down can make them feel more manageable. What came up as you wrote?",
+]
+
+
+def build_history(days, messages_per_day, seed=7):
+    """Synthetic chats and journal entries, one record per message"""
+    rng = random.Random(seed)
+    start = date(2024, 1, 1)
+    records = []
+    for day in range(days):
+        current = (start + timedelta(days=day)).isoformat()
+        for _ in range(messages_per_day):
+            records.append({"date": current, "user_input": rng.choice(USER_LINES),
+                            "response": rng.choice(RESPONSES)})
+        records.append({"date": current, "journal": " ".join(rng.choice(USER_LINES) for _ in range(4))})
+    return records
+
+
+class SimulatedLLM:
+    """Latency model of one summary call"""
+
+    def __init__(self, base_ms, prefill_tokens_per_second, decode_tokens_per_second, max_output, context_tokens):
+        self.base_seconds = base_ms / 1000
+        self.prefill = prefill_tokens_per_second
+        self.decode = decode_tokens_per_second
+        self.max_output = max_output
+        self.context_tokens = context_tokens
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.memo = {}
+
+    def summarize(self, text):
+        if text in self.memo:
+            return self.memo[text]
+        tokens = count_tokens(text)
+        if tokens > self.context_tokens:
+            raise ValueError(f"prompt of {tokens} tokens overflows the {self.context_tokens} token context")
+        output_tokens = min(max(tokens // 10, 50), self.max_output)
+        self.calls += 1
+        self.prompt_tokens += tokens
+        time.sleep(self.base_seconds + tokens / self.prefill + output_tokens / self.decode)
+        self.memo[text] = " ".join(["summary"] * output_tokens)
+        return self.memo[text]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark map-reduce against single-shot summarization")
+    parser.add_argument("--days", type=int, nargs="+", default=[30, 90, 365], help="history lengths in days")
+    parser.add_argument("--messages-per-day", type=int, default=10)
+    parser.add_argument("--chunk-tokens", type=int, default=SUMMARY_CHUNK_TOKENS)
+    parser.add_argument("--parallel", type=int, default=4, help="parallel map calls")
+    parser.add_argument("--base-ms", type=float, default=400, help="simulated fixed latency per call")
+    parser.add_argument("--prefill", type=float, default=20000, help="simulated prompt tokens per second")
+    parser.add_argument("--decode", type=float, default=150, help="simulated output tokens per second")
+    parser.add_argument("--max-output", type=int, default=400, help="simulated maximum output tokens")
+    parser.add_argument("--context-tokens", type=int, default=128000, help="simulated model context")
+    parser.add_argument("--live", action="store_true", help="call the real LLMs through llm_handler")
+    args = parser.parse_args()
+
+    if args.live:
+        import llm_handler
+        single_shot = llm_handler.summarize
+        map_chunk = llm_handler.summarize
+    print(f"{'days':>5} {'run':>6} {'tokens':>8} {'chunks':>6} | {'single-shot':>12} | "
+          f"{'map-reduce':>12} {'calls':>5} | speedup")
+
+    llm = None
+    for days in args.days:
+        if not args.live:
+            llm = SimulatedLLM(args.base_ms, args.prefill, args.decode, args.max_output, args.context_tokens)
+            single_shot = map_chunk = llm.summarize
+
+        for run, history_days in (("full", days), ("+1 day", days + 1)):
+            records = build_history(history_days, args.messages_per_day)
+            text = "\n".join(json.dumps(record) for record in records)
+            tokens = count_tokens(text)
+            chunks = len(split_records_by_date(records, args.chunk_tokens))
+
+            start_time = time.perf_counter()
+            try:
+                single_shot(text)
+                single_seconds = time.perf_counter() - start_time
+                single = f"{single_seconds:11.2f}s"
+            except ValueError:
+                single_seconds = None
+                single = "   overflow"
+
+            calls_before = llm.calls if llm else 0
+            start_time = time.perf_counter()
+            _, stats = summarize_map_reduce(records, map_chunk, chunk_tokens=args.chunk_tokens,
+                                            max_parallel=args.parallel)
+            map_reduce_seconds = time.perf_counter() - start_time
+            # LLM calls actually made (memo hits are free)
+            calls = llm.calls - calls_before if llm else stats["calls"]
+
+            speedup = f"{single_seconds / map_reduce_seconds:.1f}x" if single_seconds else "-"
+            print(f"{days:>5} {run:>6} {tokens:>8} {chunks:>6} | {single} | "
+                  f"{map_reduce_seconds:11.2f}s {calls:>5} | {speedup}")
+
+
+if __name__ == "__main__":
+    main()
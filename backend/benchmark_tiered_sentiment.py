@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark of tiered sentiment (fast lexicon pass with transformer escalation).
+Reports the escalation rate, the agreement of the tiered scores with the full model and
+the latency of each tier on dummy_data/conversation_dummy_data.json.
+
+Usage:
+    python benchmark_tiered_sentiment.py
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sentiment_lexicon import score_lexicon, needs_escalation
+from sentiment_model_registry import get_sentiment_pipeline
+from llm_handler import normalize_sentiment
+
+DUMMY_CONVERSATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                        "dummy_data", "conversation_dummy_data.json")
+
+
+def bucket(score, threshold=0.3):
+    """Map a normalized score to negative / neutral / positive"""
+    if score > threshold:
+        return "positive"
+    if score < -threshold:
+        return "negative"
+    return "neutral"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark tiered sentiment")
+    parser.add_argument("--data", default=DUMMY_CONVERSATIONS_PATH, help="conversation JSON file")
+    args = parser.parse_args()
+
+    with open(args.data, "r", encoding="utf-8") as file:
+        texts = [conv["user_input"] for conv in json.load(file) if conv.get("user_input")]
+
+    print(f"Scoring {len(texts)} messages from {args.data}\n")
+
+    # Full model on every message
+    sentiment_analyzer = get_sentiment_pipeline()
+    sentiment_analyzer(texts[0])
+    model_scores = []
+    start_time = time.perf_counter()
+    for text in texts:
+        result = sentiment_analyzer(text, truncation=True)[0]
+        model_scores.append(normalize_sentiment(result["label"], result["score"]))
+    model_ms = (time.perf_counter() - start_time) * 1000 / len(texts)
+
+    # Fast tier on every message
+    fast_results = []
+    start_time = time.perf_counter()
+    for text in texts:
+        score, details = score_lexicon(text)
+        fast_results.append(None if needs_escalation(score, details) else score)
+    lexicon_ms = (time.perf_counter() - start_time) * 1000 / len(texts)
+
+    escalated = sum(result is None for result in fast_results)
+    fast_pairs = [(fast, model) for fast, model in zip(fast_results, model_scores) if fast is not None]
+    tiered_scores = [model if fast is None else fast for fast, model in zip(fast_results, model_scores)]
+
+    fast_agreement = (sum(bucket(fast) == bucket(model) for fast, model in fast_pairs) / len(fast_pairs)
+                      if fast_pairs else 0)
+    tiered_agreement = sum(bucket(t) == bucket(m) for t, m in zip(tiered_scores, model_scores)) / len(texts)
+    sign_agreement = (sum((fast > 0) == (model > 0) for fast, model in fast_pairs) / len(fast_pairs)
+                      if fast_pairs else 0)
+    mean_abs_diff = sum(abs(t - m) for t, m in zip(tiered_scores, model_scores)) / len(texts)
+
+    escalation_rate = escalated / len(texts)
+    tiered_ms = lexicon_ms + escalation_rate * model_ms
+
+    print(f"Escalation rate:                 {escalation_rate:.1%} ({escalated}/{len(texts)})")
+    print(f"Fast tier bucket agreement:      {fast_agreement:.1%} (on {len(fast_pairs)} non-escalated messages)")
+    print(f"Fast tier sign agreement:        {sign_agreement:.1%}")
+    print(f"Tiered bucket agreement overall: {tiered_agreement:.1%}")
+    print(f"Tiered mean |score diff|:        {mean_abs_diff:.3f}")
+    print(f"\nLexicon latency:   {lexicon_ms:.3f} ms/message")
+    print(f"Model latency:     {model_ms:.1f} ms/message")
+    print(f"Tiered (expected): {tiered_ms:.1f} ms/message ({model_ms / tiered_ms:.1f}x faster)"
+          if tiered_ms else "")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Token-budgeted context for the chat prompt
+Past conversations, summaries and retrieved excerpts are added to the prompt in priority
+order until the token budget is used up:
+1. the latest conversation turns (at most CHAT_CONTEXT_MAX_TURNS_SHARE of the budget)
+2. the most relevant and most recent summaries
+3. retrieved therapy session excerpts
+so prompt size, latency and cost stay bounded however long the user's history gets.
+"""
+from typing import Any, Callable, Dict, List, Tuple
+import os
+import re
+import threading
+
+# Exact token counts with tiktoken (optional), otherwise about 4 characters per token
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+    TIKTOKEN_AVAILABLE = True
+except Exception:
+    _encoding = None
+    TIKTOKEN_AVAILABLE = False
+
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "3000"))
+# Upper bound of each section as a share of the budget (budget a section leaves unused goes to the next ones)
+CHAT_CONTEXT_MAX_TURNS_SHARE = float(os.getenv("CHAT_CONTEXT_MAX_TURNS_SHARE", "0.6"))
+CHAT_CONTEXT_MAX_SUMMARIES_SHARE = float(os.getenv("CHAT_CONTEXT_MAX_SUMMARIES_SHARE", "0.5"))
+CHAT_CONTEXT_MAX_CHUNKS_SHARE = float(os.getenv("CHAT_CONTEXT_MAX_CHUNKS_SHARE", "0.4"))
+
+NO_PAST_CONVERSATIONS = "No past conversations available."
+NO_SUMMARIES = "No summaries available."
+NO_RELEVANT_CHUNKS = "No relevant excerpts available."
+
+WORD_PATTERN = re.compile(r"[a-z']{3,}")
+STOPWORDS = {"the", "and", "for", "are", "but", "not", "you", "all", "any", "can", "had", "her", "was",
+             "one", "our", "out", "has", "his", "how", "its", "may", "who", "did", "get", "him", "she",
+             "too", "use", "that", "with", "have", "this", "will", "your", "from", "they", "been",
+             "were", "what", "when", "just", "like", "about", "feel", "feeling", "really", "today"}
+
+SECTIONS = ("past_conversations", "summaries", "relevant_chunks")
+
+_stats_lock = threading.Lock()
+_stats = {"prompts": 0, "tokens": {section: 0 for section in SECTIONS}, "dropped": {section: 0 for section in SECTIONS}}
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count the tokens of a text
+    :param text: the text
+    :return: number of tokens (tiktoken if installed, otherwise an estimate)
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def format_turn(message: Dict[str, Any]) -> str:
+    """Format one past conversation turn"""
+    return f"user_input: {message['user_input']}\nresponse: {message['response']}"
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """Format one daily summary"""
+    return (f"Date: {summary['date']}\nOverall Mood: {summary['overall_mood']}\n"
+            f"Sentiment Score: {summary['sentiment_score']}\n"
+            f"Chat Summary: {summary['chat_summary']}\nJournal Summary: {summary['journal_summary']}\n")
+
+
+def format_chunk(chunk: Dict[str, Any]) -> str:
+    """Format one retrieved excerpt"""
+    return chunk.get("text") or ""
+
+
+def _words(text: str) -> set:
+    return {word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS}
+
+
+def rank_summaries(summaries: List[Dict[str, Any]], user_prompt: str) -> List[int]:
+    """
+    Rank summaries by word overlap with the user's message plus recency
+    :param summaries: summaries sorted newest first
+    :param user_prompt: the user's latest message
+    :return: summary indexes, best first
+    """
+    prompt_words = _words(user_prompt or "")
+
+    def score(index):
+        summary = summaries[index]
+        relevance = 0.0
+        if prompt_words:
+            summary_words = _words(f"{summary.get('chat_summary', '')} {summary.get('journal_summary', '')} "
+                                   f"{summary.get('overall_mood', '')}")
+            relevance = len(prompt_words & summary_words) / len(prompt_words)
+        recency = 1 / (1 + index)
+        return relevance + 0.5 * recency
+
+    return sorted(range(len(summaries)), key=score, reverse=True)
+
+
+def _fill(items: List[Any], order: List[int], formatter: Callable[[Any], str], limit: int,
+          stop_at_first_miss: bool) -> Tuple[List[int], int]:
+    """Pick items in the given order while they fit in the limit; returns (picked indexes, tokens)"""
+    picked = []
+    used = 0
+    for index in order:
+        text = formatter(items[index])
+        if not text:
+            continue
+        # One extra token for the newline that joins the items
+        tokens = count_tokens(text) + 1
+        if used + tokens > limit:
+            if stop_at_first_miss:
+                break
+            continue
+        picked.append(index)
+        used += tokens
+    return picked, used
+
+
+def build_chat_context(past_conversations: List[Dict[str, Any]], summaries: List[Dict[str, Any]],
+                       relevant_chunks: List[Dict[str, Any]], user_prompt: str = "",
+                       budget: int = CHAT_CONTEXT_TOKEN_BUDGET) -> Tuple[str, str, str, Dict[str, Any]]:
+    """
+    Build the three context sections of the chat prompt within a token budget
+    :param past_conversations: past turns, newest first
+    :param summaries: daily summaries, newest first
+    :param relevant_chunks: retrieved excerpts, most similar first
+    :param user_prompt: the user's latest message (used to rank summaries)
+    :param budget: total tokens for the three sections
+    :return: tuple (past conversations context, summaries context, relevant chunks context, report)
+    """
+    past_conversations = past_conversations or []
+    summaries = summaries or []
+    relevant_chunks = relevant_chunks or []
+    remaining = budget
+
+    # 1. Latest turns, newest first; stop at the first turn that doesn't fit so no gap is left
+    turns_limit = min(remaining, int(budget * CHAT_CONTEXT_MAX_TURNS_SHARE))
+    turn_indexes, turn_tokens = _fill(past_conversations, list(range(len(past_conversations))),
+                                      format_turn, turns_limit, stop_at_first_miss=True)
+    remaining -= turn_tokens
+
+    # 2. Most relevant / most recent summaries, shown newest first
+    summaries_limit = min(remaining, int(budget * CHAT_CONTEXT_MAX_SUMMARIES_SHARE))
+    summary_indexes, summary_tokens = _fill(summaries, rank_summaries(summaries, user_prompt),
+                                            format_summary, summaries_limit, stop_at_first_miss=False)
+    summary_indexes.sort()
+    remaining -= summary_tokens
+
+    # 3. Retrieved excerpts with whatever is left
+    chunks_limit = min(remaining, int(budget * CHAT_CONTEXT_MAX_CHUNKS_SHARE))
+    chunk_indexes, chunk_tokens = _fill(relevant_chunks, list(range(len(relevant_chunks))),
+                                        format_chunk, chunks_limit, stop_at_first_miss=False)
+    chunk_indexes.sort()
+
+    past_conversations_context = ("\n".join(format_turn(past_conversations[i]) for i in turn_indexes)
+                                  or NO_PAST_CONVERSATIONS)
+    summaries_context = "\n".join(format_summary(summaries[i]) for i in summary_indexes) or NO_SUMMARIES
+    relevant_chunks_context = ("\n".join(format_chunk(relevant_chunks[i]) for i in chunk_indexes)
+                               or NO_RELEVANT_CHUNKS)
+
+    sections = {
+        "past_conversations": {"tokens": turn_tokens, "items": len(turn_indexes), "available": len(past_conversations)},
+        "summaries": {"tokens": summary_tokens, "items": len(summary_indexes), "available": len(summaries)},
+        "relevant_chunks": {"tokens": chunk_tokens, "items": len(chunk_indexes), "available": len(relevant_chunks)}
+    }
+    report = {
+        "budget": budget,
+        "used": turn_tokens + summary_tokens + chunk_tokens,
+        "exact": TIKTOKEN_AVAILABLE,
+        "sections": sections
+    }
+
+    with _stats_lock:
+        _stats["prompts"] += 1
+        for section, values in sections.items():
+            _stats["tokens"][section] += values["tokens"]
+            _stats["dropped"][section] += values["available"] - values["items"]
+
+    return past_conversations_context, summaries_context, relevant_chunks_context, report
+
+
+def get_context_stats() -> Dict[str, Any]:
+    """
+    Get the average tokens per prompt section and how many items the budget left out
+    :return: dictionary of per-section averages and totals
+    """
+    with _stats_lock:
+        prompts = _stats["prompts"]
+        return {
+            "budget": CHAT_CONTEXT_TOKEN_BUDGET,
+            "exact": TIKTOKEN_AVAILABLE,
+            "prompts": prompts,
+            "avg_tokens": {section: round(tokens / prompts, 1) if prompts else 0
+                           for section, tokens in _stats["tokens"].items()},
+            "dropped_items": dict(_stats["dropped"])
+        }
@@ -0,0 +1,267 @@
+"""
+Per-provider circuit breakers for LLM calls
+Each provider (gemini, openai) has a breaker that tracks the error rate and latency of its
+recent calls. When too many calls fail or are too slow, the breaker opens and requests go
+straight to the fallback provider instead of waiting out timeouts and retries. After a cool
+down the breaker half-opens and lets a few probe calls through; if they succeed it closes.
+Calls cut off by the request's deadline (DeadlineExceededError) and other ProviderNeutralErrors
+are released like cancelled calls: they say nothing about the provider.
+"""
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict
+import os
+import time
+import logging
+import threading
+
+from llm_errors import ProviderNeutralError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Rolling window (seconds) the error rate and latency are computed over
+BREAKER_WINDOW_SECONDS = float(os.getenv("LLM_BREAKER_WINDOW_SECONDS", "60"))
+# Calls needed in the window before the breaker can open
+BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+# Open when this share of calls in the window failed
+BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+# Calls slower than this count as slow; open when this share of calls was slow
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", "20"))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("LLM_BREAKER_SLOW_CALL_RATE", "0.8"))
+# How long the breaker stays open before probing, and how many probes run at once
+BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("LLM_BREAKER_HALF_OPEN_CALLS", "1"))
+
+
+class CircuitOpenError(Exception):
+    """Raised when a provider's circuit breaker rejects a call"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Rolling-window circuit breaker (closed -> open -> half_open -> closed).
+    Thread-safe, so the same breaker can be used from the event loop and from thread pools.
+    """
+
+    def __init__(self, name: str, window_seconds: float = BREAKER_WINDOW_SECONDS,
+                 min_calls: int = BREAKER_MIN_CALLS, failure_rate: float = BREAKER_FAILURE_RATE,
+                 slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS,
+                 slow_call_rate: float = BREAKER_SLOW_CALL_RATE,
+                 open_seconds: float = BREAKER_OPEN_SECONDS,
+                 half_open_calls: int = BREAKER_HALF_OPEN_CALLS):
+        """
+        :param name: provider name used in logs and status
+        :param window_seconds: rolling window the rates are computed over
+        :param min_calls: calls needed in the window before the breaker can open
+        :param failure_rate: share of failed calls that opens the breaker
+        :param slow_call_seconds: latency above which a call counts as slow
+        :param slow_call_rate: share of slow calls that opens the breaker
+        :param open_seconds: time the breaker stays open before half-opening
+        :param half_open_calls: probe calls allowed at once while half-open
+        """
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = max(int(min_calls), 1)
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_calls = max(int(half_open_calls), 1)
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = None
+        self._probes_in_flight = 0
+        # (monotonic time, succeeded, latency seconds) of recent calls
+        self._calls = deque()
+
+        # Metrics
+        self._rejected_total = 0
+        self._opened_total = 0
+        self._last_state_change = None
+
+    def _set_state(self, state):
+        if state == self._state:
+            return
+        logging.warning(f"Circuit breaker '{self.name}': {self._state} -> {state}")
+        self._state = state
+        self._last_state_change = datetime.now(timezone.utc).isoformat()
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            self._opened_total += 1
+        elif state == CLOSED:
+            self._calls.clear()
+        self._probes_in_flight = 0
+
+    def _prune(self, now):
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def _rates(self):
+        total = len(self._calls)
+        if not total:
+            return 0.0, 0.0
+        failures = sum(1 for _, succeeded, _ in self._calls if not succeeded)
+        slow = sum(1 for _, _, latency in self._calls if latency >= self.slow_call_seconds)
+        return failures / total, slow / total
+
+    def allow_request(self) -> bool:
+        """
+        Check whether a call may go to the provider. Every allowed call must be followed by
+        record_success, record_failure or (if the call was cancelled) release.
+        :return: True if the call may proceed
+        """
+        with self._lock:
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self._rejected_total += 1
+                    return False
+                self._set_state(HALF_OPEN)
+
+            if self._state == HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_calls:
+                    self._rejected_total += 1
+                    return False
+                self._probes_in_flight += 1
+
+            return True
+
+    def record_success(self, latency: float):
+        """Record a successful call and its latency in seconds"""
+        self._record(True, latency)
+
+    def record_failure(self, latency: float):
+        """Record a failed call and how long it took in seconds"""
+        self._record(False, latency)
+
+    def release(self):
+        """Give back a half-open probe slot without recording an outcome"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+
+    def _record(self, succeeded, latency):
+        with self._lock:
+            now = time.monotonic()
+
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                # A slow success still means the provider is degraded
+                if succeeded and latency < self.slow_call_seconds:
+                    self._set_state(CLOSED)
+                else:
+                    self._set_state(OPEN)
+                return
+
+            self._calls.append((now, succeeded, latency))
+            self._prune(now)
+
+            if self._state == CLOSED and len(self._calls) >= self.min_calls:
+                failure_rate, slow_rate = self._rates()
+                if failure_rate >= self.failure_rate or slow_rate >= self.slow_call_rate:
+                    self._set_state(OPEN)
+
+    def call(self, func: Callable[..., Any], *args, **kwargs):
+        """
+        Run a blocking call through the breaker
+        :return: the call's result
+        :raises CircuitOpenError: if the breaker rejects the call
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit breaker for {self.name} is {self._state}")
+        start_time = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except ProviderNeutralError:
+            self.release()
+            raise
+        except Exception:
+            self.record_failure(time.perf_counter() - start_time)
+            raise
+        except BaseException:
+            # Cancelled (e.g. the client went away): says nothing about the provider
+            self.release()
+            raise
+        self.record_success(time.perf_counter() - start_time)
+        return result
+
+    async def acall(self, func: Callable[..., Awaitable[Any]], *args, **kwargs):
+        """
+        Await an async call through the breaker
+        :return: the call's result
+        :raises CircuitOpenError: if the breaker rejects the call
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(f"Circuit breaker for {self.name} is {self._state}")
+        start_time = time.perf_counter()
+        try:
+            result = await func(*args, **kwargs)
+        except ProviderNeutralError:
+            self.release()
+            raise
+        except Exception:
+            self.record_failure(time.perf_counter() - start_time)
+            raise
+        except BaseException:
+            # Cancelled (e.g. the client went away): says nothing about the provider
+            self.release()
+            raise
+        self.record_success(time.perf_counter() - start_time)
+        return result
+
+    def get_state(self) -> Dict[str, Any]:
+        """
+        Get the breaker state for monitoring
+        :return: dictionary with the state, rolling error rate and latency, and counters
+        """
+        with self._lock:
+            self._prune(time.monotonic())
+            failure_rate, slow_rate = self._rates()
+            latencies = sorted(latency for _, _, latency in self._calls)
+            retry_in = None
+            if self._state == OPEN:
+                retry_in = max(self.open_seconds - (time.monotonic() - self._opened_at), 0)
+            return {
+                "state": self._state,
+                "calls_in_window": len(self._calls),
+                "failure_rate": round(failure_rate, 4),
+                "slow_call_rate": round(slow_rate, 4),
+                "p50_latency_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                "p95_latency_ms": (round(latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000, 1)
+                                   if latencies else None),
+                "retry_in_seconds": round(retry_in, 1) if retry_in is not None else None,
+                "opened_total": self._opened_total,
+                "rejected_total": self._rejected_total,
+                "last_state_change": self._last_state_change
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    """
+    Get the process-wide breaker of a provider, creating it on first use
+    :param provider: provider name (gemini, openai)
+    :return: the provider's circuit breaker
+    """
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(provider, CircuitBreaker(provider))
+    return breaker
+
+
+def get_circuit_breaker_states() -> Dict[str, Dict[str, Any]]:
+    """Get the state of the configured providers' breakers and of every other breaker in use"""
+    # Imported here so the breakers don't load the provider SDKs
+    from llm_providers import get_primary_provider_name, get_fallback_provider_name, NO_PROVIDER
+
+    for provider in (get_primary_provider_name(), get_fallback_provider_name()):
+        if provider != NO_PROVIDER:
+            get_circuit_breaker(provider)
+    return {provider: breaker.get_state() for provider, breaker in list(_breakers.items())}
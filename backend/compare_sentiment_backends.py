@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Accuracy vs latency comparison of the sentiment inference backends.
+Scores the user messages from the dummy conversation data with every backend and
+compares them against the full-precision pytorch pipeline.
+
+Usage:
+    python compare_sentiment_backends.py
+    python compare_sentiment_backends.py --backends pytorch int8 --repeat 3
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sentiment_model_registry import load_sentiment_pipeline, SENTIMENT_BACKENDS
+from llm_handler import normalize_sentiment
+
+DUMMY_CONVERSATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                        "dummy_data", "conversation_dummy_data.json")
+
+
+def load_texts(path):
+    """Load the user messages from the dummy conversation data"""
+    with open(path, "r", encoding="utf-8") as file:
+        conversations = json.load(file)
+    return [conv["user_input"] for conv in conversations if conv.get("user_input")]
+
+
+def percentile(values, pct):
+    """Simple nearest-rank percentile"""
+    ordered = sorted(values)
+    index = min(int(len(ordered) * pct / 100), len(ordered) - 1)
+    return ordered[index]
+
+
+def run_backend(backend, texts, repeat):
+    """
+    Score every text one at a time (like a chat request) and once as a single batch
+    :return: dictionary with labels, normalized scores and timings
+    """
+    start_time = time.perf_counter()
+    sentiment_analyzer, used_backend = load_sentiment_pipeline(backend)
+    load_seconds = time.perf_counter() - start_time
+
+    # Warm up so the first measured call doesn't include lazy initialization
+    sentiment_analyzer(texts[0])
+
+    latencies = []
+    results = []
+    for _ in range(repeat):
+        results = []
+        for text in texts:
+            call_start = time.perf_counter()
+            results.append(sentiment_analyzer(text, truncation=True)[0])
+            latencies.append((time.perf_counter() - call_start) * 1000)
+
+    batch_start = time.perf_counter()
+    sentiment_analyzer(texts, batch_size=len(texts), truncation=True)
+    batch_seconds = time.perf_counter() - batch_start
+
+    return {
+        "backend": used_backend,
+        "load_seconds": load_seconds,
+        "labels": [result["label"].lower() for result in results],
+        "scores": [normalize_sentiment(result["label"], result["score"]) for result in results],
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "batch_texts_per_second": len(texts) / batch_seconds if batch_seconds else 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sentiment inference backends")
+    parser.add_argument("--backends", nargs="+", default=list(SENTIMENT_BACKENDS),
+                        help="backends to compare (the first one is the reference)")
+    parser.add_argument("--data", default=DUMMY_CONVERSATIONS_PATH, help="conversation JSON file")
+    parser.add_argument("--repeat", type=int, default=3, help="how many times to score each text")
+    args = parser.parse_args()
+
+    texts = load_texts(args.data)
+    print(f"Scoring {len(texts)} messages from {args.data}\n")
+
+    reports = []
+    for backend in args.backends:
+        print(f"Running {backend}...")
+        report = run_backend(backend, texts, args.repeat)
+        if report["backend"] != backend:
+            print(f"   WARNING: {backend} unavailable, fell back to {report['backend']}")
+        reports.append(report)
+
+    reference = reports[0]
+    print(f"\nReference backend: {reference['backend']}\n")
+    print(f"{'backend':<10}{'load s':>9}{'p50 ms':>9}{'p95 ms':>9}{'batch/s':>10}"
+          f"{'label agree':>13}{'mean |diff|':>13}{'max |diff|':>12}")
+
+    for report in reports:
+        agreement = sum(a == b for a, b in zip(report["labels"], reference["labels"])) / len(texts)
+        diffs = [abs(a - b) for a, b in zip(report["scores"], reference["scores"])]
+        print(f"{report['backend']:<10}{report['load_seconds']:>9.2f}{report['p50_ms']:>9.1f}"
+              f"{report['p95_ms']:>9.1f}{report['batch_texts_per_second']:>10.1f}"
+              f"{agreement:>12.1%} {sum(diffs) / len(diffs):>12.3f}{max(diffs):>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
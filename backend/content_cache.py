@@ -0,0 +1,212 @@
+"""
+Content-addressed cache
+Keys are a hash of the normalized input text, so repeated inputs ("I'm fine", "thanks", "hi")
+skip recomputation entirely (caches whose output depends on the exact text hash it unchanged). Entries live in a size-bounded in-memory LRU with a TTL, with an
+optional on-disk SQLite tier that survives restarts and is shared between gunicorn workers.
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text before hashing: unicode normalization, lowercase, collapsed whitespace
+    :param text: the raw text
+    :return: the normalized text
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class ContentCache:
+    """
+    Thread-safe LRU/TTL cache keyed by the hash of the normalized (or exact) text.
+    Values must be JSON serializable when the disk tier is enabled.
+    """
+
+    def __init__(self, name: str = "cache", namespace: Union[str, Callable[[], str]] = "", max_entries: int = 10000,
+                 ttl_seconds: Optional[float] = 86400, disk_path: Optional[str] = None,
+                 disk_max_entries: int = 100000, normalize: bool = True):
+        """
+        :param name: name used in logs and stats
+        :param namespace: mixed into every key (e.g. model name) so different producers never collide,
+                          or a function returning it when the producer is only known later
+        :param max_entries: maximum number of entries kept in memory
+        :param ttl_seconds: how long an entry stays valid (None for no expiry)
+        :param disk_path: SQLite file for the on-disk tier (None to disable it)
+        :param disk_max_entries: maximum number of entries kept on disk
+        :param normalize: hash the normalized text (False: the exact text)
+        """
+        self.name = name
+        self.namespace = namespace
+        self.max_entries = max(int(max_entries), 1)
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path
+        self.disk_max_entries = max(int(disk_max_entries), 1)
+        self.normalize = normalize
+
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_writes = 0
+
+        # Counters
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+        if disk_path:
+            self._open_disk(disk_path)
+
+    def _open_disk(self, disk_path: str):
+        """Open (or create) the SQLite file backing the disk tier"""
+        try:
+            directory = os.path.dirname(disk_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False, timeout=5)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS cache_created_at ON cache (created_at)")
+            self._disk.commit()
+        except Exception as e:
+            logging.warning(f"{self.name} disk tier disabled, failed to open {disk_path}: {e}")
+            self._disk = None
+
+    def make_key(self, text: str) -> str:
+        """
+        Build the content-addressed key for a text
+        :param text: the raw text
+        :return: hex SHA-256 of the namespace and (normalized) text
+        """
+        namespace = self.namespace() if callable(self.namespace) else self.namespace
+        content = f"{namespace}\0{normalize_text(text) if self.normalize else text or ''}"
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def get(self, text: str, use_disk: bool = True) -> Tuple[bool, Any]:
+        """
+        Look up a text in memory, then on disk
+        :param text: the raw text
+        :param use_disk: whether to fall back to the disk tier on a memory miss
+        :return: tuple (found, value)
+        """
+        key = self.make_key(text)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if not self._is_expired(created_at):
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return True, value
+                del self._entries[key]
+                self._expirations += 1
+
+            if use_disk and self._disk is not None:
+                found, created_at, value = self._disk_get(key)
+                if found:
+                    self._store_in_memory(key, value, created_at)
+                    self._disk_hits += 1
+                    return True, value
+
+            self._misses += 1
+            return False, None
+
+    def set(self, text: str, value: Any):
+        """
+        Store the value for a text in memory and on disk
+        :param text: the raw text
+        :param value: the value to cache
+        """
+        key = self.make_key(text)
+        created_at = time.time()
+
+        with self._lock:
+            self._store_in_memory(key, value, created_at)
+            if self._disk is not None:
+                self._disk_set(key, value, created_at)
+
+    def _store_in_memory(self, key: str, value: Any, created_at: float):
+        """Insert into the LRU, evicting the least recently used entries beyond max_entries"""
+        self._entries[key] = (created_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def _disk_get(self, key: str) -> Tuple[bool, float, Any]:
+        try:
+            row = self._disk.execute("SELECT value, created_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return False, 0, None
+            value, created_at = row
+            if self._is_expired(created_at):
+                self._disk.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._disk.commit()
+                self._expirations += 1
+                return False, 0, None
+            return True, created_at, json.loads(value)
+        except Exception as e:
+            logging.warning(f"{self.name} disk read failed: {e}")
+            return False, 0, None
+
+    def _disk_set(self, key: str, value: Any, created_at: float):
+        try:
+            self._disk.execute("INSERT OR REPLACE INTO cache (key, value, created_at) VALUES (?, ?, ?)",
+                               (key, json.dumps(value), created_at))
+            self._disk_writes += 1
+            # Prune the oldest rows now and then instead of on every write
+            if self._disk_writes % 1000 == 0:
+                self._disk.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (self.disk_max_entries,)
+                )
+            self._disk.commit()
+        except Exception as e:
+            logging.warning(f"{self.name} disk write failed: {e}")
+
+    def clear(self):
+        """Remove every entry from memory and disk"""
+        with self._lock:
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM cache")
+                self._disk.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters and current size
+        :return: dictionary of cache statistics
+        """
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                "name": self.name,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "disk_enabled": self._disk is not None,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": round((self._hits + self._disk_hits) / lookups, 4) if lookups else 0,
+                "evictions": self._evictions,
+                "expirations": self._expirations
+            }
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Incremental per-user daily summary pipeline
+For each user and day, the day's conversations and journal entries are aggregated into one
+summary document (chat_summary, journal_summary, overall_mood, sentiment_score), the shape
+get_results reads through get_all_summaries. Summaries are stored by (username, date) in local
+storage, where get_all_summaries reads them.
+
+Each user has a watermark: the timestamp of the newest record already summarized. A run only
+rebuilds the days that have records newer than the watermark, then moves the watermark to the
+newest record it saw. Rebuilding a day goes through the summary memo of llm_handler, so the
+unchanged side of a day (e.g. its journal when only chats were added) costs no LLM call.
+If a day fails, the watermark stops before it and the day is retried on the next run.
+
+Usage:
+    python daily_summary_pipeline.py
+    python daily_summary_pipeline.py --user alice --user bob
+    python daily_summary_pipeline.py --dry-run
+    python daily_summary_pipeline.py --rebuild --user alice
+"""
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from llm_handler import summarize, analyze_sentiment_batch, SUMMARY_FAILED
+from mongodb_database_handler import (get_chats_by_date, get_journals_by_date, get_record_timestamps,
+                                      get_usernames_with_records, get_summary_watermark,
+                                      set_summary_watermark, upsert_daily_summary)
+
+NO_CHATS = "No conversations on this day."
+NO_JOURNALS = "No journal entries on this day."
+
+# Overall mood by mean sentiment score (upper bounds, checked in order)
+MOOD_LEVELS = (
+    (-0.5, "Very low"),
+    (-0.15, "Low"),
+    (0.15, "Neutral"),
+    (0.5, "Positive"),
+    (1.01, "Very positive")
+)
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parse an ISO timestamp as an aware UTC datetime"""
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def journal_text(journal: Dict[str, Any]) -> str:
+    parts = [journal.get("title") or "", journal.get("entry") or ""]
+    return ". ".join(part.strip() for part in parts if part.strip())
+
+
+def chat_transcript(chats: List[Dict[str, Any]]) -> str:
+    """The day's conversations as one transcript"""
+    return "\n".join(f"User: {chat.get('user_input', '')}\nTherapist: {chat.get('response', '')}" for chat in chats)
+
+
+def journals_text(journals: List[Dict[str, Any]]) -> str:
+    """The day's journal entries as one text"""
+    return "\n\n".join(journal_text(journal) for journal in journals)
+
+
+def day_sentiment(chats: List[Dict[str, Any]], journals: List[Dict[str, Any]],
+                  score_texts: Callable[[List[str]], List[float]]) -> Optional[float]:
+    """
+    Mean sentiment score of the day's messages and journal entries. Records stored without a
+    score (sentiment pool overloaded, old journals) are scored here in one batch.
+    """
+    texts = [chat.get("user_input") or "" for chat in chats] + [journal_text(journal) for journal in journals]
+    scores = [record.get("sentiment_score") for record in chats + journals]
+
+    missing = [index for index, score in enumerate(scores) if score is None and texts[index]]
+    if missing:
+        for index, score in zip(missing, score_texts([texts[index] for index in missing])):
+            scores[index] = score
+
+    scores = [score for score in scores if score is not None]
+    return round(sum(scores) / len(scores), 3) if scores else None
+
+
+def overall_mood(sentiment_score: Optional[float], chats: List[Dict[str, Any]]) -> str:
+    """Mood label of the day, with the most frequent top emotions of the analyzed messages"""
+    if sentiment_score is None:
+        return "Unknown"
+    level = next(label for bound, label in MOOD_LEVELS if sentiment_score < bound)
+
+    emotion_counts: Dict[str, int] = {}
+    for chat in chats:
+        top = ((chat.get("analysis") or {}).get("emotions") or {}).get("top")
+        if top:
+            emotion_counts[top] = emotion_counts.get(top, 0) + 1
+    emotions = sorted(emotion_counts, key=emotion_counts.get, reverse=True)[:2]
+    return f"{level} ({', '.join(emotions)})" if emotions else level
+
+
+def _summary_of(text: str, empty: str, summarize_text: Callable[[str], str]) -> str:
+    if not text.strip():
+        return empty
+    summary = summarize_text(text)
+    if summary == SUMMARY_FAILED:
+        raise RuntimeError(SUMMARY_FAILED)
+    return summary
+
+
+def build_daily_summary(username: str, date: str, chats: List[Dict[str, Any]], journals: List[Dict[str, Any]],
+                        summarize_text: Callable[[str], str] = summarize,
+                        score_texts: Callable[[List[str]], List[float]] = analyze_sentiment_batch) -> Dict[str, Any]:
+    """
+    Aggregate one user's day into a summary document
+    :param username: the user
+    :param date: the day (YYYY-MM-DD, UTC)
+    :param chats: the day's conversations, oldest first
+    :param journals: the day's journal entries, oldest first
+    :param summarize_text: function summarizing a text (raises or returns SUMMARY_FAILED on failure)
+    :param score_texts: function scoring texts that were stored without a sentiment score
+    :return: the summary document
+    :raises RuntimeError: if a summary failed
+    """
+    sentiment_score = day_sentiment(chats, journals, score_texts)
+    return {
+        "username": username,
+        "date": date,
+        "chat_summary": _summary_of(chat_transcript(chats), NO_CHATS, summarize_text),
+        "journal_summary": _summary_of(journals_text(journals), NO_JOURNALS, summarize_text),
+        "overall_mood": overall_mood(sentiment_score, chats),
+        "sentiment_score": sentiment_score,
+        "chat_count": len(chats),
+        "journal_count": len(journals),
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+
+
+def pending_days(username: str, watermark: Optional[str]) -> Dict[str, str]:
+    """
+    Find the days with records newer than the watermark
+    :param username: the user
+    :param watermark: ISO timestamp of the newest summarized record (None: everything is new)
+    :return: dict mapping each pending day (YYYY-MM-DD) to its newest new record timestamp
+    """
+    after = parse_timestamp(watermark) if watermark else None
+    days: Dict[str, str] = {}
+    for collection_name in ("conversation", "journal"):
+        for timestamp in get_record_timestamps(collection_name, username, after):
+            day = timestamp[:10]
+            if timestamp > days.get(day, ""):
+                days[day] = timestamp
+    return dict(sorted(days.items()))
+
+
+def summarize_user(username: str, rebuild: bool = False, dry_run: bool = False,
+                   summarize_text: Callable[[str], str] = summarize,
+                   score_texts: Callable[[List[str]], List[float]] = analyze_sentiment_batch) -> Dict[str, Any]:
+    """
+    Rebuild the summaries of a user's days with new records and move the watermark
+    :param username: the user
+    :param rebuild: ignore the watermark and rebuild every day
+    :param dry_run: only report the pending days
+    :param summarize_text: function summarizing a text
+    :param score_texts: function scoring texts that were stored without a sentiment score
+    :return: report with the pending, summarized and failed days
+    """
+    watermark = None if rebuild else get_summary_watermark(username)
+    # The new watermark comes from this scan: records added while the days are rebuilt are newer
+    # and get picked up by the next run
+    days = pending_days(username, watermark)
+    report = {"username": username, "watermark": watermark, "pending": list(days), "summarized": [], "failed": None}
+    if dry_run or not days:
+        return report
+
+    new_watermark = watermark
+    for day, newest in days.items():
+        try:
+            chats = get_chats_by_date(day, username=username)
+            journals = get_journals_by_date(day, username=username)
+            upsert_daily_summary(build_daily_summary(username, day, chats, journals, summarize_text, score_texts))
+        except Exception as e:
+            # Later days wait until this one succeeds, so the watermark never skips it
+            logging.error(f"Daily summary of {username} on {day} failed: {e}")
+            report["failed"] = day
+            break
+        report["summarized"].append(day)
+        new_watermark = max(newest, new_watermark or "")
+
+    if new_watermark and new_watermark != watermark:
+        set_summary_watermark(username, new_watermark)
+    report["watermark"] = new_watermark
+    return report
+
+
+def run_pipeline(usernames: Optional[List[str]] = None, rebuild: bool = False,
+                 dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Run the daily summary pipeline
+    :param usernames: users to process (default: every user with records)
+    :param rebuild: ignore the watermarks and rebuild every day
+    :param dry_run: only report the pending days
+    :return: report with per-user results and totals
+    """
+    start_time = time.perf_counter()
+    users = [summarize_user(username, rebuild, dry_run) for username in (usernames or get_usernames_with_records())]
+    return {
+        "users": users,
+        "pending_days": sum(len(user["pending"]) for user in users),
+        "summarized_days": sum(len(user["summarized"]) for user in users),
+        "failed_users": [user["username"] for user in users if user["failed"]],
+        "seconds": round(time.perf_counter() - start_time, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build per-user daily summaries of days with new records")
+    parser.add_argument("--user", action="append", dest="users", help="user to process (repeatable, default: all)")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the watermarks and rebuild every day")
+    parser.add_argument("--dry-run", action="store_true", help="only list the pending days")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    report = run_pipeline(args.users, rebuild=args.rebuild, dry_run=args.dry_run)
+    for user in report["users"]:
+        failed = f", failed on {user['failed']}" if user["failed"] else ""
+        print(f"{user['username']}: {len(user['pending'])} pending days, "
+              f"{len(user['summarized'])} summarized{failed} (watermark {user['watermark']})")
+    print(f"{report['summarized_days']}/{report['pending_days']} days summarized in {report['seconds']}s")
+    return 1 if report["failed_users"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,235 @@
 """
 Direct Gemini API Handler
 A fallback implementation that directly calls Google's Gemini API without LangChain dependencies
+
+All calls share pooled keep-alive HTTP clients (one sync, one async per event loop), so
+only the first call pays for the TCP and TLS handshakes. HTTP/2 is used when the h2
+package is installed.
+
+When the primary LLM provider is not Gemini and has a text client of its own (e.g. the fake
+provider, see llm_providers.py), that client serves these calls instead of the Gemini API.
 """
+import asyncio
+from contextlib import contextmanager
 import os
 import json
-import requests
+import threading
+import httpx
 from dotenv import load_dotenv
 import logging
-from typing import Optional
+from typing import Optional, AsyncIterator
+from llm_errors import (classify_error, error_for_status, parse_retry_after, DeadlineExceededError,
+                        ProviderNeutralError, RATE_LIMITED, TIMEOUT, CIRCUIT_OPEN)
+from llm_retry import call_with_retries, acall_with_retries
+from llm_providers import get_primary_provider
+from request_deadline import time_remaining, deadline_exceeded
+
+# HTTP/2 support for httpx (optional): pip install "httpx[http2]"
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Load environment variables once, not per call
+load_dotenv()
+
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_MODEL = "gemini-1.5-flash"
+
+# Connection pool of the shared clients
+GEMINI_HTTP_MAX_CONNECTIONS = int(os.getenv("GEMINI_HTTP_MAX_CONNECTIONS", "100"))
+GEMINI_HTTP_MAX_KEEPALIVE = int(os.getenv("GEMINI_HTTP_MAX_KEEPALIVE", "20"))
+GEMINI_HTTP_KEEPALIVE_SECONDS = float(os.getenv("GEMINI_HTTP_KEEPALIVE_SECONDS", "60"))
+GEMINI_TIMEOUT = httpx.Timeout(45, connect=10)
+
+FALLBACK_RESPONSE = "I understand you're reaching out, and I'm here for you. Sometimes I have trouble connecting to my systems, but I want you to know that your feelings and thoughts matter. Can you tell me more about what's on your mind?"
+NO_API_KEY_RESPONSE = "I'm here to listen and support you. How can I help you today?"
+
+_client_lock = threading.Lock()
+_http_client: Optional[httpx.Client] = None
+# Async clients are bound to the event loop they were created on
+_async_http_clients = {}
+
+
+def _client_options() -> dict:
+    return {
+        "http2": HTTP2_AVAILABLE,
+        "timeout": GEMINI_TIMEOUT,
+        "limits": httpx.Limits(max_connections=GEMINI_HTTP_MAX_CONNECTIONS,
+                               max_keepalive_connections=GEMINI_HTTP_MAX_KEEPALIVE,
+                               keepalive_expiry=GEMINI_HTTP_KEEPALIVE_SECONDS),
+        "headers": {"Content-Type": "application/json"}
+    }
+
+
+def get_gemini_http_client() -> httpx.Client:
+    """Get the shared, pooled sync HTTP client"""
+    global _http_client
+    if _http_client is None:
+        with _client_lock:
+            if _http_client is None:
+                _http_client = httpx.Client(**_client_options())
+    return _http_client
+
+
+def get_gemini_async_http_client() -> httpx.AsyncClient:
+    """Get the shared, pooled async HTTP client of the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(**_client_options())
+        _async_http_clients[loop] = client
+    return client
+
+
+async def close_gemini_http_clients():
+    """Close the shared clients (call on shutdown)"""
+    global _http_client
+    client = _async_http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+    with _client_lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+
+
+def _get_api_key(api_key: Optional[str] = None) -> Optional[str]:
+    return api_key or os.getenv("GOOGLE_API_KEY")
+
+
+def _generate_url(api_key: str, stream: bool = False) -> str:
+    if stream:
+        return f"{GEMINI_API_BASE}/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse&key={api_key}"
+    return f"{GEMINI_API_BASE}/models/{GEMINI_MODEL}:generateContent?key={api_key}"
+
+# Create the system prompt for therapy context
+SYSTEM_CONTEXT = """You are a compassionate therapist and mental health companion. You are calm, gentle, understanding and empathetic. Your role is to listen, validate feelings, and provide emotional support. Don't give direct solutions - instead, help users explore their thoughts and feelings. Be patient and natural in conversation. Keep responses warm and supportive."""
+
+def build_gemini_payload(prompt: str) -> dict:
+    """
+    Build the generateContent request body for a user message
+    :param prompt: User's message
+    :return: the request payload
+    """
+    return {
+        "contents": [
+            {
+                "parts": [
+                    {
+                        "text": f"{SYSTEM_CONTEXT}\n\nUser: {prompt}\n\nResponse:"
+                    }
+                ]
+            }
+        ],
+        "generationConfig": {
+            "temperature": 0.8,
+            "topK": 40,
+            "topP": 0.95,
+            "maxOutputTokens": 2048,
+            "stopSequences": []
+        },
+        "safetySettings": [
+            {
+                "category": "HARM_CATEGORY_HARASSMENT",
+                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+            },
+            {
+                "category": "HARM_CATEGORY_HATE_SPEECH",
+                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+            },
+            {
+                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+            },
+            {
+                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+            }
+        ]
+    }
+
+def estimate_tokens(prompt: str) -> int:
+    """Rough prompt size in tokens (about 4 characters per token), charged to the rate limiter"""
+    return (len(SYSTEM_CONTEXT) + len(prompt)) // 4
+
+def _read_gemini_response(response: httpx.Response) -> Optional[str]:
+    """
+    Get the generated text of a generateContent response
+    :return: the response text, or None if there is none
+    :raises LLMError: the classified error of a failed response (rate limited, auth, not found, 5xx...)
+    """
+    if response.status_code != 200:
+        raise error_for_status(response.status_code, response.text, provider="gemini",
+                               retry_after=parse_retry_after(response.headers.get("retry-after")))
+
+    result = response.json()
+    logging.info("Gemini API call successful")
+    response_text = extract_text(result).strip()
+    if response_text:
+        return response_text
+
+    # e.g. the candidate was blocked by the safety settings
+    logging.warning(f"Unexpected Gemini response format: {result}")
+    return None
+
+def get_direct_provider():
+    """
+    Get the provider that serves the direct calls
+    :return: tuple (provider name, text client of a non-Gemini primary provider or None for the Gemini API)
+    """
+    provider = get_primary_provider()
+    text_client = provider.get_text_client() if provider.name != "gemini" else None
+    if text_client is None:
+        return "gemini", None
+    return provider.name, text_client
+
+def _log_request_error(error: Exception, provider: str = "gemini"):
+    error = classify_error(error, provider)
+    name = provider.capitalize()
+    if error.error_class == RATE_LIMITED:
+        logging.error(f"{name} API rate limit exceeded")
+    elif error.error_class == TIMEOUT:
+        logging.error(f"{name} API request timed out")
+    elif error.error_class == CIRCUIT_OPEN:
+        logging.error(f"{name} circuit breaker is open, skipping the direct call")
+    else:
+        logging.error(f"{name} API {error.error_class} error: {error}")
+
+def _request_timeout() -> httpx.Timeout:
+    """GEMINI_TIMEOUT, shortened to the time left before the request's deadline"""
+    remaining = time_remaining()
+    if remaining is None:
+        return GEMINI_TIMEOUT
+    remaining = max(remaining, 0.01)
+    return httpx.Timeout(min(GEMINI_TIMEOUT.read, remaining), connect=min(GEMINI_TIMEOUT.connect, remaining))
+
+@contextmanager
+def _deadline_timeouts():
+    """
+    Report an HTTP timeout that fired at the request's deadline as a deadline cut-off, so the
+    circuit breaker and the limiter don't count it as a provider timeout
+    """
+    try:
+        yield
+    except httpx.TimeoutException as e:
+        if deadline_exceeded():
+            raise DeadlineExceededError("Gemini call cut off at the request deadline", provider="gemini") from e
+        raise
+
+def _generate(api_key: str, prompt: str) -> Optional[str]:
+    with _deadline_timeouts():
+        response = get_gemini_http_client().post(_generate_url(api_key), json=build_gemini_payload(prompt),
+                                                 timeout=_request_timeout())
+    return _read_gemini_response(response)
+
+async def _agenerate(api_key: str, prompt: str) -> Optional[str]:
+    with _deadline_timeouts():
+        response = await get_gemini_async_http_client().post(_generate_url(api_key),
+                                                             json=build_gemini_payload(prompt),
+                                                             timeout=_request_timeout())
+    return _read_gemini_response(response)
 
 def get_direct_gemini_response(prompt: str, api_key: Optional[str] = None) -> str:
     """
@@ -16,105 +238,140 @@ def get_direct_gemini_response(prompt: str, api_key: Optional[str] = None) -> st
     :param api_key: Optional API key, will load from env if not provided
     :return: Response from Gemini
     """
+    provider, text_client = get_direct_provider()
+    if text_client is not None:
+        try:
+            response_text = call_with_retries(provider, text_client.complete, prompt,
+                                              estimated_tokens=estimate_tokens(prompt))
+            if response_text:
+                return response_text
+        except Exception as e:
+            _log_request_error(e, provider)
+        return FALLBACK_RESPONSE
+
+    api_key = _get_api_key(api_key)
+    if not api_key:
+        logging.error("GOOGLE_API_KEY not found in environment variables")
+        return NO_API_KEY_RESPONSE
+    
     try:
-        # Load environment variables if no API key provided
-        if not api_key:
-            load_dotenv()
-            api_key = os.getenv("GOOGLE_API_KEY")
-        
-        if not api_key:
-            logging.error("GOOGLE_API_KEY not found in environment variables")
-            return "I'm here to listen and support you. How can I help you today?"
-        
-        # Use the latest Gemini model endpoint
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={api_key}"
-        
-        # Create the system prompt for therapy context
-        system_context = """You are a compassionate therapist and mental health companion. You are calm, gentle, understanding and empathetic. Your role is to listen, validate feelings, and provide emotional support. Don't give direct solutions - instead, help users explore their thoughts and feelings. Be patient and natural in conversation. Keep responses warm and supportive."""
-        
-        # Prepare the request payload
-        payload = {
-            "contents": [
-                {
-                    "parts": [
-                        {
-                            "text": f"{system_context}\n\nUser: {prompt}\n\nResponse:"
-                        }
-                    ]
-                }
-            ],
-            "generationConfig": {
-                "temperature": 0.8,
-                "topK": 40,
-                "topP": 0.95,
-                "maxOutputTokens": 2048,
-                "stopSequences": []
-            },
-            "safetySettings": [
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_HATE_SPEECH",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                },
-                {
-                    "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                }
-            ]
-        }
-        
-        headers = {
-            "Content-Type": "application/json"
-        }
-        
-        # Make the API call with proper timeout
+        # Make the API call on the shared keep-alive connection pool, retried per error class
         logging.info("Making direct Gemini API call...")
-        response = requests.post(url, json=payload, headers=headers, timeout=45)
-        
-        if response.status_code == 200:
-            result = response.json()
-            logging.info("Gemini API call successful")
-            
-            if "candidates" in result and len(result["candidates"]) > 0:
-                candidate = result["candidates"][0]
-                if "content" in candidate and "parts" in candidate["content"]:
-                    parts = candidate["content"]["parts"]
-                    if len(parts) > 0 and "text" in parts[0]:
-                        response_text = parts[0]["text"].strip()
-                        if response_text:
-                            return response_text
-            
-            # If we reach here, try to extract any available text
-            logging.warning(f"Unexpected Gemini response format: {result}")
-            
-        # Handle specific API errors
-        elif response.status_code == 400:
-            logging.error(f"Bad request to Gemini API: {response.text}")
-        elif response.status_code == 429:
-            logging.error("Gemini API rate limit exceeded")
-        else:
-            logging.error(f"Gemini API error {response.status_code}: {response.text}")
-            
-    except requests.exceptions.Timeout:
-        logging.error("Gemini API request timed out")
-    except requests.exceptions.ConnectionError:
-        logging.error("Failed to connect to Gemini API")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Gemini API request error: {e}")
-    except json.JSONDecodeError:
-        logging.error("Failed to parse Gemini API response")
+        response_text = call_with_retries("gemini", _generate, api_key, prompt,
+                                          estimated_tokens=estimate_tokens(prompt))
+        if response_text:
+            return response_text
     except Exception as e:
-        logging.error(f"Unexpected error in direct Gemini call: {e}")
+        _log_request_error(e)
     
     # Return a thoughtful fallback response
-    return "I understand you're reaching out, and I'm here for you. Sometimes I have trouble connecting to my systems, but I want you to know that your feelings and thoughts matter. Can you tell me more about what's on your mind?"
+    return FALLBACK_RESPONSE
+
+async def get_direct_gemini_response_async(prompt: str, api_key: Optional[str] = None) -> str:
+    """
+    Async version of get_direct_gemini_response (does not block the event loop)
+    :param prompt: User's message
+    :param api_key: Optional API key, will load from env if not provided
+    :return: Response from Gemini
+    """
+    provider, text_client = get_direct_provider()
+    if text_client is not None:
+        try:
+            response_text = await acall_with_retries(provider, text_client.acomplete, prompt,
+                                                     estimated_tokens=estimate_tokens(prompt))
+            if response_text:
+                return response_text
+        except Exception as e:
+            _log_request_error(e, provider)
+        return FALLBACK_RESPONSE
+
+    api_key = _get_api_key(api_key)
+    if not api_key:
+        logging.error("GOOGLE_API_KEY not found in environment variables")
+        return NO_API_KEY_RESPONSE
+
+    try:
+        logging.info("Making direct Gemini API call (async)...")
+        response_text = await acall_with_retries("gemini", _agenerate, api_key, prompt,
+                                                       estimated_tokens=estimate_tokens(prompt))
+        if response_text:
+            return response_text
+    except Exception as e:
+        _log_request_error(e)
+
+    # Return a thoughtful fallback response
+    return FALLBACK_RESPONSE
+
+class GeminiStreamError(ProviderNeutralError):
+    """
+    Raised when there is no Gemini API key or the stream returns no text (e.g. a blocked prompt).
+    Neither is a provider outage, so the stream's circuit breaker and limiter don't count it.
+    """
+
+
+def extract_text(result: dict) -> str:
+    """
+    Get the generated text of one Gemini response (or stream chunk)
+    :param result: parsed generateContent response
+    :return: the text of the first candidate, or an empty string
+    """
+    candidates = result.get("candidates") or []
+    if not candidates:
+        return ""
+    parts = candidates[0].get("content", {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
+
+
+async def stream_direct_gemini_response(prompt: str, api_key: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Stream a response from Google's Gemini API (streamGenerateContent with server-sent events)
+    Unlike get_direct_gemini_response this raises instead of returning a canned reply, so the
+    caller can fall back to another provider (a classified LLMError if the API answers with an
+    error status, GeminiStreamError if there is no key or no text). Callers consume it through
+    llm_handler.astream_with_breaker, which holds a limiter permit for the whole stream.
+    :param prompt: User's message
+    :param api_key: Optional API key, will load from env if not provided
+    :return: async iterator of text chunks as Gemini generates them
+    """
+    provider, text_client = get_direct_provider()
+    if text_client is not None:
+        async for text in text_client.astream(prompt):
+            yield text
+        return
+
+    api_key = _get_api_key(api_key)
+    if not api_key:
+        raise GeminiStreamError("GOOGLE_API_KEY not found in environment variables")
+
+    logging.info("Making direct Gemini streaming API call...")
+    client = get_gemini_async_http_client()
+    # The connect and each read (the first one is the time to first byte) wait at most the time
+    # left before the deadline when the stream starts
+    with _deadline_timeouts():
+        async with client.stream("POST", _generate_url(api_key, stream=True), json=build_gemini_payload(prompt),
+                                 timeout=_request_timeout()) as response:
+            if response.status_code != 200:
+                body = (await response.aread()).decode("utf-8", errors="replace")
+                raise error_for_status(response.status_code, body, provider="gemini",
+                                       retry_after=parse_retry_after(response.headers.get("retry-after")))
+
+            received_text = False
+            async for line in response.aiter_lines():
+                # Each server-sent event is a "data: {json}" line
+                if not line.startswith("data:"):
+                    continue
+                try:
+                    text = extract_text(json.loads(line[len("data:"):].strip()))
+                except json.JSONDecodeError:
+                    logging.warning(f"Skipping unparsable Gemini stream line: {line[:200]}")
+                    continue
+                if text:
+                    received_text = True
+                    yield text
+
+            if not received_text:
+                raise GeminiStreamError("Gemini stream ended without any text")
+
 
 def test_direct_gemini():
     """Test function to verify direct Gemini API works"""
@@ -0,0 +1,223 @@
+"""
+Deterministic in-process fake LLM
+Answers like a chat model without any network: each call waits for a time to first token
+drawn from a log-normal distribution, then "decodes" its output at a fixed token rate, and
+fails with a configurable error class at a configurable rate. The draws of a call are seeded
+by the prompt and how often that prompt was seen, so a run gives the same latencies, errors
+and texts for the same prompts whatever the request interleaving is.
+
+FakeChatModel wraps it as a LangChain chat model, so the fake runs through the same chains,
+retries, circuit breakers and limiters as the real providers (see llm_providers.py).
+"""
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import asyncio
+import hashlib
+import math
+import random
+import threading
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from llm_errors import error_for_status, TRANSIENT, RATE_LIMITED, TIMEOUT, AUTH, NOT_FOUND, BAD_REQUEST
+
+# HTTP status the fake "answers" for each error class it can raise
+ERROR_STATUS = {
+    RATE_LIMITED: 429,
+    TRANSIENT: 503,
+    TIMEOUT: 504,
+    AUTH: 401,
+    NOT_FOUND: 404,
+    BAD_REQUEST: 400
+}
+
+RESPONSE_SENTENCES = [
+    "It sounds like you have been carrying a lot lately.",
+    "That must feel heavy, and it makes sense that you feel this way.",
+    "Thank you for sharing this with me.",
+    "What do you notice in yourself when that happens?",
+    "It is okay to take things one step at a time.",
+    "You don't have to have everything figured out right now.",
+    "How have you been taking care of yourself this week?",
+    "I'm here with you, and we can explore this together."
+]
+
+# Words sent per streamed chunk (real APIs stream a few tokens at a time)
+STREAM_CHUNK_WORDS = 4
+
+
+class FakeCall:
+    """The draws of one call: latency, output and error"""
+    __slots__ = ("first_token_seconds", "words", "error")
+
+    def __init__(self, first_token_seconds: float, words: List[str], error: Optional[Exception]):
+        self.first_token_seconds = first_token_seconds
+        self.words = words
+        self.error = error
+
+
+class FakeLLM:
+    """
+    Deterministic fake LLM with a latency distribution, token rate and error rate
+    """
+
+    def __init__(self, name: str = "fake", latency_ms: float = 800, latency_sigma: float = 0.3,
+                 tokens_per_second: float = 50, output_tokens: int = 120, error_rate: float = 0.0,
+                 error_class: str = TRANSIENT, seed: int = 42):
+        """
+        :param name: provider name recorded on raised errors
+        :param latency_ms: median time to first token in milliseconds
+        :param latency_sigma: sigma of the log-normal time to first token (0 for a fixed latency)
+        :param tokens_per_second: output decode rate (0 for instant output)
+        :param output_tokens: output length (one word per token)
+        :param error_rate: share of calls that fail, between 0 and 1
+        :param error_class: error class of failed calls (rate_limited, transient, timeout, auth, ...)
+        :param seed: seed of the draws
+        """
+        if error_class not in ERROR_STATUS:
+            raise ValueError(f"Unsupported fake error class: {error_class}")
+        self.name = name
+        self.latency_seconds = latency_ms / 1000
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.error_class = error_class
+        self.seed = seed
+
+        self._lock = threading.Lock()
+        self._prompt_calls: Dict[str, int] = {}
+        self._calls = 0
+        self._errors = 0
+        self._output_tokens = 0
+
+    def _draw(self, prompt: str) -> FakeCall:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            occurrence = self._prompt_calls.get(prompt_hash, 0)
+            self._prompt_calls[prompt_hash] = occurrence + 1
+            self._calls += 1
+        rng = random.Random(f"{self.seed}:{prompt_hash}:{occurrence}")
+
+        first_token_seconds = self.latency_seconds * math.exp(rng.gauss(0, self.latency_sigma))
+        if rng.random() < self.error_rate:
+            with self._lock:
+                self._errors += 1
+            error = error_for_status(ERROR_STATUS[self.error_class], f"fake {self.error_class} error",
+                                     provider=self.name)
+            return FakeCall(first_token_seconds, [], error)
+
+        words = []
+        while len(words) < self.output_tokens:
+            words.extend(rng.choice(RESPONSE_SENTENCES).split())
+        with self._lock:
+            self._output_tokens += self.output_tokens
+        return FakeCall(first_token_seconds, words[:self.output_tokens], None)
+
+    def _decode_seconds(self, words: int) -> float:
+        return words / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _chunks(self, words: List[str]) -> List[str]:
+        return [" ".join(words[start:start + STREAM_CHUNK_WORDS]) + " "
+                for start in range(0, len(words), STREAM_CHUNK_WORDS)]
+
+    def complete(self, prompt: str) -> str:
+        """
+        Answer a prompt (blocking)
+        :raises LLMError: the configured error, at the configured rate
+        """
+        call = self._draw(prompt)
+        time.sleep(call.first_token_seconds)
+        if call.error is not None:
+            raise call.error
+        time.sleep(self._decode_seconds(len(call.words)))
+        return " ".join(call.words)
+
+    async def acomplete(self, prompt: str) -> str:
+        """Answer a prompt without blocking the event loop"""
+        call = self._draw(prompt)
+        await asyncio.sleep(call.first_token_seconds)
+        if call.error is not None:
+            raise call.error
+        await asyncio.sleep(self._decode_seconds(len(call.words)))
+        return " ".join(call.words)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """Stream the answer in chunks of a few words at the token rate (blocking)"""
+        call = self._draw(prompt)
+        time.sleep(call.first_token_seconds)
+        if call.error is not None:
+            raise call.error
+        for chunk in self._chunks(call.words):
+            yield chunk
+            time.sleep(self._decode_seconds(STREAM_CHUNK_WORDS))
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Stream the answer in chunks of a few words at the token rate"""
+        call = self._draw(prompt)
+        await asyncio.sleep(call.first_token_seconds)
+        if call.error is not None:
+            raise call.error
+        for chunk in self._chunks(call.words):
+            yield chunk
+            await asyncio.sleep(self._decode_seconds(STREAM_CHUNK_WORDS))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get the fake's configuration and counters
+        :return: dictionary with the configured distribution, calls, errors and output tokens
+        """
+        with self._lock:
+            return {
+                "name": self.name,
+                "latency_ms": round(self.latency_seconds * 1000, 1),
+                "latency_sigma": self.latency_sigma,
+                "tokens_per_second": self.tokens_per_second,
+                "output_tokens": self.output_tokens,
+                "error_rate": self.error_rate,
+                "error_class": self.error_class,
+                "calls": self._calls,
+                "errors": self._errors,
+                "output_tokens_total": self._output_tokens
+            }
+
+
+def _prompt_of(messages: List[BaseMessage]) -> str:
+    return "\n".join(str(message.content) for message in messages)
+
+
+class FakeChatModel(BaseChatModel):
+    """LangChain chat model answered by a FakeLLM"""
+    fake: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        text = self.fake.complete(_prompt_of(messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        text = await self.fake.acomplete(_prompt_of(messages))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for text in self.fake.stream(_prompt_of(messages)):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+            if run_manager:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        async for text in self.fake.astream(_prompt_of(messages)):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+            if run_manager:
+                await run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
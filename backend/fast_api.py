@@ -1,12 +1,35 @@
 from fastapi import FastAPI, Query, HTTPException, Header, Depends
 from pydantic import BaseModel
-from llm_handler import get_results, initialize_gemini_llm, initialize_openai_llm
-from direct_gemini_handler import get_direct_gemini_response
+from llm_handler import (get_results_async, stream_results_async, astream_with_breaker, get_summary_stats,
+                         CHAT_STAGE_TIMEOUTS,
+                         initialize_gemini_llm, initialize_openai_llm,
+                         analyze_message_async, sentiment_batcher, sentiment_executor,
+                         sentiment_cache, SENTIMENT_MODE, analysis_batcher, analysis_cache,
+                         TEXT_ANALYSIS_ENABLED)
+from sentiment_model_registry import warmup_sentiment_model, get_sentiment_model_status
+from sentiment_batcher import BatcherOverloadedError
+from sentiment_lexicon import get_tier_stats
+from text_analysis import warmup_text_analysis, get_text_analysis_status
+from llm_client_registry import ensure_llm_config_loaded, get_llm_registry_stats
+from circuit_breaker import get_circuit_breaker_states
+from llm_hedging import get_hedging_stats
+from chat_context import get_context_stats
+from semantic_cache import get_semantic_cache_stats
+from llm_retry import get_retry_stats
+from llm_rate_limiter import get_llm_limiter_states
+from direct_gemini_handler import (get_direct_gemini_response_async, stream_direct_gemini_response,
+                                   close_gemini_http_clients, get_direct_provider, estimate_tokens)
+from llm_providers import get_llm_provider_stats
+from request_deadline import RequestDeadlineMiddleware, get_deadline_stats, stage_timeout, record_skipped_stage
 from mongodb_database_handler import get_chats_by_date, save_journal_entry, get_journals_by_date, get_journals_by_username
 from auth_handler import register_user, login_user, validate_session, logout_user, get_user_info
 from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import logging
+import asyncio
+import json
 import os
 
 # Initialize FastAPI
@@ -19,6 +42,31 @@ app.add_middleware(
     allow_methods=["*"],  # Allow all methods (GET, POST, PUT, DELETE, etc.)
     allow_headers=["*"],  # Allow all headers
 )
+# One deadline per request, seen by every stage of the chat pipeline (see request_deadline)
+app.add_middleware(RequestDeadlineMiddleware)
+
+@app.on_event("startup")
+async def warmup_models():
+    """
+    Load and warm up the shared sentiment model (and the analysis heads) once per worker
+    before serving traffic
+    """
+    ready = await run_in_threadpool(warmup_sentiment_model)
+    if not ready:
+        logging.warning("Sentiment model is not ready - it will be loaded on first use")
+    elif TEXT_ANALYSIS_ENABLED:
+        await run_in_threadpool(warmup_text_analysis)
+
+@app.on_event("shutdown")
+async def stop_batchers():
+    """
+    Stop the sentiment and analysis micro-batchers and their inference pool,
+    and close the pooled Gemini HTTP clients
+    """
+    await sentiment_batcher.close()
+    await analysis_batcher.close()
+    sentiment_executor.shutdown(wait=False)
+    await close_gemini_http_clients()
 
 # Define the request body
 class Prompt(BaseModel):
@@ -72,10 +120,33 @@ def get_current_user(authorization: Optional[str] = Header(None)):
     return None
 
 
+async def analyze_for_storage(text: str):
+    """
+    Score a message (sentiment, emotions, risk) without blocking the event loop.
+    If the sentiment pool is overloaded or fails, or the request's deadline leaves no time for it,
+    the chat is still saved without a score.
+    :return: tuple (sentiment score or None, structured analysis or None)
+    """
+    timeout = stage_timeout(CHAT_STAGE_TIMEOUTS["sentiment"])
+    if timeout <= 0:
+        record_skipped_stage("storage_sentiment")
+        return None, None
+    try:
+        return await asyncio.wait_for(analyze_message_async(text), timeout=timeout)
+    except asyncio.TimeoutError:
+        logging.warning(f"Sentiment scoring skipped, no result within {timeout:.2f}s")
+    except BatcherOverloadedError as e:
+        logging.warning(f"Sentiment scoring skipped, pool is overloaded: {e}")
+    except Exception as e:
+        logging.warning(f"Sentiment scoring failed: {e}")
+    return None, None
+
+
 @app.post("/chat/")
 async def chat(prompt: Prompt, current_user: Optional[str] = Depends(get_current_user)):
     """
-    Direct Gemini API chat - prioritizes direct API calls for reliable responses
+    Direct Gemini API chat - prioritizes direct API calls for reliable responses.
+    Both the direct call and the LLM handler fallback run without blocking the event loop.
     :param prompt: User's message prompt
     :param current_user: Current logged-in user (optional)
     :return: Direct response from Gemini API
@@ -88,7 +159,7 @@ async def chat(prompt: Prompt, current_user: Optional[str] = Depends(get_current
     try:
         # Try direct Gemini API first (most reliable)
         logging.info("Using direct Gemini API...")
-        response = get_direct_gemini_response(prompt.prompt)
+        response = await get_direct_gemini_response_async(prompt.prompt)
         
         if response and response.strip():
             logging.info("Direct Gemini API successful")
@@ -96,9 +167,9 @@ async def chat(prompt: Prompt, current_user: Optional[str] = Depends(get_current
             # Save conversation with user context
             try:
                 from mongodb_database_handler import upload_chat_in_conversation
-                from llm_handler import analyze_sentiment
-                sentiment_score = analyze_sentiment(prompt.prompt)
-                upload_chat_in_conversation(prompt.prompt, sentiment_score, response, current_user)
+                sentiment_score, analysis = await analyze_for_storage(prompt.prompt)
+                await run_in_threadpool(upload_chat_in_conversation, prompt.prompt, sentiment_score,
+                                        response, current_user, analysis=analysis)
             except Exception as save_error:
                 logging.warning(f"Failed to save conversation: {save_error}")
             
@@ -110,7 +181,8 @@ async def chat(prompt: Prompt, current_user: Optional[str] = Depends(get_current
         # Fallback to LLM handler only if direct API fails
         try:
             logging.info("Trying LLM handler as fallback...")
-            response = get_results(prompt.prompt, username=current_user)
+            # Async LLM handler: context fetched concurrently, LLM called with ainvoke
+            response = await get_results_async(prompt.prompt, username=current_user)
             if response and response.strip():
                 logging.info("LLM handler fallback successful")
                 return {"response": response}
@@ -121,6 +193,92 @@ async def chat(prompt: Prompt, current_user: Optional[str] = Depends(get_current
     return {"response": "I'm here to help you. Could you please rephrase your question?"}
 
 
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format one server-sent event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat/stream/")
+async def chat_stream(prompt: Prompt, current_user: Optional[str] = Depends(get_current_user)):
+    """
+    Streaming chat: sends the response as server-sent events while Gemini generates it.
+    Each chunk is a {"text": ...} event; the stream ends with a "done" event naming the model
+    (or an "error" event). Uses Gemini's streaming API and falls back to the LLM handler
+    (LangChain astream, Gemini then OpenAI) if Gemini fails before sending any text.
+    The full response is saved once the stream completes; a response cut short by a client
+    disconnect is not saved.
+    :param prompt: User's message prompt
+    :param current_user: Current logged-in user (optional)
+    :return: text/event-stream response
+    """
+    if not prompt.prompt.strip():
+        raise HTTPException(status_code=400, detail="Prompt cannot be empty")
+
+    logging.info(f"Streaming chat request from user '{current_user}': {prompt.prompt[:50]}...")
+
+    async def save_streamed_chat(analysis_task, response):
+        try:
+            from mongodb_database_handler import upload_chat_in_conversation
+            sentiment_score, analysis = await analysis_task
+            await run_in_threadpool(upload_chat_in_conversation, prompt.prompt, sentiment_score,
+                                    response, current_user, analysis=analysis)
+        except Exception as save_error:
+            logging.warning(f"Failed to save streamed conversation: {save_error}")
+
+    async def event_stream():
+        # Score the message while Gemini is generating
+        analysis_task = asyncio.create_task(analyze_for_storage(prompt.prompt))
+        chunks = []
+        direct_provider, _ = get_direct_provider()
+        direct_stream = astream_with_breaker(direct_provider, stream_direct_gemini_response(prompt.prompt),
+                                             estimated_tokens=estimate_tokens(prompt.prompt))
+        fallback_stream = None
+        saving = False
+        # If the client disconnects mid-stream (GeneratorExit or cancellation at a yield), the finally
+        # block stops the analysis and closes the streams, which frees their limiter permits and
+        # breaker slots. The partial response is not saved: the user never saw a complete answer.
+        try:
+            try:
+                async for text in direct_stream:
+                    chunks.append(text)
+                    yield sse_event({"text": text})
+            except Exception as direct_error:
+                if chunks:
+                    logging.error(f"Direct Gemini stream broke off: {direct_error}")
+                    yield sse_event({"error": "The response was interrupted"}, event="error")
+                    return
+                logging.warning(f"Direct Gemini stream failed, using LLM handler: {direct_error}")
+            else:
+                # Shielded so the chat is still saved if the client disconnects now
+                saving = True
+                await asyncio.shield(asyncio.ensure_future(save_streamed_chat(analysis_task, "".join(chunks))))
+                yield sse_event({"model": f"{direct_provider}_direct"}, event="done")
+                return
+
+            # Fallback: the LLM handler scores and saves the chat itself
+            analysis_task.cancel()
+            fallback_stream = stream_results_async(prompt.prompt, username=current_user)
+            try:
+                async for text in fallback_stream:
+                    yield sse_event({"text": text})
+                yield sse_event({"model": "llm_handler"}, event="done")
+            except Exception as llm_error:
+                logging.error(f"LLM handler stream also failed: {llm_error}")
+                yield sse_event({"error": "I'm here to help you. Could you please rephrase your question?"},
+                                event="error")
+        finally:
+            # The shielded save still needs the analysis
+            if not saving:
+                analysis_task.cancel()
+            await direct_stream.aclose()
+            if fallback_stream is not None:
+                await fallback_stream.aclose()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.get("/receive_hello/")
 async def root():
     """
@@ -136,8 +294,7 @@ async def get_llm_status():
     Check the status of available LLM models (Gemini and OpenAI)
     :return: status of LLM models
     """
-    from dotenv import load_dotenv
-    load_dotenv()
+    ensure_llm_config_loaded()
     
     status = {
         "gemini": {
@@ -205,6 +362,39 @@ async def get_llm_status():
             "primary_llm": primary_llm,
             "fallback_llm": fallback_llm,
             "fallback_enabled": fallback_llm != "none"
+        },
+        "providers": get_llm_provider_stats(),
+        "registry": get_llm_registry_stats(),
+        "circuit_breakers": get_circuit_breaker_states(),
+        "hedging": get_hedging_stats(),
+        "context": get_context_stats(),
+        "semantic_cache": get_semantic_cache_stats(),
+        "retries": get_retry_stats(),
+        "limiters": get_llm_limiter_states(),
+        "summaries": get_summary_stats(),
+        "deadlines": get_deadline_stats()
+    }
+
+
+@app.get("/sentiment-status/")
+async def get_sentiment_status():
+    """
+    Check whether the shared sentiment model is loaded and warmed up
+    :return: readiness, load timings, batching, cache and tiering metrics of the sentiment model
+    """
+    status = get_sentiment_model_status()
+    return {
+        "ready": status["state"] == "ready",
+        "status": status,
+        "batching": sentiment_batcher.get_metrics(),
+        "cache": sentiment_cache.get_stats(),
+        "mode": SENTIMENT_MODE,
+        "tiers": get_tier_stats(),
+        "analysis": {
+            "enabled": TEXT_ANALYSIS_ENABLED,
+            "status": get_text_analysis_status(),
+            "batching": analysis_batcher.get_metrics(),
+            "cache": analysis_cache.get_stats()
         }
     }
 
@@ -367,14 +557,14 @@ async def mood_chat(chat_data: MoodChat, current_user: Optional[str] = Depends(g
             enhanced_prompt = chat_data.prompt
         
         # Get AI response using direct Gemini API
-        response = get_direct_gemini_response(enhanced_prompt)
+        response = await get_direct_gemini_response_async(enhanced_prompt)
         
         # Save conversation with user context
         try:
             from mongodb_database_handler import upload_chat_in_conversation
-            from llm_handler import analyze_sentiment
-            sentiment_score = analyze_sentiment(enhanced_prompt)
-            upload_chat_in_conversation(enhanced_prompt, sentiment_score, response, current_user)
+            sentiment_score, analysis = await analyze_for_storage(enhanced_prompt)
+            await run_in_threadpool(upload_chat_in_conversation, enhanced_prompt, sentiment_score,
+                                    response, current_user, analysis=analysis)
         except Exception as save_error:
             logging.warning(f"Failed to save mood conversation: {save_error}")
         
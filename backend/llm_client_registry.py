@@ -0,0 +1,253 @@
+"""
+LLM Client Registry
+Builds the chat clients of the primary and fallback providers (Gemini and OpenAI by default, see
+llm_providers.py) and the prebuilt chains once per process and shares them between requests,
+so a chat reuses warm HTTP connections instead of creating new clients.
+
+The .env file is loaded once. Every LLM_CONFIG_CHECK_SECONDS the registry checks whether the
+file changed; if it did, it is reloaded and clients are rebuilt on their next use. Clients are
+also rebuilt when the API keys or provider settings in the environment change. Requests that are already running
+keep the clients they started with.
+"""
+from dotenv import load_dotenv, find_dotenv
+from langchain.prompts import PromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from datetime import datetime, timezone
+from typing import Dict, Any, Tuple
+import hashlib
+import os
+import time
+import logging
+import threading
+
+from llm_providers import (get_llm_provider, get_primary_provider, get_fallback_provider,
+                           get_provider_config_keys)
+
+DEFAULT_GEMINI_MODEL = "gemini-1.5-flash"
+DEFAULT_OPENAI_MODEL = "gpt-4o"
+
+# How often (seconds) the .env file is checked for changes
+LLM_CONFIG_CHECK_SECONDS = float(os.getenv("LLM_CONFIG_CHECK_SECONDS", "5"))
+
+
+_lock = threading.Lock()
+_config_state: Dict[str, Any] = {
+    "path": None,
+    "mtime": None,
+    "checked_at": 0.0,
+    "loaded_at": None,
+    "reloads": 0
+}
+# (gemini_model, openai_model, config fingerprint) -> registry entry
+_clients: Dict[Tuple, Dict[str, Any]] = {}
+# (chain name, gemini_model, openai_model, config fingerprint) -> registry entry
+_chains: Dict[Tuple, Dict[str, Any]] = {}
+_stats = {"client_builds": 0, "client_hits": 0, "chain_builds": 0, "chain_hits": 0}
+
+
+def _file_mtime(path):
+    try:
+        return os.path.getmtime(path) if path else None
+    except OSError:
+        return None
+
+
+def ensure_llm_config_loaded(force_reload=False):
+    """
+    Load the .env file once, and reload it when it changed on disk
+    :param force_reload: reload the .env file even if it did not change
+    """
+    now = time.monotonic()
+    if (not force_reload and _config_state["loaded_at"] is not None
+            and now - _config_state["checked_at"] < LLM_CONFIG_CHECK_SECONDS):
+        return
+
+    with _lock:
+        if _config_state["loaded_at"] is None:
+            _config_state["path"] = find_dotenv() or None
+            load_dotenv(_config_state["path"])
+            _config_state["mtime"] = _file_mtime(_config_state["path"])
+            _config_state["loaded_at"] = datetime.now(timezone.utc).isoformat()
+        else:
+            mtime = _file_mtime(_config_state["path"])
+            if force_reload or mtime != _config_state["mtime"]:
+                # Values from the file win over the ones loaded before, so edited keys take effect
+                load_dotenv(_config_state["path"], override=True)
+                _config_state["mtime"] = mtime
+                _config_state["loaded_at"] = datetime.now(timezone.utc).isoformat()
+                _config_state["reloads"] += 1
+                logging.info("LLM configuration changed, clients will be rebuilt")
+        _config_state["checked_at"] = now
+
+
+def _config_fingerprint():
+    """Hash of the current LLM configuration, so cached clients are dropped when a key changes"""
+    values = "\n".join(os.getenv(key) or "" for key in get_provider_config_keys())
+    return hashlib.sha256(values.encode("utf-8")).hexdigest()[:16]
+
+
+def build_gemini_client(model=DEFAULT_GEMINI_MODEL):
+    """
+    Build a Gemini chat client from the loaded configuration
+    :param model: Gemini model name (gemini-1.5-flash, gemini-1.5-pro, gemini-2.0-flash-exp)
+    :return: the Gemini LLM model object or None if failed
+    """
+    return get_llm_provider("gemini").build_chat_model(model)
+
+
+def build_openai_client(model="gpt-4o-mini"):
+    """
+    Build an OpenAI chat client from the loaded configuration
+    :param model: OpenAI model name (gpt-4o, gpt-4o-mini)
+    :return: the OpenAI LLM model object or None if failed
+    """
+    return get_llm_provider("openai").build_chat_model(model)
+
+
+def _model_for(provider, gemini_model, openai_model):
+    """Model of a provider: the requested Gemini/OpenAI model, or the provider's default"""
+    return {"gemini": gemini_model, "openai": openai_model}.get(provider.name) or provider.default_model
+
+
+def get_chat_models(gemini_model=DEFAULT_GEMINI_MODEL, openai_model=DEFAULT_OPENAI_MODEL):
+    """
+    Get the models the clients of get_llm_clients are built with
+    :param gemini_model: Gemini model name for the primary client
+    :param openai_model: OpenAI model name for the fallback client
+    :return: tuple of "provider/model" for the primary and (if any) the fallback provider
+    """
+    ensure_llm_config_loaded()
+    providers = (get_primary_provider(), get_fallback_provider())
+    return tuple(f"{provider.name}/{_model_for(provider, gemini_model, openai_model)}"
+                 for provider in providers if provider is not None)
+
+
+def _build_clients(gemini_model, openai_model):
+    """Primary and fallback providers' clients, as (primary_llm, fallback_llm, primary_type)"""
+    # Always try the primary provider first (Gemini by default)
+    primary = get_primary_provider()
+    primary_llm = primary.build_chat_model(_model_for(primary, gemini_model, openai_model))
+
+    # Only try the fallback provider if it is configured
+    fallback = get_fallback_provider()
+    fallback_llm = None
+    if fallback is not None and fallback.is_configured():
+        fallback_llm = fallback.build_chat_model(_model_for(fallback, gemini_model, openai_model))
+    elif fallback is not None:
+        logging.info(f"{fallback.name} is not configured - {primary.name} only mode")
+
+    if primary_llm is not None:
+        logging.info(f"Successfully initialized {primary.name} as primary LLM")
+        return primary_llm, fallback_llm, primary.name
+    elif fallback_llm is not None:
+        logging.warning(f"{primary.name} initialization failed, using {fallback.name} as primary")
+        return fallback_llm, None, fallback.name
+    else:
+        if fallback is None or not fallback.is_configured():
+            logging.error(f"{primary.name} initialization failed and no fallback LLM is available. "
+                          f"Please check your configuration (e.g. GOOGLE_API_KEY).")
+        else:
+            logging.error("Both primary and fallback LLM initialization failed. Please check your API keys.")
+        return None, None, "none"
+
+
+def get_llm_clients(gemini_model=DEFAULT_GEMINI_MODEL, openai_model=DEFAULT_OPENAI_MODEL):
+    """
+    Get the shared LLM clients, building them on first use or after a config change
+    :param gemini_model: Gemini model name for the primary client
+    :param openai_model: OpenAI model name for the fallback client
+    :return: tuple (primary_llm, fallback_llm, primary_type)
+    """
+    ensure_llm_config_loaded()
+    key = (gemini_model, openai_model, _config_fingerprint())
+
+    entry = _clients.get(key)
+    if entry is None:
+        with _lock:
+            entry = _clients.get(key)
+            if entry is None:
+                clients = _build_clients(gemini_model, openai_model)
+                # Drop clients of an older configuration for the same models
+                for old_key in [k for k in _clients if k[:2] == key[:2]]:
+                    del _clients[old_key]
+                entry = {"clients": clients, "created_at": datetime.now(timezone.utc).isoformat(), "hits": 0}
+                _clients[key] = entry
+                _stats["client_builds"] += 1
+                return clients
+
+    with _lock:
+        entry["hits"] += 1
+        _stats["client_hits"] += 1
+    return entry["clients"]
+
+
+def get_llm_chain(name, template, gemini_model=DEFAULT_GEMINI_MODEL, openai_model=DEFAULT_OPENAI_MODEL):
+    """
+    Get a prebuilt chain (prompt | primary llm | output parser) for a prompt template
+    :param name: name the chain is registered under (one template per name)
+    :param template: the prompt template, with {variables} filled at invoke time
+    :param gemini_model: Gemini model name for the primary client
+    :param openai_model: OpenAI model name for the fallback client
+    :return: tuple (chain, primary_llm, fallback_llm, primary_type); chain is None if no LLM is available
+    """
+    primary_llm, fallback_llm, primary_type = get_llm_clients(gemini_model, openai_model)
+    if primary_llm is None:
+        return None, None, None, primary_type
+
+    key = (name, gemini_model, openai_model, _config_fingerprint())
+    entry = _chains.get(key)
+    if entry is None or entry["llm"] is not primary_llm:
+        with _lock:
+            entry = _chains.get(key)
+            if entry is None or entry["llm"] is not primary_llm:
+                chain = PromptTemplate.from_template(template) | primary_llm | StrOutputParser()
+                for old_key in [k for k in _chains if k[:3] == key[:3]]:
+                    del _chains[old_key]
+                entry = {"chain": chain, "llm": primary_llm, "hits": 0}
+                _chains[key] = entry
+                _stats["chain_builds"] += 1
+                return chain, primary_llm, fallback_llm, primary_type
+
+    with _lock:
+        entry["hits"] += 1
+        _stats["chain_hits"] += 1
+    return entry["chain"], primary_llm, fallback_llm, primary_type
+
+
+def reload_llm_clients():
+    """
+    Reload the .env file and drop all cached clients and chains. They are rebuilt on next use;
+    requests that already hold a client finish with it.
+    """
+    ensure_llm_config_loaded(force_reload=True)
+    with _lock:
+        _clients.clear()
+        _chains.clear()
+
+
+def get_llm_registry_stats() -> Dict[str, Any]:
+    """
+    Get the registry state for monitoring
+    :return: dictionary with config reloads, cached clients and chains, and reuse counters
+    """
+    with _lock:
+        return {
+            "config": {
+                "path": _config_state["path"],
+                "loaded_at": _config_state["loaded_at"],
+                "reloads": _config_state["reloads"]
+            },
+            "clients": [
+                {
+                    "gemini_model": gemini_model,
+                    "openai_model": openai_model,
+                    "primary_type": entry["clients"][2],
+                    "fallback_available": entry["clients"][1] is not None,
+                    "created_at": entry["created_at"],
+                    "hits": entry["hits"]
+                }
+                for (gemini_model, openai_model, _), entry in _clients.items()
+            ],
+            "chains": {name: entry["hits"] for (name, _, _, _), entry in _chains.items()},
+            **_stats
+        }
@@ -0,0 +1,247 @@
+"""
+Typed LLM error taxonomy
+Every provider failure (LangChain Gemini/OpenAI clients, the direct Gemini HTTP calls) is
+classified into one error class, which decides whether to retry it and whether to fall
+back to the other provider straight away:
+- rate_limited: 429 / quota exhausted, retried after a backoff (honoring Retry-After)
+- auth: 401 / 403 / invalid key, never retried, fall back immediately
+- not_found: 404 / unknown model or API version, never retried, fall back immediately
+- bad_request: other 4xx, never retried
+- timeout: the call timed out, retried once
+- deadline: the request's deadline passed (see request_deadline), never retried; the client's
+  choice says nothing about the provider, so it is kept apart from provider timeouts
+- transient: 5xx and connection errors, retried with backoff
+- circuit_open: the provider's circuit breaker rejected the call
+- overloaded: the provider's limiter had no permit for the call in time
+- unknown: anything else, not retried
+Deadline cut-offs and other ProviderNeutralErrors don't count against the provider's circuit
+breaker or limiter.
+Classification uses status codes and exception types, not the error message text.
+"""
+from typing import Optional
+import asyncio
+import re
+
+RATE_LIMITED = "rate_limited"
+AUTH = "auth"
+NOT_FOUND = "not_found"
+BAD_REQUEST = "bad_request"
+TIMEOUT = "timeout"
+DEADLINE = "deadline"
+TRANSIENT = "transient"
+CIRCUIT_OPEN = "circuit_open"
+OVERLOADED = "overloaded"
+UNKNOWN = "unknown"
+
+ERROR_CLASSES = (RATE_LIMITED, AUTH, NOT_FOUND, BAD_REQUEST, TIMEOUT, DEADLINE, TRANSIENT, CIRCUIT_OPEN, OVERLOADED,
+                 UNKNOWN)
+
+# The provider can't serve this request at all; trying again or waiting won't help
+FALLBACK_IMMEDIATELY = (AUTH, NOT_FOUND, CIRCUIT_OPEN, OVERLOADED)
+
+
+class LLMError(Exception):
+    """A classified LLM provider error"""
+    error_class = UNKNOWN
+
+    def __init__(self, message: str, provider: Optional[str] = None, status_code: Optional[int] = None,
+                 retry_after: Optional[float] = None):
+        """
+        :param message: error description
+        :param provider: provider name (gemini, openai)
+        :param status_code: HTTP status code, if the provider answered
+        :param retry_after: seconds the provider asked us to wait, if any
+        """
+        super().__init__(message)
+        self.provider = provider
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RateLimitedError(LLMError):
+    error_class = RATE_LIMITED
+
+
+class AuthError(LLMError):
+    error_class = AUTH
+
+
+class ModelNotFoundError(LLMError):
+    error_class = NOT_FOUND
+
+
+class BadRequestError(LLMError):
+    error_class = BAD_REQUEST
+
+
+class LLMTimeoutError(LLMError):
+    error_class = TIMEOUT
+
+
+class ProviderNeutralError(LLMError):
+    """
+    A failure that says nothing about the provider's health (a deadline cut-off, missing
+    configuration, a blocked or empty answer): circuit breakers release the call instead of
+    recording a failure, and limiters count it as cancelled
+    """
+
+
+class DeadlineExceededError(ProviderNeutralError):
+    error_class = DEADLINE
+
+
+class TransientError(LLMError):
+    error_class = TRANSIENT
+
+
+class ProviderUnavailableError(LLMError):
+    error_class = CIRCUIT_OPEN
+
+
+class OverloadedError(LLMError):
+    error_class = OVERLOADED
+
+
+class UnknownLLMError(LLMError):
+    error_class = UNKNOWN
+
+
+ERROR_TYPES = {error_type.error_class: error_type for error_type in
+               (RateLimitedError, AuthError, ModelNotFoundError, BadRequestError, LLMTimeoutError,
+                DeadlineExceededError, TransientError, ProviderUnavailableError, OverloadedError, UnknownLLMError)}
+
+# Exception class names of the provider SDKs (google.api_core, openai, httpx), matched over the
+# class hierarchy so the SDKs don't have to be importable here
+EXCEPTION_NAME_CLASSES = {
+    "ResourceExhausted": RATE_LIMITED,
+    "TooManyRequests": RATE_LIMITED,
+    "RateLimitError": RATE_LIMITED,
+    "Unauthenticated": AUTH,
+    "Unauthorized": AUTH,
+    "PermissionDenied": AUTH,
+    "Forbidden": AUTH,
+    "AuthenticationError": AUTH,
+    "PermissionDeniedError": AUTH,
+    "NotFound": NOT_FOUND,
+    "NotFoundError": NOT_FOUND,
+    "InvalidArgument": BAD_REQUEST,
+    "BadRequest": BAD_REQUEST,
+    "BadRequestError": BAD_REQUEST,
+    "UnprocessableEntityError": BAD_REQUEST,
+    "DeadlineExceeded": TIMEOUT,
+    "APITimeoutError": TIMEOUT,
+    "TimeoutException": TIMEOUT,
+    "TimeoutError": TIMEOUT,
+    "ServiceUnavailable": TRANSIENT,
+    "InternalServerError": TRANSIENT,
+    "ServerError": TRANSIENT,
+    "BadGateway": TRANSIENT,
+    "GatewayTimeout": TRANSIENT,
+    "APIConnectionError": TRANSIENT,
+    "ConnectError": TRANSIENT,
+    "RemoteProtocolError": TRANSIENT,
+    "ReadError": TRANSIENT,
+    "CircuitOpenError": CIRCUIT_OPEN
+}
+
+# google.api_core errors render as "404 models/... is not found"
+LEADING_STATUS_PATTERN = re.compile(r"^\s*(\d{3})\s")
+
+
+def class_for_status(status_code: int) -> str:
+    """
+    Get the error class of an HTTP status code
+    :param status_code: HTTP status code of a failed call
+    :return: the error class
+    """
+    if status_code == 429:
+        return RATE_LIMITED
+    if status_code in (401, 403):
+        return AUTH
+    if status_code == 404:
+        return NOT_FOUND
+    if status_code in (408, 504):
+        return TIMEOUT
+    if status_code >= 500:
+        return TRANSIENT
+    if status_code >= 400:
+        return BAD_REQUEST
+    return UNKNOWN
+
+
+def error_for_status(status_code: int, body: str = "", provider: Optional[str] = None,
+                     retry_after: Optional[float] = None) -> LLMError:
+    """
+    Build the typed error of a failed HTTP response
+    :param status_code: HTTP status code
+    :param body: response body (truncated in the message)
+    :param provider: provider name
+    :param retry_after: value of the Retry-After header in seconds, if any
+    :return: the classified error
+    """
+    error_type = ERROR_TYPES[class_for_status(status_code)]
+    return error_type(f"{provider or 'LLM'} API error {status_code}: {body[:500]}", provider=provider,
+                      status_code=status_code, retry_after=retry_after)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds (HTTP dates are ignored)"""
+    try:
+        return max(float(value), 0.0) if value else None
+    except ValueError:
+        return None
+
+
+def _status_code_of(error: BaseException) -> Optional[int]:
+    # openai.APIStatusError.status_code, httpx.HTTPStatusError.response, google.api_core .code
+    for candidate in (getattr(error, "status_code", None),
+                      getattr(getattr(error, "response", None), "status_code", None),
+                      getattr(error, "code", None)):
+        if isinstance(candidate, int) and 100 <= candidate < 600:
+            return candidate
+    match = LEADING_STATUS_PATTERN.match(str(error))
+    return int(match.group(1)) if match else None
+
+
+def _retry_after_of(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers is None:
+        return None
+    try:
+        return parse_retry_after(headers.get("retry-after"))
+    except Exception:
+        return None
+
+
+def classify_error(error: BaseException, provider: Optional[str] = None) -> LLMError:
+    """
+    Classify any provider exception
+    :param error: the exception raised by an LLM call
+    :param provider: provider name, recorded on the typed error
+    :return: the typed error (the same object if it is already an LLMError)
+    """
+    if isinstance(error, LLMError):
+        if error.provider is None:
+            error.provider = provider
+        return error
+
+    error_class = None
+    if isinstance(error, asyncio.TimeoutError):
+        error_class = TIMEOUT
+    else:
+        # Walk the class hierarchy, e.g. the LangChain wrapper of a google.api_core error
+        for error_type in type(error).__mro__:
+            error_class = EXCEPTION_NAME_CLASSES.get(error_type.__name__)
+            if error_class:
+                break
+
+    status_code = _status_code_of(error)
+    if error_class is None and status_code is not None:
+        error_class = class_for_status(status_code)
+
+    typed_error = ERROR_TYPES[error_class or UNKNOWN](
+        f"{type(error).__name__}: {error}", provider=provider, status_code=status_code,
+        retry_after=_retry_after_of(error)
+    )
+    typed_error.__cause__ = error
+    return typed_error
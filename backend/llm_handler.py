@@ -1,13 +1,38 @@
-# To read API key from .env file
-from dotenv import load_dotenv
 # LangChain imports
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_openai import OpenAIEmbeddings
-# Hugging Face imports
-from transformers import pipeline
+# Shared Hugging Face sentiment model
+from sentiment_model_registry import (get_sentiment_pipeline, get_sentiment_backend, normalize_sentiment,
+                                      SENTIMENT_MODEL_NAME)
+from content_cache import ContentCache
+from single_flight import SingleFlight
+from map_reduce_summary import summarize_map_reduce, needs_map_reduce
+from sentiment_lexicon import fast_sentiment
+from long_text_sentiment import long_text_token_ids, analyze_long_text_sentiment
+# Multi-task analysis (sentiment + emotion + risk) on the shared encoder
+from text_analysis import analyze_texts, embed_texts, TEXT_ANALYSIS_VERSION
+from sentiment_batcher import MicroBatcher, create_inference_executor
+# Per-provider circuit breakers
+from circuit_breaker import get_circuit_breaker, CircuitOpenError
+# Typed LLM errors and budgeted retries
+from llm_errors import classify_error, ProviderNeutralError, CIRCUIT_OPEN, FALLBACK_IMMEDIATELY
+from llm_retry import call_with_retries, acall_with_retries, limiter_outcome
+from llm_rate_limiter import get_llm_limiter, LLM_LIMITER_ENABLED, SUCCESS, CANCELLED
+# Opt-in hedging of slow primary calls
+from llm_hedging import get_llm_hedger, HedgedCallError, LLM_HEDGING_ENABLED
+# Shared LLM clients and prebuilt chains
+from llm_client_registry import (get_llm_clients, get_llm_chain, get_chat_models, ensure_llm_config_loaded,
+                                 build_gemini_client, build_openai_client)
+from llm_providers import get_fallback_provider_name
+# Token-budgeted prompt context
+from chat_context import (build_chat_context, format_turn, format_summary, format_chunk,
+                          NO_PAST_CONVERSATIONS, NO_SUMMARIES, NO_RELEVANT_CHUNKS)
+# Per-request deadline seen by every stage
+from request_deadline import (stage_timeout, record_skipped_stage, get_deadline, request_deadline,
+                              REQUEST_DEADLINE_LLM_RESERVE_SECONDS)
+# Opt-in semantic response cache
+from semantic_cache import SEMANTIC_CACHE_ENABLED, get_semantic_cache, context_class
 # MongoDB Database Handler
 from mongodb_database_handler import (upload_chat_in_conversation,
                                       get_past_conversations,
@@ -22,136 +47,287 @@ except ImportError:
     print("Weaviate not available - vector search disabled")
 # Other imports
 import os
+import time
+import asyncio
 import logging
-from typing import Optional
+import functools
+import contextvars
+from typing import Optional, List
 
 
+def sentiment_namespace():
+    """Model and inference backend actually loaded (a fallback to pytorch is scored as pytorch)"""
+    return f"{SENTIMENT_MODEL_NAME}:{get_sentiment_backend()}"
+
+# Cache of normalized-text hash -> sentiment score, so repeated messages skip inference
+SENTIMENT_CACHE_ENABLED = os.getenv("SENTIMENT_CACHE_ENABLED", "true").lower() == "true"
+sentiment_cache = ContentCache(
+    name="sentiment",
+    namespace=sentiment_namespace,
+    max_entries=int(os.getenv("SENTIMENT_CACHE_MAX_ENTRIES", "10000")),
+    ttl_seconds=float(os.getenv("SENTIMENT_CACHE_TTL_SECONDS", "86400")),
+    disk_path=os.getenv("SENTIMENT_CACHE_DISK_PATH") or None
+)
+
+# "model" always uses the transformer; "tiered" tries the fast lexicon scorer first
+SENTIMENT_MODE = os.getenv("SENTIMENT_MODE", "model").lower()
+
+# Identifies the scoring logic; bump SENTIMENT_LOGIC_REVISION when normalization changes
+# (2: texts longer than one model window are scored with strided windows)
+SENTIMENT_LOGIC_REVISION = 2
+
+def get_sentiment_version():
+    """
+    Version tag stored with backfilled scores: model, inference backend actually loaded
+    (loading the model if needed), mode and logic revision
+    """
+    get_sentiment_pipeline()
+    return f"{sentiment_namespace()}:{SENTIMENT_MODE}:{SENTIMENT_LOGIC_REVISION}"
+
+def fast_tier_sentiment(text):
+    """
+    Score a text with the fast lexicon tier when tiered mode is enabled
+    :param text: The text to score
+    :return: a normalized sentiment score, or None if the transformer model is needed
+    """
+    if SENTIMENT_MODE != "tiered":
+        return None
+    return fast_sentiment(text)
+
 def analyze_sentiment(text):
     """
     This functions takes in a text and returns the sentiment of the text.
     Current model used: cardiffnlp/twitter-roberta-base-sentiment-latest
+    The model is loaded once per process by the sentiment model registry.
+    In tiered mode the model is only used when the fast lexicon scorer is not confident.
     :param text: The text to score
     :return: a normalized sentiment score between -1 and 1
     """
-    # Initialize the sentiment analysis pipeline
-    sentiment_analyzer = pipeline("sentiment-analysis",
-                                  model="cardiffnlp/twitter-roberta-base-sentiment-latest")
-    # Get the sentiment of the text
-    result = sentiment_analyzer(text)
-    label = result[0]["label"].lower()
-    score = result[0]["score"]
-
-    # Normalize the sentiment score
-    sentiment_mapping = {
-        "positive": 1,
-        "negative": -1,
-        "neutral": 0
-    }
+    fast_score = fast_tier_sentiment(text)
+    if fast_score is not None:
+        return fast_score
 
-    normalized_score = sentiment_mapping[label] * score
+    if SENTIMENT_CACHE_ENABLED:
+        found, cached_score = sentiment_cache.get(text)
+        if found:
+            return cached_score
 
-    if label == "neutral":
-        if score > 0.7:
-            normalized_score = 0.2
-        elif normalized_score < 0.3:
-            normalized_score = -0.2
-        else:
-            normalized_score = 0
+    # Get the shared sentiment analysis pipeline
+    sentiment_analyzer = get_sentiment_pipeline()
+    token_ids = long_text_token_ids(text, sentiment_analyzer.tokenizer)
+    if token_ids is not None:
+        # Journal-length text: score every part of it, not just the first 512 tokens
+        normalized_score = analyze_long_text_sentiment(text, token_ids)
+    else:
+        # Get the sentiment of the text
+        result = sentiment_analyzer(text)
+        normalized_score = normalize_sentiment(result[0]["label"], result[0]["score"])
+
+    if SENTIMENT_CACHE_ENABLED:
+        sentiment_cache.set(text, normalized_score)
 
     return normalized_score
 
+def analyze_sentiment_batch(texts: List[str], use_fast_tier: bool = True) -> List[float]:
+    """
+    Score several texts with one padded forward pass through the sentiment model.
+    Cached texts and duplicates within the batch are only scored once, and texts longer
+    than one model window are scored with windowed sentiment.
+    :param texts: list of texts to score
+    :param use_fast_tier: try the lexicon tier first (when tiered mode is enabled)
+    :return: list of normalized sentiment scores between -1 and 1, in the same order
+    """
+    if not texts:
+        return []
+
+    scores = {}
+    for text in texts:
+        if text in scores:
+            continue
+        fast_score = fast_tier_sentiment(text) if use_fast_tier else None
+        if fast_score is not None:
+            scores[text] = fast_score
+        elif SENTIMENT_CACHE_ENABLED:
+            found, cached_score = sentiment_cache.get(text)
+            if found:
+                scores[text] = cached_score
+
+    # Unique texts that still need the model, in their original order
+    to_score = list(dict.fromkeys(text for text in texts if text not in scores))
+    if to_score:
+        sentiment_analyzer = get_sentiment_pipeline()
+        # Texts longer than one window, with their token ids
+        long_texts = {}
+        for text in to_score:
+            token_ids = long_text_token_ids(text, sentiment_analyzer.tokenizer)
+            if token_ids is not None:
+                long_texts[text] = token_ids
+        short_texts = [text for text in to_score if text not in long_texts]
+
+        if short_texts:
+            results = sentiment_analyzer(short_texts, batch_size=len(short_texts), truncation=True)
+            for text, result in zip(short_texts, results):
+                scores[text] = normalize_sentiment(result["label"], result["score"])
+        for text, token_ids in long_texts.items():
+            scores[text] = analyze_long_text_sentiment(text, token_ids)
+
+        if SENTIMENT_CACHE_ENABLED:
+            for text in to_score:
+                sentiment_cache.set(text, scores[text])
+
+    return [scores[text] for text in texts]
+
+# Bounded pool that runs sentiment inference off the event loop
+SENTIMENT_WORKERS = int(os.getenv("SENTIMENT_WORKERS", "1"))
+sentiment_executor = create_inference_executor(
+    pool_type=os.getenv("SENTIMENT_POOL_TYPE", "thread"),
+    max_workers=SENTIMENT_WORKERS,
+    name="sentiment"
+)
+
+# Micro-batcher shared by all concurrent chat requests in this worker
+# (texts reaching the batcher already went through the fast tier in analyze_sentiment_async)
+sentiment_batcher = MicroBatcher(
+    functools.partial(analyze_sentiment_batch, use_fast_tier=False),
+    window_ms=float(os.getenv("SENTIMENT_BATCH_WINDOW_MS", "10")),
+    max_batch_size=int(os.getenv("SENTIMENT_MAX_BATCH_SIZE", "32")),
+    name="sentiment",
+    executor=sentiment_executor,
+    max_concurrent_batches=SENTIMENT_WORKERS,
+    max_pending=int(os.getenv("SENTIMENT_MAX_PENDING", "256"))
+)
+
+async def analyze_sentiment_async(text):
+    """
+    Async version of analyze_sentiment for request handlers.
+    Texts arriving at the same time are scored together in one batch, off the event loop.
+    :param text: The text to score
+    :return: a normalized sentiment score between -1 and 1
+    :raises BatcherOverloadedError: if too many texts are already waiting to be scored
+    """
+    # The lexicon tier takes microseconds, so it runs right here on the event loop
+    fast_score = fast_tier_sentiment(text)
+    if fast_score is not None:
+        return fast_score
+
+    # Memory-only lookup on the event loop; the batch worker also checks the disk tier
+    if SENTIMENT_CACHE_ENABLED:
+        found, cached_score = sentiment_cache.get(text, use_disk=False)
+        if found:
+            return cached_score
+
+    return await sentiment_batcher.submit(text)
+
+# Structured analysis (sentiment, emotions, crisis risk) from one shared-encoder pass.
+# Opt-in: when enabled, chat messages are scored by this pass (first 512 tokens, one model call
+# per message) instead of analyze_sentiment's tiered, windowed and batched path.
+TEXT_ANALYSIS_ENABLED = os.getenv("TEXT_ANALYSIS_ENABLED", "false").lower() == "true"
+
+# The semantic cache needs the risk analysis to rule out crisis messages (see semantic_cache.context_class)
+SEMANTIC_CACHE_ACTIVE = SEMANTIC_CACHE_ENABLED and TEXT_ANALYSIS_ENABLED
+if SEMANTIC_CACHE_ENABLED and not TEXT_ANALYSIS_ENABLED:
+    logging.warning("SEMANTIC_CACHE_ENABLED requires TEXT_ANALYSIS_ENABLED=true - the semantic cache is off")
+analysis_cache = ContentCache(
+    name="analysis",
+    namespace=lambda: f"{sentiment_namespace()}:analysis:{TEXT_ANALYSIS_VERSION}",
+    max_entries=int(os.getenv("SENTIMENT_CACHE_MAX_ENTRIES", "10000")),
+    ttl_seconds=float(os.getenv("SENTIMENT_CACHE_TTL_SECONDS", "86400"))
+)
+
+def analyze_text_batch(texts: List[str]) -> List[dict]:
+    """
+    Analyze several texts (sentiment, emotions, crisis risk) in one forward pass.
+    Cached texts and duplicates within the batch are only analyzed once.
+    :param texts: list of texts to analyze
+    :return: list of structured analysis results, in the same order
+    """
+    results = {}
+    for text in texts:
+        if text not in results and SENTIMENT_CACHE_ENABLED:
+            found, cached_analysis = analysis_cache.get(text)
+            if found:
+                results[text] = cached_analysis
+
+    to_analyze = list(dict.fromkeys(text for text in texts if text not in results))
+    if to_analyze:
+        for text, analysis in zip(to_analyze, analyze_texts(to_analyze)):
+            results[text] = analysis
+            if SENTIMENT_CACHE_ENABLED:
+                analysis_cache.set(text, analysis)
+
+    return [results[text] for text in texts]
+
+# Analysis batches share the sentiment pool: it is the same model
+analysis_batcher = MicroBatcher(
+    analyze_text_batch,
+    window_ms=float(os.getenv("SENTIMENT_BATCH_WINDOW_MS", "10")),
+    max_batch_size=int(os.getenv("SENTIMENT_MAX_BATCH_SIZE", "32")),
+    name="analysis",
+    executor=sentiment_executor,
+    max_concurrent_batches=SENTIMENT_WORKERS,
+    max_pending=int(os.getenv("SENTIMENT_MAX_PENDING", "256"))
+)
+
+def analyze_message(text):
+    """
+    Score a chat message for the prompt and the conversation record. Without text analysis the
+    score comes from analyze_sentiment (SENTIMENT_MODE tiers, long-text windows), with it from
+    the analysis pass.
+    :param text: the user's message
+    :return: tuple (sentiment score, structured analysis or None if analysis is disabled)
+    """
+    if not TEXT_ANALYSIS_ENABLED:
+        return analyze_sentiment(text), None
+
+    analysis = analyze_text_batch([text])[0]
+    return analysis["sentiment"]["score"], analysis
+
+async def analyze_message_async(text):
+    """
+    Async version of analyze_message, batched with concurrent requests and run off the event loop
+    (through sentiment_batcher, or analysis_batcher when text analysis is enabled)
+    :param text: the user's message
+    :return: tuple (sentiment score, structured analysis or None if analysis is disabled)
+    :raises BatcherOverloadedError: if too many texts are already waiting to be analyzed
+    """
+    if not TEXT_ANALYSIS_ENABLED:
+        return await analyze_sentiment_async(text), None
+
+    if SENTIMENT_CACHE_ENABLED:
+        found, cached_analysis = analysis_cache.get(text, use_disk=False)
+        if found:
+            return cached_analysis["sentiment"]["score"], cached_analysis
+
+    analysis = await analysis_batcher.submit(text)
+    return analysis["sentiment"]["score"], analysis
+
 def initialize_gemini_llm(model="gemini-1.5-flash"):
     """
-    Initialize the Gemini LLM model
+    Initialize a new Gemini LLM model (chats use the shared clients from get_llm_clients)
     :param model: Gemini model name (gemini-1.5-flash, gemini-1.5-pro, gemini-2.0-flash-exp)
     :return: the Gemini LLM model object or None if failed
     """
-    try:
-        # Load environment variables
-        load_dotenv()
-        
-        google_api_key = os.getenv("GOOGLE_API_KEY")
-        if not google_api_key:
-            logging.warning("GOOGLE_API_KEY not found in environment variables")
-            return None
-            
-        # Initialize the Gemini LLM model with current model names
-        llm_gemini = ChatGoogleGenerativeAI(
-            model=model,
-            google_api_key=google_api_key,
-            temperature=0.7,
-            convert_system_message_to_human=True,  # Gemini doesn't support system messages
-            max_retries=2,  # Limit retries for faster fallback
-            timeout=30  # 30 second timeout
-        )
-        
-        return llm_gemini
-        
-    except Exception as e:
-        logging.error(f"Failed to initialize Gemini LLM: {e}")
-        return None
+    ensure_llm_config_loaded()
+    return build_gemini_client(model)
 
 def initialize_openai_llm(model="gpt-4o-mini"):
     """
-    Initialize the OpenAI LLM model (ChatGPT)
-    Also, includes getting API key from .env file
+    Initialize a new OpenAI LLM model (ChatGPT)
     Current models used: gpt-4o, gpt-4o-mini
     :return: the OpenAI LLM model object or None if failed
     """
-    try:
-        # Load environment variables
-        load_dotenv()
-        
-        openai_api_key = os.getenv("OPENAI_API_KEY")
-        if not openai_api_key:
-            logging.warning("OPENAI_API_KEY not found in environment variables")
-            return None
-
-        # Initialize the LLM model
-        llm_openai = ChatOpenAI(
-            model=model,
-            openai_api_key=openai_api_key,
-            temperature=0.7,
-            max_retries=2,
-            timeout=30
-        )
-
-        return llm_openai
-        
-    except Exception as e:
-        logging.error(f"Failed to initialize OpenAI LLM: {e}")
-        return None
+    ensure_llm_config_loaded()
+    return build_openai_client(model)
 
 def initialize_llm_with_fallback(gemini_model="gemini-1.5-flash", openai_model="gpt-4o"):
     """
-    Initialize LLM with Gemini as primary and OpenAI as fallback
+    Get the LLMs with Gemini as primary and OpenAI as fallback (unless other providers are
+    configured, see llm_providers). The clients are shared by the whole process (see llm_client_registry).
     :param gemini_model: Gemini model name (gemini-1.5-flash, gemini-1.5-pro, gemini-2.0-flash-exp)
     :param openai_model: OpenAI model name for fallback
     :return: tuple (primary_llm, fallback_llm, primary_type)
     """
-    # Always try Gemini first (primary)
-    primary_llm = initialize_gemini_llm(gemini_model)
-    
-    # Only try OpenAI if API key is available
-    fallback_llm = None
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    if openai_api_key:
-        fallback_llm = initialize_openai_llm(openai_model)
-    else:
-        logging.info("OpenAI API key not found - Gemini only mode")
-    
-    if primary_llm is not None:
-        logging.info("Successfully initialized Gemini as primary LLM")
-        return primary_llm, fallback_llm, "gemini"
-    elif fallback_llm is not None:
-        logging.warning("Gemini initialization failed, using OpenAI as primary")
-        return fallback_llm, None, "openai"
-    else:
-        if not openai_api_key:
-            logging.error("Gemini initialization failed and no OpenAI API key available. Please check your GOOGLE_API_KEY.")
-        else:
-            logging.error("Both Gemini and OpenAI initialization failed. Please check your API keys.")
-        return None, None, "none"
+    return get_llm_clients(gemini_model, openai_model)
 
 # Backward compatibility
 def initialize_llm(model="gpt-4o-mini"):
@@ -178,6 +354,9 @@ def get_system_prompt():
     Here are all available summaries from chat and journal entries:
     {summaries}
     
+    Here are excerpts from similar therapy sessions that may help you respond:
+    {relevant_chunks}
+    
     Following is the user’s latest message.
     User: {user_input}
     
@@ -187,6 +366,11 @@ def get_system_prompt():
     you should be more empathetic and understanding. If the sentiment score is positive, you should be more encouraging 
     and supportive but not too cheerful.
     
+    Emotions detected in the user's latest message: {emotions}
+    Crisis risk detected in the user's latest message: {risk_level}
+    If the crisis risk is elevated or high, take it seriously, stay calm and caring, and gently encourage the user 
+    to reach out to someone they trust, a local crisis line or emergency services.
+    
     Note: Do not repeat what the user is saying. Do not repeat exactly what the user is saying. If 
     you think the user is trying it get reassurance, go with flow and give him that reassurance, but dont be over excited.
     Try to have a conversation. And dont keep asking only questions. Keep it natural.
@@ -194,40 +378,79 @@ def get_system_prompt():
 
     return system_prompt
 
+SUMMARY_PROMPT_TEMPLATE = """Your only task is to summarize the given text. Do not add any additional information.
+            Each object has its own date.
+            
+            Text to summarize:
+            {text}
+            
+            Summary:"""
+
+# Bump when SUMMARY_PROMPT_TEMPLATE changes, so memoized summaries are redone
+# (the configured providers and models are part of the memo key)
+SUMMARY_PROMPT_REVISION = 1
+SUMMARY_GEMINI_MODEL = "gemini-1.5-flash"
+SUMMARY_OPENAI_MODEL = "gpt-4o-mini"
+
+def summary_memo_namespace():
+    """Summary memo namespace: the prompt revision and the configured providers and models"""
+    models = get_chat_models(SUMMARY_GEMINI_MODEL, SUMMARY_OPENAI_MODEL)
+    return f"summary:{SUMMARY_PROMPT_REVISION}:{':'.join(models)}"
+
+# Persistent content-addressed memo of completed summaries: summarizing unchanged text costs no LLM call.
+# Keyed on the exact text, since case and whitespace can change a summary.
+SUMMARY_MEMO_ENABLED = os.getenv("SUMMARY_MEMO_ENABLED", "true").lower() == "true"
+summary_memo = ContentCache(
+    name="summary_memo",
+    namespace=summary_memo_namespace,
+    max_entries=int(os.getenv("SUMMARY_MEMO_MAX_ENTRIES", "1000")),
+    ttl_seconds=None,
+    disk_path=os.getenv("SUMMARY_MEMO_DISK_PATH", os.path.join("local_data", "summary_memo.sqlite3")) or None,
+    normalize=False
+)
+# Concurrent summaries of the same text share one LLM call
+summary_flight = SingleFlight("summarize")
+SUMMARY_FAILED = "Summary generation failed"
+
 def summarize(text):
     """
     Summarize the given text using the LLM model with fallback.
     Uses Gemini first, then falls back to GPT-4o-mini if needed.
+    Summaries are memoized by content, and concurrent calls with the same text share one LLM call.
     :param text: the text to summarize
     :return: the summarized text
     """
+    if SUMMARY_MEMO_ENABLED:
+        found, summary = summary_memo.get(text)
+        if found:
+            logging.info("📝 Summary served from the memo store")
+            return summary
+
+    return summary_flight.do(summary_memo.make_key(text), lambda: _summarize_uncached(text))
+
+def _summarize_uncached(text):
+    """Summarize text with the LLM and memoize the result"""
+    # Another call may have finished the same summary while this one waited to run
+    if SUMMARY_MEMO_ENABLED:
+        found, summary = summary_memo.get(text, use_disk=False)
+        if found:
+            return summary
+
+    # Too long for one prompt: summarize chunks in parallel and merge them
+    if needs_map_reduce(text):
+        return summarize_records(text)
+
     try:
-        # Initialize LLM with fallback mechanism
-        primary_llm, fallback_llm, primary_type = initialize_llm_with_fallback(
-            gemini_model="gemini-1.5-flash",
-            openai_model="gpt-4o-mini"
+        # Prebuilt summary chain on the shared LLM clients
+        chain, primary_llm, fallback_llm, primary_type = get_llm_chain(
+            "summary", SUMMARY_PROMPT_TEMPLATE,
+            gemini_model=SUMMARY_GEMINI_MODEL,
+            openai_model=SUMMARY_OPENAI_MODEL
         )
         
-        if primary_llm is None:
+        if chain is None:
             raise Exception("No LLM models are available for summarization.")
         
-        prompt_template = PromptTemplate(
-            template="""Your only task is to summarize the given text. Do not add any additional information.
-            Each object has its own date.
-            
-            Text to summarize:
-            {text}
-            
-            Summary:""",
-            input_variables=["text"]
-        )
-        
-        # Create an output parser
-        output_parser = StrOutputParser()
-        
-        # Define the chain of operations
-        chain = prompt_template | primary_llm | output_parser
-        
         # Invoke the chain with fallback mechanism
         result, used_model = invoke_llm_with_fallback_data(
             chain, primary_llm, fallback_llm, primary_type, 
@@ -235,11 +458,67 @@ def summarize(text):
         )
         
         logging.info(f"📝 Summary generated using: {used_model}")
+        if SUMMARY_MEMO_ENABLED:
+            summary_memo.set(text, result)
         return result
         
     except Exception as e:
         logging.error(f"❌ Summarization failed: {e}")
-        return "Summary generation failed"
+        return SUMMARY_FAILED
+
+def _summarize_chunk(text):
+    """Summarize one map-reduce chunk, raising if it failed so the whole summary fails"""
+    summary = summarize(text)
+    if summary == SUMMARY_FAILED:
+        raise Exception("Summary of a chunk failed")
+    return summary
+
+def summarize_records(content):
+    """
+    Summarize a long input with map-reduce: chunks (whole days for dated records, otherwise
+    token-budget pieces) are summarized in parallel, then the partial summaries are merged.
+    Chunks go through summarize, so unchanged chunks are served from the memo.
+    :param content: text, or list of dicts with a date field
+    :return: the summarized text
+    """
+    try:
+        summary, stats = summarize_map_reduce(content, _summarize_chunk)
+    except Exception as e:
+        logging.error(f"❌ Map-reduce summarization failed: {e}")
+        return SUMMARY_FAILED
+    if SUMMARY_MEMO_ENABLED and isinstance(content, str):
+        summary_memo.set(content, summary)
+    return summary
+
+def get_summary_stats():
+    """
+    Get the summary memo and coalescing counters
+    :return: dictionary with memo hit rate and coalesced calls
+    """
+    return {
+        "memo_enabled": SUMMARY_MEMO_ENABLED,
+        "memo": summary_memo.get_stats(),
+        "single_flight": summary_flight.get_stats()
+    }
+
+def build_fallback_chain(chain, fallback_llm):
+    """
+    Build the same chain on top of the fallback LLM
+    :param chain: the chain that failed on the primary LLM
+    :param fallback_llm: Fallback LLM instance
+    :return: the fallback chain
+    """
+    # Extract the prompt template from the original chain
+    # and create a new chain with the fallback LLM
+    chain_steps = list(chain.steps) if hasattr(chain, 'steps') else []
+    if chain_steps:
+        # Get the prompt template (first step) and output parser (last step)  
+        prompt_template = chain_steps[0]
+        output_parser = chain_steps[-1] if len(chain_steps) > 2 else StrOutputParser()
+        return prompt_template | fallback_llm | output_parser
+
+    # If we can't extract steps, create a simple fallback chain
+    return PromptTemplate(template="{input}", input_variables=["input"]) | fallback_llm | StrOutputParser()
 
 def invoke_llm_with_fallback_data(chain, primary_llm, fallback_llm, primary_type, input_data=None):
     """
@@ -247,7 +526,7 @@ def invoke_llm_with_fallback_data(chain, primary_llm, fallback_llm, primary_type
     :param chain: The LangChain chain to invoke
     :param primary_llm: Primary LLM instance
     :param fallback_llm: Fallback LLM instance
-    :param primary_type: Type of primary LLM ("gemini" or "openai")
+    :param primary_type: Provider name of the primary LLM ("gemini", "openai", "fake")
     :param input_data: Data to pass to the chain
     :return: tuple (result, used_model_type)
     """
@@ -255,135 +534,222 @@ def invoke_llm_with_fallback_data(chain, primary_llm, fallback_llm, primary_type
         input_data = {}
         
     try:
-        # Try primary LLM (Gemini)
-        if primary_type == "gemini":
-            logging.info("Attempting to use Gemini API...")
-            result = chain.invoke(input_data)
-            logging.info("Gemini API call successful")
-            return result, "gemini"
-        else:
-            # Primary is already OpenAI
-            logging.info("Using OpenAI API as primary...")
-            result = chain.invoke(input_data)
-            logging.info("OpenAI API call successful")
-            return result, "openai"
+        # Try primary LLM, retried per error class through its circuit breaker
+        logging.info(f"Attempting to use {primary_type.capitalize()} API...")
+        result = call_with_retries(primary_type, chain.invoke, input_data,
+                                   estimated_tokens=estimate_prompt_tokens(input_data))
+        logging.info(f"{primary_type.capitalize()} API call successful")
+        return result, primary_type
             
     except Exception as e:
-        error_msg = str(e)
-        logging.error(f"{primary_type.capitalize()} API call failed: {error_msg}")
-        
-        # Check for specific Gemini errors that indicate immediate fallback
-        gemini_fallback_errors = [
-            "404",
-            "not found",
-            "not supported",
-            "models/gemini-pro is not found",
-            "api version",
-            "NotFound"
-        ]
-        
-        should_fallback_immediately = any(err in error_msg for err in gemini_fallback_errors)
+        error = classify_error(e, primary_type)
+        logging.error(f"{primary_type.capitalize()} API call failed ({error.error_class}): {error}")
         
-        if fallback_llm is not None and primary_type == "gemini":
+        fallback_type = get_fallback_provider_name()
+        if fallback_llm is not None and primary_type != fallback_type:
             try:
-                if should_fallback_immediately:
-                    logging.warning("Gemini model not available, immediately falling back to OpenAI...")
-                else:
-                    logging.info("Falling back to OpenAI ChatGPT...")
-                    
-                # Extract the prompt template from the original chain
-                # and create a new chain with the fallback LLM
-                chain_steps = list(chain.steps) if hasattr(chain, 'steps') else []
-                if chain_steps:
-                    # Get the prompt template (first step) and output parser (last step)  
-                    prompt_template = chain_steps[0]
-                    output_parser = chain_steps[-1] if len(chain_steps) > 2 else StrOutputParser()
-                    fallback_chain = prompt_template | fallback_llm | output_parser
-                else:
-                    # If we can't extract steps, create a simple fallback chain
-                    from langchain.prompts import PromptTemplate
-                    from langchain_core.output_parsers import StrOutputParser
-                    fallback_chain = PromptTemplate(template="{input}", input_variables=["input"]) | fallback_llm | StrOutputParser()
-                
-                result = fallback_chain.invoke(input_data)
-                logging.info("OpenAI fallback successful")
-                return result, "openai_fallback"
+                log_fallback_reason(error, primary_type, fallback_type)
+                fallback_chain = build_fallback_chain(chain, fallback_llm)
+                result = call_with_retries(fallback_type, fallback_chain.invoke, input_data,
+                                           estimated_tokens=estimate_prompt_tokens(input_data))
+                logging.info(f"{fallback_type.capitalize()} fallback successful")
+                return result, f"{fallback_type}_fallback"
                 
             except Exception as fallback_error:
-                logging.error(f"OpenAI fallback also failed: {fallback_error}")
-                raise Exception(f"Both Gemini and OpenAI failed. Gemini: {error_msg}, OpenAI: {str(fallback_error)}")
+                logging.error(f"{fallback_type.capitalize()} fallback also failed: {fallback_error}")
+                raise Exception(f"Both {primary_type} and {fallback_type} failed. "
+                                f"{primary_type}: {error}, {fallback_type}: {str(fallback_error)}")
         else:
-            raise Exception(f"LLM call failed and no fallback available: {error_msg}")
+            raise Exception(f"LLM call failed and no fallback available: {error}")
 
-def invoke_llm_with_fallback(chain, primary_llm, fallback_llm, primary_type):
+def log_fallback_reason(error, primary_type="gemini", fallback_type="openai"):
+    """Log why the primary provider is being skipped for the fallback"""
+    primary, fallback = primary_type.capitalize(), fallback_type.capitalize()
+    if error.error_class == CIRCUIT_OPEN:
+        logging.warning(f"{primary} circuit breaker is open, routing straight to {fallback}...")
+    elif error.error_class in FALLBACK_IMMEDIATELY:
+        logging.warning(f"{primary} not usable ({error.error_class}), immediately falling back to {fallback}...")
+    else:
+        logging.info(f"Falling back to {fallback}...")
+
+def estimate_prompt_tokens(input_data):
+    """Rough prompt size (about 4 characters per token) for the rate limiter and hedging cost counters"""
+    return sum(len(str(value)) for value in input_data.values()) // 4
+
+async def ainvoke_llm_with_fallback_data(chain, primary_llm, fallback_llm, primary_type, input_data=None):
     """
-    Invoke LLM chain with fallback mechanism
+    Async version of invoke_llm_with_fallback_data. Uses the LLM clients' native async calls
+    (ainvoke), so a waiting chat doesn't hold a thread and one worker can keep many chats in flight.
+    With LLM_HEDGING_ENABLED a slow primary call is hedged with the same prompt to the fallback
+    provider (Gemini and OpenAI by default).
     :param chain: The LangChain chain to invoke
     :param primary_llm: Primary LLM instance
     :param fallback_llm: Fallback LLM instance
-    :param primary_type: Type of primary LLM ("gemini" or "openai")
+    :param primary_type: Provider name of the primary LLM ("gemini", "openai", "fake")
+    :param input_data: Data to pass to the chain
     :return: tuple (result, used_model_type)
     """
+    if input_data is None:
+        input_data = {}
+
+    fallback_type = get_fallback_provider_name()
     try:
-        # Try primary LLM (Gemini)
-        if primary_type == "gemini":
-            logging.info("Attempting to use Gemini API...")
-            result = chain.invoke({})
-            logging.info("Gemini API call successful")
-            return result, "gemini"
+        logging.info(f"Attempting to use {primary_type.capitalize()} API (async)...")
+        if LLM_HEDGING_ENABLED and fallback_llm is not None and primary_type != fallback_type:
+            # Send the same prompt to the fallback too if the primary is slower than usual
+            fallback_chain = build_fallback_chain(chain, fallback_llm)
+            result, winner = await get_llm_hedger(primary_type).run(
+                lambda: acall_with_retries(primary_type, chain.ainvoke, input_data,
+                                           estimated_tokens=estimate_prompt_tokens(input_data)),
+                lambda: acall_with_retries(fallback_type, fallback_chain.ainvoke, input_data,
+                                           estimated_tokens=estimate_prompt_tokens(input_data)),
+                prompt_tokens=estimate_prompt_tokens(input_data)
+            )
+            used_model = primary_type if winner == "primary" else f"{fallback_type}_hedge"
         else:
-            # Primary is already OpenAI
-            logging.info("Using OpenAI API as primary...")
-            result = chain.invoke({})
-            logging.info("OpenAI API call successful")
-            return result, "openai"
-            
+            result = await acall_with_retries(primary_type, chain.ainvoke, input_data,
+                                              estimated_tokens=estimate_prompt_tokens(input_data))
+            used_model = primary_type
+        logging.info(f"{used_model} API call successful")
+        return result, used_model
+
+    except HedgedCallError:
+        # Both providers were already tried
+        raise
     except Exception as e:
-        error_msg = str(e)
-        logging.error(f"{primary_type.capitalize()} API call failed: {error_msg}")
-        
-        # Check for specific Gemini errors that indicate immediate fallback
-        gemini_fallback_errors = [
-            "404",
-            "not found",
-            "not supported",
-            "models/gemini-pro is not found",
-            "api version",
-            "NotFound"
-        ]
-        
-        should_fallback_immediately = any(err in error_msg for err in gemini_fallback_errors)
-        
-        if fallback_llm is not None and primary_type == "gemini":
+        error = classify_error(e, primary_type)
+        logging.error(f"{primary_type.capitalize()} API call failed ({error.error_class}): {error}")
+
+        if fallback_llm is not None and primary_type != fallback_type:
             try:
-                if should_fallback_immediately:
-                    logging.warning("Gemini model not available, immediately falling back to OpenAI...")
-                else:
-                    logging.info("Falling back to OpenAI ChatGPT...")
-                    
-                # Extract the prompt template from the original chain
-                # and create a new chain with the fallback LLM
-                chain_steps = list(chain.steps) if hasattr(chain, 'steps') else []
-                if chain_steps:
-                    # Get the prompt template (first step) and output parser (last step)  
-                    prompt_template = chain_steps[0]
-                    output_parser = chain_steps[-1] if len(chain_steps) > 2 else StrOutputParser()
-                    fallback_chain = prompt_template | fallback_llm | output_parser
-                else:
-                    # If we can't extract steps, create a simple fallback chain
-                    from langchain.prompts import PromptTemplate
-                    from langchain_core.output_parsers import StrOutputParser
-                    fallback_chain = PromptTemplate(template="{input}", input_variables=["input"]) | fallback_llm | StrOutputParser()
-                
-                result = fallback_chain.invoke({})
-                logging.info("OpenAI fallback successful")
-                return result, "openai_fallback"
-                
+                log_fallback_reason(error, primary_type, fallback_type)
+                fallback_chain = build_fallback_chain(chain, fallback_llm)
+                result = await acall_with_retries(fallback_type, fallback_chain.ainvoke, input_data,
+                                                  estimated_tokens=estimate_prompt_tokens(input_data))
+                logging.info(f"{fallback_type.capitalize()} fallback successful")
+                return result, f"{fallback_type}_fallback"
+
             except Exception as fallback_error:
-                logging.error(f"OpenAI fallback also failed: {fallback_error}")
-                raise Exception(f"Both Gemini and OpenAI failed. Gemini: {error_msg}, OpenAI: {str(fallback_error)}")
+                logging.error(f"{fallback_type.capitalize()} fallback also failed: {fallback_error}")
+                raise Exception(f"Both {primary_type} and {fallback_type} failed. "
+                                f"{primary_type}: {error}, {fallback_type}: {str(fallback_error)}")
         else:
-            raise Exception(f"LLM call failed and no fallback available: {error_msg}")
+            raise Exception(f"LLM call failed and no fallback available: {error}")
+
+def invoke_llm_with_fallback(chain, primary_llm, fallback_llm, primary_type):
+    """
+    Invoke LLM chain with fallback mechanism
+    :param chain: The LangChain chain to invoke
+    :param primary_llm: Primary LLM instance
+    :param fallback_llm: Fallback LLM instance
+    :param primary_type: Provider name of the primary LLM ("gemini", "openai", "fake")
+    :return: tuple (result, used_model_type)
+    """
+    return invoke_llm_with_fallback_data(chain, primary_llm, fallback_llm, primary_type, {})
+
+def format_past_conversations(past_conversations):
+    """
+    Format past conversations for the system prompt
+    :param past_conversations: list of dicts with user_input and response
+    :return: the short term context string
+    """
+    if not past_conversations:
+        return NO_PAST_CONVERSATIONS
+    return "\n".join([format_turn(msg) for msg in past_conversations])
+
+def format_summaries(summaries):
+    """
+    Format chat and journal summaries for the system prompt
+    :param summaries: list of summary dicts
+    :return: the long term context string
+    """
+    if not summaries:
+        return NO_SUMMARIES
+    return "\n".join([format_summary(s) for s in summaries])
+
+def format_relevant_chunks(relevant_chunks):
+    """
+    Format retrieved therapy session excerpts for the system prompt
+    :param relevant_chunks: list of chunks from retrieve_relevant_chunks
+    :return: the retrieval context string
+    """
+    if not relevant_chunks:
+        return NO_RELEVANT_CHUNKS
+    return "\n".join([format_chunk(chunk) for chunk in relevant_chunks if chunk.get("text")])
+
+def log_context_report(report):
+    """Log the tokens each context section used of the prompt budget"""
+    sections = ", ".join(f"{name}={values['tokens']} tokens ({values['items']}/{values['available']})"
+                         for name, values in report["sections"].items())
+    logging.info(f"Chat context used {report['used']}/{report['budget']} tokens ({sections})")
+
+def build_chat_inputs(past_conversations_context, summaries_context, relevant_chunks_context,
+                      user_prompt, sentiment_score, analysis=None):
+    """
+    Build the variables of the therapist prompt for one chat turn
+    :param analysis: structured analysis of the user's message (emotions and risk), if available
+    :return: dictionary of prompt variables for the prebuilt chat chain
+    """
+    # Emotions and crisis risk from the structured analysis
+    emotions = "unavailable"
+    risk_level = "unknown"
+    if analysis:
+        emotions = ", ".join(analysis["emotions"]["labels"]) or analysis["emotions"]["top"]
+        risk_level = analysis["risk"]["level"]
+
+    return {
+        "past_conversation": past_conversations_context,
+        "user_input": user_prompt,
+        "sentiment_score": sentiment_score if sentiment_score is not None else "unavailable",
+        "summaries": summaries_context,
+        "relevant_chunks": relevant_chunks_context,
+        "emotions": emotions,
+        "risk_level": risk_level
+    }
+
+def get_chat_chain():
+    """
+    Get the prebuilt therapist chain (system prompt | primary llm | output parser)
+    :return: tuple (chain, primary_llm, fallback_llm, primary_type)
+    """
+    chain, primary_llm, fallback_llm, primary_type = get_llm_chain(
+        "chat", get_system_prompt(),
+        gemini_model="gemini-1.5-flash",
+        openai_model="gpt-4o"
+    )
+
+    if chain is None:
+        raise Exception("No LLM models are available. Please check your API keys in the .env file.")
+
+    return chain, primary_llm, fallback_llm, primary_type
+
+def lookup_semantic_cache(user_prompt, chat_inputs, sentiment_score, analysis):
+    """
+    Look up a cached response to a near-duplicate prompt (see semantic_cache)
+    :param chat_inputs: prompt variables of this chat turn
+    :return: tuple (cached response or None, prompt embedding, context class); the embedding
+             and class are None when the message is not cacheable
+    """
+    cache = get_semantic_cache()
+    has_personal_history = (chat_inputs["past_conversation"] != NO_PAST_CONVERSATIONS
+                            or chat_inputs["summaries"] != NO_SUMMARIES)
+    context = context_class(user_prompt, sentiment_score, analysis, has_personal_history)
+    if context is None:
+        cache.record_ineligible()
+        return None, None, None
+
+    try:
+        embedding = embed_texts([user_prompt])[0]
+    except Exception as e:
+        logging.warning(f"Failed to embed prompt for the semantic cache: {e}")
+        return None, None, None
+
+    hit = cache.lookup(embedding, context)
+    if hit is None:
+        return None, embedding, context
+    response, similarity = hit
+    logging.info(f"Semantic cache hit ({context}, similarity {similarity:.3f})")
+    return response, embedding, context
 
 def get_results(user_prompt, username=None):
     """
@@ -393,74 +759,307 @@ def get_results(user_prompt, username=None):
     :param username: the username of the logged-in user
     :return: the response from the LLM model
     """
-    # Initialize LLM with fallback mechanism
-    primary_llm, fallback_llm, primary_type = initialize_llm_with_fallback(
-        gemini_model="gemini-1.5-flash",
-        openai_model="gpt-4o"
-    )
-    
-    if primary_llm is None:
-        raise Exception("No LLM models are available. Please check your API keys in the .env file.")
-
-    # Get system prompt
-    system_prompt = get_system_prompt()
+    # Prebuilt chain on the shared LLM clients
+    chain, primary_llm, fallback_llm, primary_type = get_chat_chain()
 
     # Short Term Context - Last 10 conversation for this user (with error handling)
     try:
         past_conversations = get_past_conversations(limit=10, username=username)
-        past_conversations_context = "\n".join([f"user_input: {msg['user_input']}\nresponse: {msg['response']}"
-                                                for msg in past_conversations])
     except Exception as e:
         logging.warning(f"Failed to get past conversations: {e}")
-        past_conversations_context = "No past conversations available."
+        past_conversations = []
 
-    # Long Term context - All summaries (with error handling)
+    # Long Term context - This user's daily summaries (with error handling)
     try:
-        summaries = get_all_summaries()
-        summaries_context = "\n".join([
-            f"Date: {s['date']}\nOverall Mood: {s['overall_mood']}\nSentiment Score: {s['sentiment_score']}\n"
-            f"Chat Summary: {s['chat_summary']}\nJournal Summary: {s['journal_summary']}\n"
-            for s in summaries]) if summaries else "No summaries available."
+        summaries = get_all_summaries(username=username)
     except Exception as e:
         logging.warning(f"Failed to get summaries: {e}")
-        summaries_context = "No summaries available."
+        summaries = []
 
-    # Get the normalized sentiment score of the user's prompt
-    sentiment_score = analyze_sentiment(user_prompt)
+    # Similar therapy session excerpts are only retrieved by get_results_async, where the
+    # retrieval runs concurrently with the other stages and under its own timeout
+    relevant_chunks = []
 
-    # Format the system prompt with context
-    formatted_prompt = system_prompt.format(past_conversation=past_conversations_context,
-                                            user_input=user_prompt,
-                                            sentiment_score=sentiment_score,
-                                            summaries=summaries_context)
+    # Keep the context within the token budget: latest turns, then summaries, then excerpts
+    past_conversations_context, summaries_context, relevant_chunks_context, context_report = build_chat_context(
+        past_conversations, summaries, relevant_chunks, user_prompt)
+    log_context_report(context_report)
 
-    # Create a prompt template
-    prompt = PromptTemplate(
-        template=formatted_prompt,
-        input_variables=[]
-    )
+    # Get the normalized sentiment score (and emotions / risk) of the user's prompt
+    sentiment_score, analysis = analyze_message(user_prompt)
 
-    # Create an output parser
-    output_parser = StrOutputParser()
+    chat_inputs = build_chat_inputs(past_conversations_context, summaries_context,
+                                    relevant_chunks_context, user_prompt, sentiment_score, analysis)
 
-    # Define the chain of operations
-    chain = prompt | primary_llm | output_parser
+    # Serve near-duplicate prompts from the semantic cache (opt-in)
+    result, embedding, context = None, None, None
+    if SEMANTIC_CACHE_ACTIVE:
+        result, embedding, context = lookup_semantic_cache(user_prompt, chat_inputs, sentiment_score, analysis)
 
-    # Invoke the chain with fallback mechanism  
-    result, used_model = invoke_llm_with_fallback_data(chain, primary_llm, fallback_llm, primary_type, {})
+    if result is not None:
+        used_model = "semantic_cache"
+    else:
+        # Invoke the chain with fallback mechanism
+        result, used_model = invoke_llm_with_fallback_data(chain, primary_llm, fallback_llm, primary_type, chat_inputs)
+        if embedding is not None:
+            get_semantic_cache().store(user_prompt, embedding, context, result)
     
     # Log which model was used
     logging.info(f"Response generated using: {used_model}")
 
     # Upload the chat in the conversation collection with username (with local storage fallback)
     try:
-        upload_chat_in_conversation(user_prompt, sentiment_score, result, username)
+        upload_chat_in_conversation(user_prompt, sentiment_score, result, username, analysis=analysis)
     except Exception as e:
         logging.warning(f"Failed to save chat conversation: {e}")
         # Don't fail the whole chat if saving fails
 
     return result
 
+# Per-stage timeouts (seconds) for the async chat pipeline
+CHAT_STAGE_TIMEOUTS = {
+    "past_conversations": float(os.getenv("CHAT_TIMEOUT_PAST_CONVERSATIONS", "3")),
+    "summaries": float(os.getenv("CHAT_TIMEOUT_SUMMARIES", "2")),
+    "sentiment": float(os.getenv("CHAT_TIMEOUT_SENTIMENT", "5")),  # sentiment, emotion and risk analysis
+    "retrieval": float(os.getenv("CHAT_TIMEOUT_RETRIEVAL", "3"))
+}
+
+# Stages the prompt can do without: they only get the time that isn't kept for the LLM call
+OPTIONAL_CHAT_STAGES = ("summaries", "retrieval")
+
+# Bounded pool for the blocking chat context stages (MongoDB, Weaviate). A stage that times out
+# keeps its thread until the backend call gives up, so a hung backend fills this pool instead
+# of the default one the rest of the app uses
+CHAT_CONTEXT_WORKERS = int(os.getenv("CHAT_CONTEXT_WORKERS", "8"))
+chat_context_executor = create_inference_executor(
+    pool_type="thread",
+    max_workers=CHAT_CONTEXT_WORKERS,
+    name="chat-context"
+)
+
+async def run_blocking(func, *args, executor=None, **kwargs):
+    """
+    Run a blocking function in a thread pool, with the caller's context
+    (so the request deadline is seen there too)
+    :param executor: the pool (default: the event loop's default thread pool)
+    :return: the function's result
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, func, *args, **kwargs))
+
+async def run_blocking_stage(func, *args, **kwargs):
+    """
+    Run a blocking chat context stage in the bounded chat context pool
+    :return: the function's result
+    """
+    return await run_blocking(func, *args, executor=chat_context_executor, **kwargs)
+
+async def run_chat_stage(name, awaitable, default):
+    """
+    Await one chat pipeline stage with its timeout, shortened to the request's deadline.
+    A stage that fails or times out returns the default instead of failing the chat, and an
+    optional stage is skipped when the time left must be kept for the LLM call.
+    The stage runs under a deadline of its timeout, so the MongoDB (mongo_timeout_ms) and
+    Weaviate (retrieve_relevant_chunks) calls it makes give up when it does.
+    :param name: stage name (key of CHAT_STAGE_TIMEOUTS)
+    :param awaitable: the stage coroutine
+    :param default: value to use if the stage fails
+    :return: tuple (result, elapsed seconds)
+    """
+    start_time = time.perf_counter()
+    reserve = REQUEST_DEADLINE_LLM_RESERVE_SECONDS if name in OPTIONAL_CHAT_STAGES else 0.0
+    timeout = stage_timeout(CHAT_STAGE_TIMEOUTS[name], reserve)
+    if timeout <= 0:
+        # Close the coroutine that will never run
+        awaitable.close()
+        record_skipped_stage(name)
+        return default, 0.0
+    try:
+        with request_deadline(timeout):
+            result = await asyncio.wait_for(awaitable, timeout=timeout)
+    except asyncio.TimeoutError:
+        logging.warning(f"Chat stage '{name}' timed out after {timeout:.2f}s")
+        result = default
+    except Exception as e:
+        logging.warning(f"Chat stage '{name}' failed: {e}")
+        result = default
+    return result, time.perf_counter() - start_time
+
+async def gather_chat_context_async(user_prompt, username=None):
+    """
+    Fetch everything the chat prompt needs. Past conversations, summaries, sentiment and
+    retrieval don't depend on each other, so they run concurrently, each with its timeout.
+    :param user_prompt: the user's input query
+    :param username: the username of the logged-in user
+    :return: tuple (prompt variables, sentiment score, structured analysis)
+    """
+    start_time = time.perf_counter()
+    stages = await asyncio.gather(
+        run_chat_stage("past_conversations",
+                       run_blocking_stage(get_past_conversations, limit=10, username=username), []),
+        run_chat_stage("summaries", run_blocking_stage(get_all_summaries, username=username), []),
+        run_chat_stage("sentiment", analyze_message_async(user_prompt), (None, None)),
+        run_chat_stage("retrieval", run_blocking_stage(retrieve_relevant_chunks, user_prompt), [])
+    )
+    (past_conversations, _), (summaries, _), ((sentiment_score, analysis), _), (relevant_chunks, _) = stages
+
+    stage_timings = ", ".join(f"{name}={elapsed * 1000:.0f}ms"
+                              for name, (_, elapsed) in zip(CHAT_STAGE_TIMEOUTS, stages))
+    logging.info(f"Chat context ready in {(time.perf_counter() - start_time) * 1000:.0f}ms ({stage_timings})")
+
+    past_conversations_context, summaries_context, relevant_chunks_context, context_report = build_chat_context(
+        past_conversations, summaries, relevant_chunks, user_prompt)
+    log_context_report(context_report)
+
+    chat_inputs = build_chat_inputs(past_conversations_context, summaries_context, relevant_chunks_context,
+                                    user_prompt, sentiment_score, analysis)
+    return chat_inputs, sentiment_score, analysis
+
+async def save_chat_async(user_prompt, sentiment_score, result, username=None, analysis=None):
+    """
+    Upload the chat in the conversation collection without blocking the event loop.
+    Saving failures are logged and never fail the chat.
+    """
+    try:
+        await run_blocking(upload_chat_in_conversation, user_prompt, sentiment_score, result, username,
+                           analysis=analysis)
+    except Exception as e:
+        logging.warning(f"Failed to save chat conversation: {e}")
+
+async def get_results_async(user_prompt, username=None):
+    """
+    Async version of get_results. The prompt context is gathered concurrently and the LLM
+    is called as soon as the slowest stage finishes (or times out).
+    :param user_prompt: the user's input query
+    :param username: the username of the logged-in user
+    :return: the response from the LLM model
+    """
+    # Prebuilt chain on the shared LLM clients
+    chain, primary_llm, fallback_llm, primary_type = get_chat_chain()
+
+    chat_inputs, sentiment_score, analysis = await gather_chat_context_async(user_prompt, username)
+
+    # Serve near-duplicate prompts from the semantic cache (opt-in)
+    result, embedding, context = None, None, None
+    if SEMANTIC_CACHE_ACTIVE:
+        result, embedding, context = await run_blocking(lookup_semantic_cache, user_prompt, chat_inputs,
+                                                        sentiment_score, analysis)
+
+    if result is not None:
+        used_model = "semantic_cache"
+    else:
+        # Invoke the chain with fallback mechanism (native async, no thread held while waiting)
+        result, used_model = await ainvoke_llm_with_fallback_data(chain, primary_llm, fallback_llm,
+                                                                  primary_type, chat_inputs)
+        if embedding is not None:
+            get_semantic_cache().store(user_prompt, embedding, context, result)
+
+    # Log which model was used
+    logging.info(f"Response generated using: {used_model}")
+
+    # Upload the chat in the conversation collection with username (with local storage fallback)
+    await save_chat_async(user_prompt, sentiment_score, result, username, analysis=analysis)
+
+    return result
+
+async def astream_with_breaker(provider, stream, estimated_tokens=0):
+    """
+    Consume a stream under a permit of the provider's limiter and through its circuit breaker.
+    The stream counts as one call that succeeds when it completes; its latency is the time to
+    the first chunk. The permit is held until the stream ends or is closed (aclose), which also
+    closes the provider's stream.
+    :param provider: provider name (gemini, openai)
+    :param stream: async iterator that has not been started yet (e.g. chain.astream(...))
+    :param estimated_tokens: estimated prompt tokens, charged to the provider's token rate
+    :return: async iterator of chunks
+    :raises OverloadedError: if the limiter has no permit before the request's deadline
+    """
+    limiter = get_llm_limiter(provider) if LLM_LIMITER_ENABLED else None
+    if limiter is not None:
+        await limiter.acquire_async(estimated_tokens, get_deadline())
+
+    breaker = get_circuit_breaker(provider)
+    if not breaker.allow_request():
+        if limiter is not None:
+            limiter.release(0, CANCELLED)
+        raise CircuitOpenError(f"Circuit breaker for {provider} is open")
+
+    start_time = time.perf_counter()
+    first_chunk_latency = None
+
+    def latency():
+        return first_chunk_latency if first_chunk_latency is not None else time.perf_counter() - start_time
+
+    outcome = CANCELLED
+    try:
+        async for chunk in stream:
+            if first_chunk_latency is None:
+                first_chunk_latency = time.perf_counter() - start_time
+            yield chunk
+        outcome = SUCCESS
+    except ProviderNeutralError:
+        # Cut off by the client's deadline, or no key or no text: says nothing about the provider
+        breaker.release()
+        raise
+    except Exception as e:
+        outcome = limiter_outcome(e)
+        breaker.record_failure(time.perf_counter() - start_time)
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    finally:
+        if limiter is not None:
+            limiter.release(latency(), outcome)
+        # If we stopped early (e.g. the client disconnected), close the provider's stream and its connection now
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    breaker.record_success(latency())
+
+async def stream_results_async(user_prompt, username=None):
+    """
+    Streaming version of get_results_async: yields the response in chunks as the LLM
+    generates them (LangChain astream), and saves the full response once it is complete.
+    Falls back to the fallback provider (OpenAI) if the primary (Gemini) fails before producing any text.
+    :param user_prompt: the user's input query
+    :param username: the username of the logged-in user
+    :return: async iterator of response text chunks
+    """
+    chain, primary_llm, fallback_llm, primary_type = get_chat_chain()
+
+    chat_inputs, sentiment_score, analysis = await gather_chat_context_async(user_prompt, username)
+
+    chunks = []
+    fallback_type = get_fallback_provider_name()
+    try:
+        async for chunk in astream_with_breaker(primary_type, chain.astream(chat_inputs),
+                                                estimated_tokens=estimate_prompt_tokens(chat_inputs)):
+            chunks.append(chunk)
+            yield chunk
+        used_model = primary_type
+    except Exception as e:
+        # Once text has been sent it can't be replaced by another model's answer
+        if chunks or fallback_llm is None or primary_type == fallback_type:
+            raise
+        logging.error(f"{primary_type.capitalize()} streaming failed, falling back to {fallback_type}: {e}")
+        async for chunk in astream_with_breaker(fallback_type,
+                                              build_fallback_chain(chain, fallback_llm).astream(chat_inputs),
+                                              estimated_tokens=estimate_prompt_tokens(chat_inputs)):
+            chunks.append(chunk)
+            yield chunk
+        used_model = f"{fallback_type}_fallback"
+
+    logging.info(f"Streamed response generated using: {used_model}")
+    # Shielded so the chat is still saved if the client disconnects now
+    await asyncio.shield(asyncio.ensure_future(
+        save_chat_async(user_prompt, sentiment_score, "".join(chunks), username, analysis=analysis)))
+
+# Weaviate and embedding timeouts (seconds), shortened to the deadline but never below the floor
+WEAVIATE_TIMEOUT_SECONDS = 30
+WEAVIATE_MIN_TIMEOUT_SECONDS = 0.25
+
 def retrieve_relevant_chunks(user_prompt, top_k=5):
     """
     Retrieve the top-k most relevant chunks of text from Weaviate DB based on the user's prompt.
@@ -474,8 +1073,8 @@ def retrieve_relevant_chunks(user_prompt, top_k=5):
         logging.info("Weaviate not available - skipping vector search")
         return []
 
-    # Load environment variables
-    load_dotenv()
+    # Environment variables (loaded once by the LLM client registry)
+    ensure_llm_config_loaded()
     WCD_URL = os.getenv("WCD_URL")
     WCD_API_KEY = os.getenv("WCD_API_KEY")
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -490,18 +1089,23 @@ def retrieve_relevant_chunks(user_prompt, top_k=5):
         logging.warning("OPENAI_API_KEY not found - OpenAI features will be disabled")
         return []
 
+    # Give up when the retrieval stage does (run_chat_stage sets its timeout as the deadline)
+    timeout = max(stage_timeout(WEAVIATE_TIMEOUT_SECONDS), WEAVIATE_MIN_TIMEOUT_SECONDS)
+
     try:
         # Connect to Weaviate
         client = weaviate.connect_to_weaviate_cloud(
             cluster_url=WCD_URL,
-            auth_credentials=wvc.init.Auth.api_key(WCD_API_KEY)
+            auth_credentials=wvc.init.Auth.api_key(WCD_API_KEY),
+            additional_config=wvc.init.AdditionalConfig(
+                timeout=wvc.init.Timeout(init=timeout, query=timeout, insert=timeout))
         )
     except Exception as e:
         logging.error(f"Failed to connect to Weaviate: {e}")
         return []
 
-    # Initialize OpenAI LangChain Embeddings
-    embedder = OpenAIEmbeddings()
+    # Initialize OpenAI LangChain Embeddings (no retries: the stage has no time for them)
+    embedder = OpenAIEmbeddings(request_timeout=timeout, max_retries=0)
 
     try:
         # Convert User Prompt to OpenAI Embedding
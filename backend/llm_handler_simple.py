@@ -4,9 +4,23 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from llm_providers import get_llm_provider, get_primary_provider_name, get_fallback_provider_name, NO_PROVIDER
 import os
 import logging
 
+PRIMARY_TEMPLATE = """You are a compassionate therapist. Be calm, gentle, understanding and empathetic. 
+                Listen to the user and provide supportive responses. Do not give solutions, just resonate and be supportive.
+                
+                User: {user_input}
+                
+                Therapist:"""
+
+FALLBACK_TEMPLATE = """You are a compassionate therapist. Be calm, gentle, understanding and empathetic.
+                
+                User: {user_input}
+                
+                Therapist:"""
+
 def initialize_gemini_llm(model="gemini-1.5-flash"):
     """Initialize Gemini LLM"""
     try:
@@ -36,52 +50,49 @@ def initialize_openai_llm(model="gpt-4o"):
         logging.error(f"Failed to initialize OpenAI: {e}")
         return None
 
+def initialize_provider_llm(name):
+    """
+    Initialize the chat model of a provider: Gemini and OpenAI keep this handler's own models
+    and settings, other providers (e.g. fake) build theirs from llm_providers
+    """
+    if name == "gemini":
+        return initialize_gemini_llm()
+    if name == "openai":
+        return initialize_openai_llm()
+    return get_llm_provider(name).build_chat_model()
+
 def get_simple_response(user_prompt):
-    """Get response from Gemini with fallback, no MongoDB"""
+    """Get response from the primary provider (Gemini) with fallback (OpenAI), no MongoDB"""
+    load_dotenv()
+    primary = get_primary_provider_name()
     try:
-        # Try Gemini first
-        gemini = initialize_gemini_llm()
-        if gemini:
-            print(f"Using Gemini for: {user_prompt[:50]}...")
+        # Try the primary provider first
+        llm = initialize_provider_llm(primary)
+        if llm:
+            print(f"Using {primary} for: {user_prompt[:50]}...")
             
-            prompt = PromptTemplate(
-                template="""You are a compassionate therapist. Be calm, gentle, understanding and empathetic. 
-                Listen to the user and provide supportive responses. Do not give solutions, just resonate and be supportive.
-                
-                User: {user_input}
-                
-                Therapist:""",
-                input_variables=["user_input"]
-            )
-            
-            chain = prompt | gemini | StrOutputParser()
+            prompt = PromptTemplate(template=PRIMARY_TEMPLATE, input_variables=["user_input"])
+            chain = prompt | llm | StrOutputParser()
             response = chain.invoke({"user_input": user_prompt})
-            print(f"✅ Gemini response received")
+            print(f"✅ {primary} response received")
             return response
             
     except Exception as e:
-        print(f"❌ Gemini failed: {e}")
+        print(f"❌ {primary} failed: {e}")
         
-    # Fallback to OpenAI
+    # Fallback provider
+    fallback = get_fallback_provider_name()
     try:
-        openai = initialize_openai_llm()
-        if openai:
-            print("🔄 Falling back to OpenAI...")
-            
-            prompt = PromptTemplate(
-                template="""You are a compassionate therapist. Be calm, gentle, understanding and empathetic.
-                
-                User: {user_input}
-                
-                Therapist:""",
-                input_variables=["user_input"]
-            )
+        llm = initialize_provider_llm(fallback) if fallback != NO_PROVIDER else None
+        if llm:
+            print(f"🔄 Falling back to {fallback}...")
             
-            chain = prompt | openai | StrOutputParser()
+            prompt = PromptTemplate(template=FALLBACK_TEMPLATE, input_variables=["user_input"])
+            chain = prompt | llm | StrOutputParser()
             response = chain.invoke({"user_input": user_prompt})
-            print(f"✅ OpenAI response received")
+            print(f"✅ {fallback} response received")
             return response
             
     except Exception as e:
-        print(f"❌ OpenAI also failed: {e}")
-        return "I'm sorry, I'm having trouble connecting right now. Please try again in a moment."
+        print(f"❌ {fallback} also failed: {e}")
+    return "I'm sorry, I'm having trouble connecting right now. Please try again in a moment."
@@ -0,0 +1,198 @@
+"""
+Hedged LLM requests (opt-in)
+Cuts tail latency by sending the same prompt to the fallback provider when the primary
+hasn't answered within a percentile of its recent latency. Whichever answers first wins
+and the other call is cancelled. Every hedge is an extra (partly) billed call, so hedge rate
+and the estimated extra prompt tokens are counted.
+"""
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import os
+import time
+import logging
+import threading
+
+from llm_providers import get_primary_provider_name
+
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+# Hedge after this percentile of the primary's recent latency...
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+# ...but never sooner than this, and use a fixed delay until enough latencies are known
+LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_MIN_DELAY_SECONDS", "1"))
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SECONDS", "8"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# Number of recent primary latencies kept for the percentile
+LATENCY_WINDOW = 200
+
+
+class HedgedCallError(Exception):
+    """Raised when both the primary and the hedged call failed"""
+    pass
+
+
+class LLMHedger:
+    """
+    Races a slow primary call against a hedged call to the fallback provider
+    """
+
+    def __init__(self, name: str = "llm", percentile: float = LLM_HEDGE_PERCENTILE,
+                 min_delay: float = LLM_HEDGE_MIN_DELAY_SECONDS,
+                 default_delay: float = LLM_HEDGE_DEFAULT_DELAY_SECONDS,
+                 min_samples: int = LLM_HEDGE_MIN_SAMPLES):
+        """
+        :param name: name used in logs
+        :param percentile: percentile of recent primary latency after which to hedge
+        :param min_delay: lower bound of the hedge delay in seconds
+        :param default_delay: hedge delay while fewer than min_samples latencies are known
+        :param min_samples: latencies needed before the percentile is used
+        """
+        self.name = name
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.min_samples = max(int(min_samples), 1)
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+        # Metrics
+        self._requests = 0
+        self._hedged = 0
+        self._primary_wins = 0
+        self._hedge_wins = 0
+        self._both_failed = 0
+        self._cancelled = 0
+        self._prompt_tokens = 0
+        self._extra_prompt_tokens = 0
+
+    def _record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def hedge_delay(self) -> float:
+        """
+        Current hedge delay: the configured percentile of recent primary latency
+        :return: seconds to wait for the primary before hedging
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return self.default_delay
+        index = min(int(len(latencies) * self.percentile), len(latencies) - 1)
+        return max(latencies[index], self.min_delay)
+
+    async def run(self, primary: Callable[[], Awaitable[Any]], hedge: Callable[[], Awaitable[Any]],
+                  prompt_tokens: int = 0) -> Tuple[Any, str]:
+        """
+        Run the primary call and hedge it if it is slow
+        :param primary: coroutine function calling the primary provider
+        :param hedge: coroutine function calling the fallback provider with the same prompt
+        :param prompt_tokens: estimated prompt size, counted as overhead when a hedge is sent
+        :return: tuple (result, "primary" or "hedge")
+        :raises: the primary's exception if it fails before the hedge is sent (the caller then
+                 falls back as usual), HedgedCallError if both calls failed
+        """
+        with self._lock:
+            self._requests += 1
+            self._prompt_tokens += prompt_tokens
+
+        start_time = time.perf_counter()
+        primary_task = asyncio.ensure_future(primary())
+        tasks = {primary_task}
+        try:
+            delay = self.hedge_delay()
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                result = primary_task.result()
+                self._record_latency(time.perf_counter() - start_time)
+                with self._lock:
+                    self._primary_wins += 1
+                return result, "primary"
+
+            logging.info(f"{self.name}: primary slower than {delay:.2f}s, sending hedged request")
+            with self._lock:
+                self._hedged += 1
+                self._extra_prompt_tokens += prompt_tokens
+            hedge_task = asyncio.ensure_future(hedge())
+            tasks.add(hedge_task)
+
+            errors = {}
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    winner = "primary" if task is primary_task else "hedge"
+                    if task.exception() is not None:
+                        errors[winner] = task.exception()
+                        continue
+                    if winner == "primary":
+                        self._record_latency(time.perf_counter() - start_time)
+                    with self._lock:
+                        if winner == "primary":
+                            self._primary_wins += 1
+                        else:
+                            self._hedge_wins += 1
+                    return task.result(), winner
+
+            with self._lock:
+                self._both_failed += 1
+            raise HedgedCallError(f"Primary and hedged calls both failed. "
+                                  f"Primary: {errors.get('primary')}, hedge: {errors.get('hedge')}")
+        finally:
+            for task in tasks:
+                if not task.done():
+                    if task is primary_task:
+                        # The primary took at least this long; keeps the percentile from drifting low
+                        self._record_latency(time.perf_counter() - start_time)
+                    task.cancel()
+                    with self._lock:
+                        self._cancelled += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get hedging counters
+        :return: dictionary with hedge rate, wins and the cost overhead of hedged calls
+        """
+        delay = self.hedge_delay()
+        with self._lock:
+            requests = self._requests
+            return {
+                "requests": requests,
+                "hedged": self._hedged,
+                "hedge_rate": round(self._hedged / requests, 4) if requests else 0,
+                "primary_wins": self._primary_wins,
+                "hedge_wins": self._hedge_wins,
+                "both_failed": self._both_failed,
+                "cancelled": self._cancelled,
+                # Prompt tokens sent by hedges relative to the tokens of all primary calls
+                "extra_prompt_tokens": self._extra_prompt_tokens,
+                "cost_overhead": (round(self._extra_prompt_tokens / self._prompt_tokens, 4)
+                                  if self._prompt_tokens else 0),
+                "hedge_delay_ms": round(delay * 1000, 1),
+                "latency_samples": len(self._latencies)
+            }
+
+
+_hedgers: Dict[str, LLMHedger] = {}
+_hedgers_lock = threading.Lock()
+
+
+def get_llm_hedger(provider: Optional[str] = None) -> LLMHedger:
+    """
+    Get the process-wide hedger of the chat LLM calls to a primary provider
+    :param provider: primary provider name (default: the configured primary provider)
+    :return: the hedger, whose latency window only has that provider's calls
+    """
+    provider = provider or get_primary_provider_name()
+    hedger = _hedgers.get(provider)
+    if hedger is None:
+        with _hedgers_lock:
+            hedger = _hedgers.setdefault(provider, LLMHedger(provider))
+    return hedger
+
+
+def get_hedging_stats() -> Dict[str, Any]:
+    """Get whether hedging is enabled and its counters"""
+    return {"enabled": LLM_HEDGING_ENABLED, **get_llm_hedger().get_stats()}
@@ -0,0 +1,257 @@
+"""
+LLM provider interface and registry
+A provider builds the LangChain chat model of a model name from the loaded configuration, so
+the client registry, the chat chains, retries, circuit breakers and limiters work the same for
+every provider (they key their state by provider name). A provider may also have a text client
+(complete / acomplete / astream of a plain prompt) that serves the direct API path in place of
+the Gemini HTTP API.
+
+Built-in providers:
+- gemini: Google Gemini through langchain-google-genai
+- openai: OpenAI through langchain-openai
+- fake: the deterministic in-process fake of fake_llm.py (no network; latency distribution,
+  token rate and error rate from FAKE_LLM_* settings)
+LLM_PRIMARY_PROVIDER and LLM_FALLBACK_PROVIDER choose the providers (fallback "none" disables it).
+Other providers can be added with register_llm_provider.
+"""
+from langchain_openai import ChatOpenAI
+from langchain_google_genai import ChatGoogleGenerativeAI
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+import os
+import logging
+import threading
+
+from fake_llm import FakeLLM, FakeChatModel
+
+DEFAULT_PRIMARY_PROVIDER = "gemini"
+DEFAULT_FALLBACK_PROVIDER = "openai"
+NO_PROVIDER = "none"
+
+# Environment variables that choose the providers
+PROVIDER_SELECTION_KEYS = ("LLM_PRIMARY_PROVIDER", "LLM_FALLBACK_PROVIDER")
+
+
+class LLMProvider(ABC):
+    """
+    Base class of LLM providers (a provider that doesn't implement build_chat_model can't be
+    instantiated, so it fails when it is registered)
+    """
+    name = ""
+    default_model = ""
+    # Environment variables the provider's clients are built from (a change rebuilds them)
+    config_keys: Tuple[str, ...] = ()
+
+    def is_configured(self) -> bool:
+        """Check whether the provider has the configuration it needs (e.g. an API key)"""
+        return True
+
+    @abstractmethod
+    def build_chat_model(self, model: Optional[str] = None) -> Any:
+        """
+        Build a LangChain chat model from the loaded configuration
+        :param model: model name (default: the provider's default model)
+        :return: the chat model, or None if it can't be built
+        """
+
+    def get_text_client(self) -> Any:
+        """
+        Get the client of the direct API path, with complete(prompt), acomplete(prompt) and
+        astream(prompt), if the provider has one
+        :return: the text client or None
+        """
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get the provider's state for monitoring"""
+        return {"configured": self.is_configured()}
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini (the direct API path is direct_gemini_handler's own HTTP client)"""
+    name = "gemini"
+    default_model = "gemini-1.5-flash"
+    config_keys = ("GOOGLE_API_KEY",)
+
+    def is_configured(self) -> bool:
+        return bool(os.getenv("GOOGLE_API_KEY"))
+
+    def build_chat_model(self, model: Optional[str] = None) -> Any:
+        """
+        :param model: Gemini model name (gemini-1.5-flash, gemini-1.5-pro, gemini-2.0-flash-exp)
+        """
+        try:
+            google_api_key = os.getenv("GOOGLE_API_KEY")
+            if not google_api_key:
+                logging.warning("GOOGLE_API_KEY not found in environment variables")
+                return None
+
+            return ChatGoogleGenerativeAI(
+                model=model or self.default_model,
+                google_api_key=google_api_key,
+                temperature=0.7,
+                convert_system_message_to_human=True,  # Gemini doesn't support system messages
+                max_retries=1,  # Single attempt; retries are budgeted by llm_retry
+                timeout=30  # 30 second timeout
+            )
+
+        except Exception as e:
+            logging.error(f"Failed to initialize Gemini LLM: {e}")
+            return None
+
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI chat models"""
+    name = "openai"
+    default_model = "gpt-4o-mini"
+    config_keys = ("OPENAI_API_KEY",)
+
+    def is_configured(self) -> bool:
+        return bool(os.getenv("OPENAI_API_KEY"))
+
+    def build_chat_model(self, model: Optional[str] = None) -> Any:
+        """
+        :param model: OpenAI model name (gpt-4o, gpt-4o-mini)
+        """
+        try:
+            openai_api_key = os.getenv("OPENAI_API_KEY")
+            if not openai_api_key:
+                logging.warning("OPENAI_API_KEY not found in environment variables")
+                return None
+
+            return ChatOpenAI(
+                model=model or self.default_model,
+                openai_api_key=openai_api_key,
+                temperature=0.7,
+                max_retries=0,  # Retries are budgeted by llm_retry
+                timeout=30
+            )
+
+        except Exception as e:
+            logging.error(f"Failed to initialize OpenAI LLM: {e}")
+            return None
+
+
+class FakeProvider(LLMProvider):
+    """
+    The in-process fake LLM, for load tests and benchmarks without network or API keys.
+    The chat models and the text client share one FakeLLM per configuration.
+    """
+    name = "fake"
+    default_model = "fake-chat"
+    config_keys = ("FAKE_LLM_LATENCY_MS", "FAKE_LLM_LATENCY_SIGMA", "FAKE_LLM_TOKENS_PER_SECOND",
+                   "FAKE_LLM_OUTPUT_TOKENS", "FAKE_LLM_ERROR_RATE", "FAKE_LLM_ERROR_CLASS", "FAKE_LLM_SEED")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fake: Optional[FakeLLM] = None
+        self._config: Optional[Tuple] = None
+
+    def _read_config(self) -> Tuple:
+        return (float(os.getenv("FAKE_LLM_LATENCY_MS", "800")),
+                float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.3")),
+                float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "50")),
+                int(os.getenv("FAKE_LLM_OUTPUT_TOKENS", "120")),
+                float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+                os.getenv("FAKE_LLM_ERROR_CLASS", "transient"),
+                int(os.getenv("FAKE_LLM_SEED", "42")))
+
+    def get_fake(self) -> FakeLLM:
+        """Get the FakeLLM of the current configuration, rebuilding it when the settings changed"""
+        config = self._read_config()
+        with self._lock:
+            if self._fake is None or config != self._config:
+                latency_ms, sigma, tokens_per_second, output_tokens, error_rate, error_class, seed = config
+                self._fake = FakeLLM(self.name, latency_ms, sigma, tokens_per_second, output_tokens,
+                                     error_rate, error_class, seed)
+                self._config = config
+            return self._fake
+
+    def build_chat_model(self, model: Optional[str] = None) -> Any:
+        try:
+            return FakeChatModel(fake=self.get_fake())
+        except Exception as e:
+            logging.error(f"Failed to initialize the fake LLM: {e}")
+            return None
+
+    def get_text_client(self) -> Any:
+        return self.get_fake()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            fake = self._fake
+        return {"configured": True, **(fake.get_stats() if fake is not None else {})}
+
+
+_providers: Dict[str, LLMProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def register_llm_provider(provider: LLMProvider):
+    """
+    Register a provider under its name (replacing a provider of the same name)
+    :param provider: the provider
+    """
+    with _providers_lock:
+        _providers[provider.name] = provider
+
+
+def get_llm_provider(name: str) -> LLMProvider:
+    """
+    Get a registered provider
+    :param name: provider name (gemini, openai, fake, ...)
+    :return: the provider
+    :raises ValueError: if no provider has this name
+    """
+    provider = _providers.get(name)
+    if provider is None:
+        raise ValueError(f"Unknown LLM provider '{name}' (registered: {', '.join(sorted(_providers))})")
+    return provider
+
+
+def get_primary_provider_name() -> str:
+    """Name of the configured primary provider"""
+    return os.getenv("LLM_PRIMARY_PROVIDER", DEFAULT_PRIMARY_PROVIDER).strip().lower()
+
+
+def get_fallback_provider_name() -> str:
+    """Name of the configured fallback provider ("none" when there is no fallback)"""
+    name = os.getenv("LLM_FALLBACK_PROVIDER", DEFAULT_FALLBACK_PROVIDER).strip().lower()
+    # A provider can't be its own fallback
+    return NO_PROVIDER if name == get_primary_provider_name() else name
+
+
+def get_primary_provider() -> LLMProvider:
+    """Get the configured primary provider"""
+    return get_llm_provider(get_primary_provider_name())
+
+
+def get_fallback_provider() -> Optional[LLMProvider]:
+    """Get the configured fallback provider, or None"""
+    name = get_fallback_provider_name()
+    return None if name == NO_PROVIDER else get_llm_provider(name)
+
+
+def get_provider_config_keys() -> Tuple[str, ...]:
+    """Environment variables that the providers and their clients are built from"""
+    with _providers_lock:
+        providers = list(_providers.values())
+    return PROVIDER_SELECTION_KEYS + tuple(key for provider in providers for key in provider.config_keys)
+
+
+def get_llm_provider_stats() -> Dict[str, Any]:
+    """
+    Get the configured providers and the state of every registered provider
+    :return: dictionary with the primary and fallback names and per-provider stats
+    """
+    with _providers_lock:
+        providers = dict(_providers)
+    return {
+        "primary": get_primary_provider_name(),
+        "fallback": get_fallback_provider_name(),
+        "registered": {name: provider.get_stats() for name, provider in providers.items()}
+    }
+
+
+for _provider in (GeminiProvider(), OpenAIProvider(), FakeProvider()):
+    register_llm_provider(_provider)
@@ -0,0 +1,352 @@
+"""
+Adaptive concurrency and token-rate limiter for outbound LLM calls
+Each provider has a limiter that caps the calls in flight and (optionally) the prompt tokens
+sent per minute. The limits adapt AIMD-style: they shrink multiplicatively on 429s and
+latency spikes and grow additively while calls are healthy, so a burst of chats backs off
+before the provider starts rejecting it. Calls over the limit wait in a bounded FIFO queue;
+a call is rejected right away when the queue is full or it can't get a permit before its
+deadline, so it can fall back to the other provider instead of waiting in vain.
+Thread-safe, and usable from the event loop (acquire_async) and from thread pools (acquire).
+"""
+from collections import deque
+from typing import Any, Dict, Optional
+import asyncio
+import os
+import time
+import logging
+import threading
+
+from llm_errors import OverloadedError
+
+LLM_LIMITER_ENABLED = os.getenv("LLM_LIMITER_ENABLED", "true").lower() == "true"
+# Concurrency limit: starting value and the range AIMD keeps it in
+LLM_LIMITER_INITIAL_CONCURRENCY = float(os.getenv("LLM_LIMITER_INITIAL_CONCURRENCY", "8"))
+LLM_LIMITER_MIN_CONCURRENCY = float(os.getenv("LLM_LIMITER_MIN_CONCURRENCY", "1"))
+LLM_LIMITER_MAX_CONCURRENCY = float(os.getenv("LLM_LIMITER_MAX_CONCURRENCY", "32"))
+# Multiplicative decrease on a 429, and on a call slower than LATENCY_SPIKE_RATIO x the usual latency
+LLM_LIMITER_BACKOFF = float(os.getenv("LLM_LIMITER_BACKOFF", "0.5"))
+LLM_LIMITER_LATENCY_BACKOFF = float(os.getenv("LLM_LIMITER_LATENCY_BACKOFF", "0.9"))
+LLM_LIMITER_LATENCY_SPIKE_RATIO = float(os.getenv("LLM_LIMITER_LATENCY_SPIKE_RATIO", "2.5"))
+# Calls waiting for a permit, and the longest a call waits when it has no deadline of its own
+LLM_LIMITER_MAX_QUEUE = int(os.getenv("LLM_LIMITER_MAX_QUEUE", "64"))
+LLM_LIMITER_MAX_WAIT_SECONDS = float(os.getenv("LLM_LIMITER_MAX_WAIT_SECONDS", "10"))
+# Prompt tokens per minute per provider (0 for no token limit)
+LLM_LIMITER_TOKENS_PER_MINUTE = {
+    "gemini": float(os.getenv("LLM_LIMITER_TOKENS_PER_MINUTE_GEMINI", "0")),
+    "openai": float(os.getenv("LLM_LIMITER_TOKENS_PER_MINUTE_OPENAI", "0"))
+}
+
+SUCCESS = "success"
+RATE_LIMITED = "rate_limited"
+FAILURE = "failure"
+CANCELLED = "cancelled"
+
+# Latency samples needed before spikes are detected
+LATENCY_MIN_SAMPLES = 10
+LATENCY_EWMA_ALPHA = 0.1
+# Token bucket holds at most this many seconds of the token rate
+TOKEN_BURST_SECONDS = 10
+
+
+class _Waiter:
+    """A call waiting for a permit; woken from any thread"""
+    __slots__ = ("tokens", "event", "loop", "future")
+
+    def __init__(self, tokens, loop=None):
+        self.tokens = tokens
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = None
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        elif self.future is not None:
+            self.loop.call_soon_threadsafe(self._set_future, self.future)
+
+    @staticmethod
+    def _set_future(future):
+        if not future.done():
+            future.set_result(None)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limiter with a token bucket and a bounded, deadline-aware queue
+    """
+
+    def __init__(self, name: str, initial_limit: float = LLM_LIMITER_INITIAL_CONCURRENCY,
+                 min_limit: float = LLM_LIMITER_MIN_CONCURRENCY, max_limit: float = LLM_LIMITER_MAX_CONCURRENCY,
+                 tokens_per_minute: float = 0, max_queue: int = LLM_LIMITER_MAX_QUEUE,
+                 max_wait_seconds: float = LLM_LIMITER_MAX_WAIT_SECONDS):
+        """
+        :param name: provider name used in logs and status
+        :param initial_limit: starting concurrency limit
+        :param min_limit: lowest concurrency limit
+        :param max_limit: highest concurrency limit
+        :param tokens_per_minute: prompt token rate limit (0 for none)
+        :param max_queue: calls allowed to wait for a permit
+        :param max_wait_seconds: longest wait of a call without a deadline
+        """
+        self.name = name
+        self.min_limit = max(min_limit, 1.0)
+        self.max_limit = max(max_limit, self.min_limit)
+        self.max_tokens_per_minute = tokens_per_minute
+        self.max_queue = max(int(max_queue), 0)
+        self.max_wait_seconds = max_wait_seconds
+
+        self._lock = threading.Lock()
+        self._limit = min(max(initial_limit, self.min_limit), self.max_limit)
+        self._in_flight = 0
+        self._queue = deque()
+        self._latency_ewma = None
+        self._latency_samples = 0
+        self._last_decrease = 0.0
+
+        # Token bucket; its rate shrinks and grows with the concurrency limit
+        self._tokens_per_minute = tokens_per_minute
+        self._tokens = self._bucket_size()
+        self._tokens_updated = time.monotonic()
+
+        # Metrics
+        self._granted = 0
+        self._queued = 0
+        self._rejected_queue_full = 0
+        self._rejected_deadline = 0
+        self._timed_out = 0
+        self._decreases = 0
+        self._queue_wait_total = 0.0
+        self._max_queue_depth = 0
+
+    def _bucket_size(self):
+        return self._tokens_per_minute / 60 * TOKEN_BURST_SECONDS
+
+    def _refill(self, now):
+        if self._tokens_per_minute > 0:
+            elapsed = now - self._tokens_updated
+            self._tokens = min(self._tokens + elapsed * self._tokens_per_minute / 60, self._bucket_size())
+        self._tokens_updated = now
+
+    def _token_wait(self, tokens, now):
+        """Seconds until the bucket holds enough tokens (0 if it already does)"""
+        if self._tokens_per_minute <= 0:
+            return 0.0
+        self._refill(now)
+        needed = min(tokens, self._bucket_size())
+        if self._tokens >= needed:
+            return 0.0
+        return (needed - self._tokens) / (self._tokens_per_minute / 60)
+
+    def _try_grant(self, waiter, now) -> bool:
+        """Grant a permit to the head of the queue if a slot and enough tokens are free"""
+        if not self._queue or self._queue[0] is not waiter:
+            return False
+        if self._in_flight >= int(self._limit) or self._token_wait(waiter.tokens, now) > 0:
+            return False
+        self._queue.popleft()
+        self._in_flight += 1
+        if self._tokens_per_minute > 0:
+            self._tokens -= min(waiter.tokens, self._bucket_size())
+        self._granted += 1
+        # The next caller may fit too
+        if self._queue:
+            self._queue[0].wake()
+        return True
+
+    def _enqueue(self, waiter, deadline, now):
+        """Queue a call or reject it when the queue is full or it can't be served in time"""
+        can_run_now = not self._queue and self._in_flight < int(self._limit)
+        if not can_run_now and len(self._queue) >= self.max_queue:
+            self._rejected_queue_full += 1
+            raise OverloadedError(f"{self.name} limiter queue is full ({len(self._queue)} waiting)",
+                                  provider=self.name)
+        # Expected wait: the calls ahead of us drain at about limit / latency calls per second
+        ahead = len(self._queue) + self._in_flight - int(self._limit) + 1
+        if ahead > 0 and self._latency_ewma is not None:
+            expected_wait = ahead / self._limit * self._latency_ewma
+            if now + expected_wait > deadline:
+                self._rejected_deadline += 1
+                raise OverloadedError(f"{self.name} limiter can't grant a permit within the deadline "
+                                      f"(~{expected_wait:.1f}s wait)", provider=self.name)
+        # ...and the token bucket refills at the token rate
+        if self._tokens_per_minute > 0 and now + self._token_wait(waiter.tokens, now) > deadline:
+            self._rejected_deadline += 1
+            raise OverloadedError(f"{self.name} token rate can't admit the call within the deadline",
+                                  provider=self.name)
+        self._queue.append(waiter)
+        self._max_queue_depth = max(self._max_queue_depth, len(self._queue))
+
+    def _next_wait(self, waiter, deadline, now) -> float:
+        """How long to sleep before checking again; raises when the deadline has passed"""
+        remaining = deadline - now
+        if remaining <= 0:
+            self._queue.remove(waiter)
+            self._timed_out += 1
+            if self._queue:
+                self._queue[0].wake()
+            raise OverloadedError(f"{self.name} limiter wait exceeded the deadline", provider=self.name)
+        if self._queue[0] is waiter and self._in_flight < int(self._limit):
+            return min(max(self._token_wait(waiter.tokens, now), 0.001), remaining)
+        return remaining
+
+    def _deadline(self, deadline):
+        default_deadline = time.monotonic() + self.max_wait_seconds
+        return default_deadline if deadline is None else min(deadline, default_deadline)
+
+    def acquire(self, tokens: int = 0, deadline: Optional[float] = None):
+        """
+        Wait for a permit (blocking). Every permit must be given back with release.
+        :param tokens: estimated prompt tokens of the call
+        :param deadline: time.monotonic() by which the call must have started, if any
+        :raises OverloadedError: if the queue is full or no permit is free before the deadline
+        """
+        deadline = self._deadline(deadline)
+        waiter = _Waiter(tokens)
+        start_time = time.monotonic()
+        with self._lock:
+            self._enqueue(waiter, deadline, start_time)
+            if self._try_grant(waiter, start_time):
+                return
+            self._queued += 1
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if self._try_grant(waiter, now):
+                    self._queue_wait_total += now - start_time
+                    return
+                wait = self._next_wait(waiter, deadline, now)
+                waiter.event.clear()
+            waiter.event.wait(wait)
+
+    async def acquire_async(self, tokens: int = 0, deadline: Optional[float] = None):
+        """
+        Async version of acquire (waits without blocking the event loop)
+        :param tokens: estimated prompt tokens of the call
+        :param deadline: time.monotonic() by which the call must have started, if any
+        :raises OverloadedError: if the queue is full or no permit is free before the deadline
+        """
+        deadline = self._deadline(deadline)
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(tokens, loop)
+        start_time = time.monotonic()
+        with self._lock:
+            self._enqueue(waiter, deadline, start_time)
+            if self._try_grant(waiter, start_time):
+                return
+            self._queued += 1
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    if self._try_grant(waiter, now):
+                        self._queue_wait_total += now - start_time
+                        return
+                    wait = self._next_wait(waiter, deadline, now)
+                    waiter.future = loop.create_future()
+                try:
+                    await asyncio.wait_for(waiter.future, timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._queue:
+                    self._queue.remove(waiter)
+                    if self._queue:
+                        self._queue[0].wake()
+            raise
+
+    def release(self, latency: float, outcome: str = SUCCESS):
+        """
+        Give back a permit and adapt the limits to the call's outcome
+        :param latency: call duration in seconds
+        :param outcome: SUCCESS, RATE_LIMITED, FAILURE or CANCELLED
+        """
+        with self._lock:
+            self._in_flight = max(self._in_flight - 1, 0)
+            now = time.monotonic()
+
+            if outcome == RATE_LIMITED:
+                self._decrease(LLM_LIMITER_BACKOFF, "rate limited", now)
+            elif outcome == SUCCESS:
+                spike = (self._latency_samples >= LATENCY_MIN_SAMPLES
+                         and latency > self._latency_ewma * LLM_LIMITER_LATENCY_SPIKE_RATIO)
+                if spike:
+                    self._decrease(LLM_LIMITER_LATENCY_BACKOFF, f"latency spike ({latency:.1f}s)", now)
+                else:
+                    # Additive increase: about +1 per limit's worth of healthy calls
+                    self._limit = min(self._limit + 1 / self._limit, self.max_limit)
+                    if self.max_tokens_per_minute > 0:
+                        self._tokens_per_minute = min(self._tokens_per_minute * 1.02, self.max_tokens_per_minute)
+                self._latency_samples += 1
+                self._latency_ewma = (latency if self._latency_ewma is None else
+                                      self._latency_ewma + LATENCY_EWMA_ALPHA * (latency - self._latency_ewma))
+
+            if self._queue:
+                self._queue[0].wake()
+
+    def _decrease(self, factor, reason, now):
+        # One decrease per round trip, so a burst of 429s from the same moment counts once
+        if now - self._last_decrease < (self._latency_ewma or 1.0):
+            return
+        self._last_decrease = now
+        self._decreases += 1
+        previous = self._limit
+        self._limit = max(self._limit * factor, self.min_limit)
+        if self.max_tokens_per_minute > 0:
+            self._tokens_per_minute = max(self._tokens_per_minute * factor, self.max_tokens_per_minute * 0.1)
+        logging.warning(f"LLM limiter '{self.name}': {reason}, concurrency {previous:.1f} -> {self._limit:.1f}")
+
+    def get_state(self) -> Dict[str, Any]:
+        """
+        Get the limiter state for monitoring
+        :return: dictionary with the current limits, queue depth and permit counters
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "concurrency_limit": round(self._limit, 2),
+                "in_flight": self._in_flight,
+                "queue_depth": len(self._queue),
+                "max_queue_depth": self._max_queue_depth,
+                "max_queue": self.max_queue,
+                "tokens_per_minute": round(self._tokens_per_minute) if self.max_tokens_per_minute > 0 else None,
+                "tokens_available": round(self._tokens) if self.max_tokens_per_minute > 0 else None,
+                "latency_ewma_ms": round(self._latency_ewma * 1000, 1) if self._latency_ewma is not None else None,
+                "granted": self._granted,
+                "queued": self._queued,
+                "avg_queue_wait_ms": (round(self._queue_wait_total / self._queued * 1000, 1)
+                                      if self._queued else 0),
+                "rejected_queue_full": self._rejected_queue_full,
+                "rejected_deadline": self._rejected_deadline,
+                "timed_out": self._timed_out,
+                "decreases": self._decreases
+            }
+
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_llm_limiter(provider: str) -> AdaptiveLimiter:
+    """
+    Get the process-wide limiter of a provider, creating it on first use
+    :param provider: provider name (gemini, openai)
+    :return: the provider's limiter
+    """
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(provider)
+            if limiter is None:
+                # Other providers (e.g. fake) read LLM_LIMITER_TOKENS_PER_MINUTE_<PROVIDER>
+                tokens_per_minute = LLM_LIMITER_TOKENS_PER_MINUTE.get(
+                    provider, float(os.getenv(f"LLM_LIMITER_TOKENS_PER_MINUTE_{provider.upper()}", "0")))
+                limiter = AdaptiveLimiter(provider, tokens_per_minute=tokens_per_minute)
+                _limiters[provider] = limiter
+    return limiter
+
+
+def get_llm_limiter_states() -> Dict[str, Any]:
+    """Get whether limiting is enabled and the state of every provider's limiter"""
+    return {"enabled": LLM_LIMITER_ENABLED,
+            **{provider: limiter.get_state() for provider, limiter in list(_limiters.items())}}
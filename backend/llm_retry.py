@@ -0,0 +1,312 @@
+"""
+Budgeted retries of LLM calls
+Each error class (see llm_errors) has its own retry policy with jittered exponential backoff.
+A process-wide retry budget caps retries to a share of recent calls, so when a provider is
+down we fall back instead of multiplying the load on it. Every attempt takes a permit from
+the provider's adaptive limiter (see llm_rate_limiter) and goes through its circuit breaker.
+Calls stop at the request's deadline (see request_deadline): no attempt starts and no backoff
+is slept past it, and async attempts are cut off when it passes (blocking calls can only be
+bounded by their own timeouts, see direct_gemini_handler). The deadline is the client's
+choice, so a cut-off releases the breaker and the limiter permit as a cancellation instead of
+counting as a provider failure, and is counted as a deadline error, not a timeout.
+"""
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional
+import asyncio
+import os
+import time
+import random
+import logging
+import threading
+
+from circuit_breaker import get_circuit_breaker
+from llm_errors import (LLMError, DeadlineExceededError, ProviderNeutralError, classify_error, RATE_LIMITED, TIMEOUT,
+                        TRANSIENT, ERROR_CLASSES)
+from llm_rate_limiter import (get_llm_limiter, LLM_LIMITER_ENABLED, SUCCESS, FAILURE, CANCELLED,
+                              RATE_LIMITED as LIMITER_RATE_LIMITED)
+from request_deadline import get_deadline
+
+# Retries may be at most this share of the calls in the budget window...
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.2"))
+# ...plus this many retries per second, so a quiet server can still retry
+LLM_RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("LLM_RETRY_BUDGET_MIN_PER_SECOND", "0.5"))
+LLM_RETRY_BUDGET_WINDOW_SECONDS = float(os.getenv("LLM_RETRY_BUDGET_WINDOW_SECONDS", "10"))
+
+
+class RetryPolicy(NamedTuple):
+    """Retry policy of one error class"""
+    max_retries: int
+    base_delay: float
+    max_delay: float
+
+
+# Error classes without a policy are never retried
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    RATE_LIMITED: RetryPolicy(max_retries=int(os.getenv("LLM_RETRY_RATE_LIMITED", "2")), base_delay=1.0, max_delay=8.0),
+    TRANSIENT: RetryPolicy(max_retries=int(os.getenv("LLM_RETRY_TRANSIENT", "2")), base_delay=0.5, max_delay=4.0),
+    TIMEOUT: RetryPolicy(max_retries=int(os.getenv("LLM_RETRY_TIMEOUT", "1")), base_delay=0.5, max_delay=2.0)
+}
+
+
+def backoff_delay(policy: RetryPolicy, retry_number: int, retry_after: Optional[float] = None) -> float:
+    """
+    Jittered exponential backoff ("full jitter")
+    :param policy: retry policy of the error class
+    :param retry_number: 1 for the first retry
+    :param retry_after: seconds the provider asked us to wait, if any
+    :return: seconds to wait before the retry
+    """
+    delay = random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** (retry_number - 1)))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, policy.max_delay))
+    return delay
+
+
+class RetryBudget:
+    """
+    Rolling-window retry budget shared by all providers
+    """
+
+    def __init__(self, ratio: float = LLM_RETRY_BUDGET_RATIO, min_per_second: float = LLM_RETRY_BUDGET_MIN_PER_SECOND,
+                 window_seconds: float = LLM_RETRY_BUDGET_WINDOW_SECONDS):
+        """
+        :param ratio: maximum retries as a share of the calls in the window
+        :param min_per_second: retries per second always allowed
+        :param window_seconds: rolling window length
+        """
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window_seconds = window_seconds
+
+        self._lock = threading.Lock()
+        self._calls = deque()
+        self._retries = deque()
+
+        # Counters
+        self._calls_total = 0
+        self._retries_total = 0
+        self._exhausted_total = 0
+        self._retries_by_class = {error_class: 0 for error_class in ERROR_CLASSES}
+        self._errors_by_class = {error_class: 0 for error_class in ERROR_CLASSES}
+
+    def _prune(self, now):
+        for timestamps in (self._calls, self._retries):
+            while timestamps and now - timestamps[0] > self.window_seconds:
+                timestamps.popleft()
+
+    def record_call(self):
+        """Record a first attempt (retries are recorded by try_acquire_retry)"""
+        with self._lock:
+            self._calls.append(time.monotonic())
+            self._calls_total += 1
+
+    def record_error(self, error_class: str):
+        """Count a failed attempt by error class"""
+        with self._lock:
+            self._errors_by_class[error_class] += 1
+
+    def try_acquire_retry(self, error_class: str) -> bool:
+        """
+        Take one retry from the budget
+        :param error_class: class of the error being retried
+        :return: True if the retry may be sent
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            allowed = max(self.ratio * len(self._calls), self.min_per_second * self.window_seconds)
+            if len(self._retries) >= allowed:
+                self._exhausted_total += 1
+                return False
+            self._retries.append(now)
+            self._retries_total += 1
+            self._retries_by_class[error_class] += 1
+            return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get retry counters
+        :return: dictionary with retries and errors per class and how often the budget ran out
+        """
+        with self._lock:
+            self._prune(time.monotonic())
+            return {
+                "calls": self._calls_total,
+                "retries": self._retries_total,
+                "retry_rate": round(self._retries_total / self._calls_total, 4) if self._calls_total else 0,
+                "budget_exhausted": self._exhausted_total,
+                "retries_in_window": len(self._retries),
+                "calls_in_window": len(self._calls),
+                "retries_by_class": {k: v for k, v in self._retries_by_class.items() if v},
+                "errors_by_class": {k: v for k, v in self._errors_by_class.items() if v}
+            }
+
+
+_budget: Optional[RetryBudget] = None
+_budget_lock = threading.Lock()
+
+
+def get_retry_budget() -> RetryBudget:
+    """Get the process-wide retry budget"""
+    global _budget
+    if _budget is None:
+        with _budget_lock:
+            if _budget is None:
+                _budget = RetryBudget()
+    return _budget
+
+
+def _next_delay(provider: str, error: LLMError, retry_number: int,
+                deadline: Optional[float] = None) -> Optional[float]:
+    """Backoff before the next retry, or None if the error must not be retried"""
+    budget = get_retry_budget()
+    budget.record_error(error.error_class)
+    policy = RETRY_POLICIES.get(error.error_class)
+    if policy is None or retry_number > policy.max_retries:
+        return None
+    delay = backoff_delay(policy, retry_number, error.retry_after)
+    # Not worth a retry budget token if the retry couldn't even start before the deadline
+    if deadline is not None and time.monotonic() + delay >= deadline:
+        logging.warning(f"{provider}: no time left before the deadline, not retrying {error.error_class} error")
+        return None
+    if not budget.try_acquire_retry(error.error_class):
+        logging.warning(f"{provider}: retry budget exhausted, not retrying {error.error_class} error")
+        return None
+    logging.info(f"{provider}: {error.error_class} error, retry {retry_number}/{policy.max_retries} in {delay:.2f}s")
+    return delay
+
+
+def limiter_outcome(error: Exception) -> str:
+    """Limiter outcome of a failed attempt"""
+    return LIMITER_RATE_LIMITED if classify_error(error).error_class == RATE_LIMITED else FAILURE
+
+
+def _check_deadline(provider, deadline):
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceededError(f"{provider} call not started, the request deadline has passed",
+                                    provider=provider)
+
+
+async def _within_deadline(awaitable, provider, deadline):
+    """
+    Await a call, cutting it off at the deadline. The cut-off cancels the call, so the circuit
+    breaker it runs through releases its slot instead of recording a failure.
+    """
+    if deadline is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=max(deadline - time.monotonic(), 0))
+    except asyncio.TimeoutError:
+        # The provider's own timeout raises the same error before the deadline
+        if time.monotonic() < deadline:
+            raise
+        raise DeadlineExceededError(f"{provider} call cut off at the request deadline", provider=provider) from None
+
+
+def _attempt(provider, func, args, kwargs, estimated_tokens, deadline):
+    """One blocking attempt under a limiter permit and through the circuit breaker"""
+    # A blocking call can't be cut off, so the deadline only keeps it from starting late
+    _check_deadline(provider, deadline)
+    breaker = get_circuit_breaker(provider)
+    if not LLM_LIMITER_ENABLED:
+        return breaker.call(func, *args, **kwargs)
+
+    limiter = get_llm_limiter(provider)
+    limiter.acquire(estimated_tokens, deadline)
+    start_time = time.perf_counter()
+    outcome = CANCELLED
+    try:
+        result = breaker.call(func, *args, **kwargs)
+        outcome = SUCCESS
+        return result
+    except ProviderNeutralError:
+        raise
+    except Exception as e:
+        outcome = limiter_outcome(e)
+        raise
+    finally:
+        limiter.release(time.perf_counter() - start_time, outcome)
+
+
+async def _aattempt(provider, func, args, kwargs, estimated_tokens, deadline):
+    """One async attempt under a limiter permit and through the circuit breaker, cut off at the deadline"""
+    _check_deadline(provider, deadline)
+    breaker = get_circuit_breaker(provider)
+    if not LLM_LIMITER_ENABLED:
+        return await _within_deadline(breaker.acall(func, *args, **kwargs), provider, deadline)
+
+    limiter = get_llm_limiter(provider)
+    await limiter.acquire_async(estimated_tokens, deadline)
+    start_time = time.perf_counter()
+    outcome = CANCELLED
+    try:
+        result = await _within_deadline(breaker.acall(func, *args, **kwargs), provider, deadline)
+        outcome = SUCCESS
+        return result
+    except ProviderNeutralError:
+        # E.g. cut off by the client's deadline: released as a cancellation
+        raise
+    except Exception as e:
+        outcome = limiter_outcome(e)
+        raise
+    finally:
+        limiter.release(time.perf_counter() - start_time, outcome)
+
+
+def call_with_retries(provider: str, func: Callable[..., Any], *args, estimated_tokens: int = 0,
+                      deadline: Optional[float] = None, **kwargs):
+    """
+    Run a blocking LLM call through the provider's limiter and circuit breaker, retrying per error class
+    :param provider: provider name (gemini, openai)
+    :param estimated_tokens: estimated prompt tokens, charged to the provider's token rate
+    :param deadline: time.monotonic() after which no attempt starts (default: the request's deadline)
+    :return: the call's result
+    :raises LLMError: the classified error of the last attempt
+    """
+    deadline = deadline if deadline is not None else get_deadline()
+    get_retry_budget().record_call()
+    retry_number = 0
+    while True:
+        try:
+            return _attempt(provider, func, args, kwargs, estimated_tokens, deadline)
+        except Exception as e:
+            error = classify_error(e, provider)
+            retry_number += 1
+            delay = _next_delay(provider, error, retry_number, deadline)
+            if delay is None:
+                if error is e:
+                    raise
+                raise error from e
+            time.sleep(delay)
+
+
+async def acall_with_retries(provider: str, func: Callable[..., Awaitable[Any]], *args, estimated_tokens: int = 0,
+                             deadline: Optional[float] = None, **kwargs):
+    """
+    Async version of call_with_retries
+    :param provider: provider name (gemini, openai)
+    :param estimated_tokens: estimated prompt tokens, charged to the provider's token rate
+    :param deadline: time.monotonic() at which attempts are cut off (default: the request's deadline)
+    :return: the call's result
+    :raises LLMError: the classified error of the last attempt
+    """
+    deadline = deadline if deadline is not None else get_deadline()
+    get_retry_budget().record_call()
+    retry_number = 0
+    while True:
+        try:
+            return await _aattempt(provider, func, args, kwargs, estimated_tokens, deadline)
+        except Exception as e:
+            error = classify_error(e, provider)
+            retry_number += 1
+            delay = _next_delay(provider, error, retry_number, deadline)
+            if delay is None:
+                if error is e:
+                    raise
+                raise error from e
+            await asyncio.sleep(delay)
+
+
+def get_retry_stats() -> Dict[str, Any]:
+    """Get the retry budget counters"""
+    return get_retry_budget().get_stats()
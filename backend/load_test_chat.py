@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Load test: how many chats one uvicorn worker keeps in flight at once.
+Sends concurrent requests to /chat/ (or /chat/mood/) of a running server and reports the
+peak number of chats in flight, throughput, latency percentiles and the effective
+concurrency (sum of request latencies / wall-clock time). With blocking LLM calls the
+effective concurrency stays near the thread pool size; on the async path it follows --concurrency.
+
+Start a single worker first:
+    uvicorn fast_api:app --workers 1 --port 8000
+or, to test without network or API keys, on the in-process fake LLM (see FAKE_LLM_* in the README):
+    LLM_PRIMARY_PROVIDER=fake LLM_FALLBACK_PROVIDER=none uvicorn fast_api:app --workers 1 --port 8000
+
+Usage:
+    python load_test_chat.py --requests 200 --concurrency 50
+    python load_test_chat.py --endpoint /chat/mood/ --mood anxious
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+PROMPTS = [
+    "I feel exhausted all the time, even when I haven't done much.",
+    "Today was actually a good day, I went for a walk with a friend.",
+    "I keep worrying about my exams and can't sleep.",
+    "Mornings are the hardest. Getting out of bed feels impossible.",
+    "I had an argument with my sister and I feel guilty about it.",
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run_load(args):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    in_flight = {"current": 0, "peak": 0}
+    latencies = []
+    failures = []
+
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, limits=limits,
+                                 timeout=args.timeout) as client:
+
+        async def send(index):
+            payload = {"prompt": PROMPTS[index % len(PROMPTS)]}
+            if args.endpoint.startswith("/chat/mood"):
+                payload["mood"] = args.mood
+            async with semaphore:
+                in_flight["current"] += 1
+                in_flight["peak"] = max(in_flight["peak"], in_flight["current"])
+                start_time = time.perf_counter()
+                try:
+                    response = await client.post(args.endpoint, json=payload)
+                    if response.status_code != 200:
+                        failures.append(f"HTTP {response.status_code}")
+                except httpx.HTTPError as e:
+                    failures.append(type(e).__name__)
+                finally:
+                    latencies.append(time.perf_counter() - start_time)
+                    in_flight["current"] -= 1
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*[send(index) for index in range(args.requests)])
+        wall_seconds = time.perf_counter() - start_time
+
+    print(f"{args.requests} requests to {args.url}{args.endpoint} with concurrency {args.concurrency}")
+    print(f"   Wall time:             {wall_seconds:.2f}s ({args.requests / wall_seconds:.2f} chats/s)")
+    print(f"   Peak chats in flight:  {in_flight['peak']}")
+    print(f"   Effective concurrency: {sum(latencies) / wall_seconds:.1f}")
+    print(f"   Latency p50={percentile(latencies, 0.5) * 1000:.0f}ms "
+          f"p95={percentile(latencies, 0.95) * 1000:.0f}ms max={max(latencies) * 1000:.0f}ms")
+    print(f"   Failures:              {len(failures)}" + (f" ({', '.join(sorted(set(failures)))})" if failures else ""))
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent chat load test against one server worker")
+    parser.add_argument("--url", default=os.getenv("LOAD_TEST_URL", "http://localhost:8000"), help="server base URL")
+    parser.add_argument("--endpoint", default="/chat/", help="/chat/ or /chat/mood/")
+    parser.add_argument("--mood", default="anxious", help="mood for /chat/mood/")
+    parser.add_argument("--requests", type=int, default=100, help="total chats to send")
+    parser.add_argument("--concurrency", type=int, default=50, help="chats kept in flight by the client")
+    parser.add_argument("--timeout", type=float, default=120, help="per-request timeout (seconds)")
+    parser.add_argument("--token", default=None, help="session token to chat as a logged-in user")
+    args = parser.parse_args()
+
+    success = asyncio.run(run_load(args))
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,7 @@ import os
 journals_storage: List[Dict] = []
 conversations_storage: List[Dict] = []
 summaries_storage: List[Dict] = []
+summary_watermarks_storage: Dict[str, str] = {}
 users_storage: Dict[str, Dict] = {}
 sessions_storage: Dict[str, Dict] = {}
 
@@ -19,6 +20,7 @@ DATA_DIR = "local_data"
 JOURNALS_FILE = os.path.join(DATA_DIR, "journals.json")
 CONVERSATIONS_FILE = os.path.join(DATA_DIR, "conversations.json")
 SUMMARIES_FILE = os.path.join(DATA_DIR, "summaries.json")
+SUMMARY_WATERMARKS_FILE = os.path.join(DATA_DIR, "summary_watermarks.json")
 
 def ensure_data_dir():
     """Ensure data directory exists"""
@@ -27,7 +29,7 @@ def ensure_data_dir():
 
 def load_from_file():
     """Load data from JSON files"""
-    global journals_storage, conversations_storage, summaries_storage
+    global journals_storage, conversations_storage, summaries_storage, summary_watermarks_storage
     
     ensure_data_dir()
     
@@ -58,6 +60,15 @@ def load_from_file():
             print(f"Error loading summaries: {e}")
             summaries_storage = []
 
+    # Load summary watermarks
+    if os.path.exists(SUMMARY_WATERMARKS_FILE):
+        try:
+            with open(SUMMARY_WATERMARKS_FILE, 'r', encoding='utf-8') as f:
+                summary_watermarks_storage = json.load(f)
+        except Exception as e:
+            print(f"Error loading summary watermarks: {e}")
+            summary_watermarks_storage = {}
+
 def save_to_file():
     """Save data to JSON files"""
     ensure_data_dir()
@@ -74,6 +85,10 @@ def save_to_file():
         # Save summaries
         with open(SUMMARIES_FILE, 'w', encoding='utf-8') as f:
             json.dump(summaries_storage, f, indent=2, ensure_ascii=False)
+
+        # Save summary watermarks
+        with open(SUMMARY_WATERMARKS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(summary_watermarks_storage, f, indent=2, ensure_ascii=False)
     except Exception as e:
         print(f"Error saving to files: {e}")
 
@@ -104,20 +119,21 @@ def get_journals_by_username_local(username: str) -> List[Dict]:
     user_journals.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
     return user_journals
 
-def get_journals_by_date_local(date_str: str) -> List[Dict]:
-    """Get journals by date from local storage"""
+def get_journals_by_date_local(date_str: str, username: str = None) -> List[Dict]:
+    """Get journals by date from local storage, optionally filtered by username"""
     date_journals = []
     
     for journal in journals_storage:
         journal_date = journal.get("timestamp", "").split("T")[0]  # Get date part
-        if journal_date == date_str:
+        if journal_date == date_str and (username is None or journal.get("username") == username):
             date_journals.append(journal)
     
     # Sort by timestamp ascending
     date_journals.sort(key=lambda x: x.get("timestamp", ""))
     return date_journals
 
-def upload_chat_in_conversation_local(user_prompt: str, sentiment_score: float, result: str, username: str = None):
+def upload_chat_in_conversation_local(user_prompt: str, sentiment_score: float, result: str, username: str = None,
+                                      analysis: Optional[Dict] = None):
     """Upload chat to local conversations storage"""
     chat_id = f"chat_{len(conversations_storage) + 1}_{int(datetime.now().timestamp())}"
     
@@ -129,6 +145,8 @@ def upload_chat_in_conversation_local(user_prompt: str, sentiment_score: float,
         "username": username,  # Add username to local storage
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
+    if analysis is not None:
+        conversation["analysis"] = analysis
     
     conversations_storage.append(conversation)
     save_to_file()
@@ -182,6 +200,56 @@ def get_chats_by_date_local(date_str: str, username: str = None) -> List[Dict]:
     date_chats.sort(key=lambda x: x.get("timestamp", ""))
     return date_chats
 
-def get_all_summaries_local() -> List[Dict]:
-    """Get all summaries from local storage"""
-    return sorted(summaries_storage, key=lambda x: x.get("date", ""), reverse=True)
+def get_all_summaries_local(username: str = None, limit: int = None) -> List[Dict]:
+    """Get a user's daily summaries from local storage, newest first"""
+    # Summaries are personal - no username means no summaries
+    if username is None:
+        return []
+
+    user_summaries = [summary for summary in summaries_storage if summary.get("username") == username]
+    user_summaries.sort(key=lambda x: x.get("date", ""), reverse=True)
+    return user_summaries[:limit] if limit else user_summaries
+
+def upsert_daily_summary_local(summary: Dict):
+    """Insert or replace the summary of one user and date in local storage"""
+    for index, existing in enumerate(summaries_storage):
+        if existing.get("username") == summary["username"] and existing.get("date") == summary["date"]:
+            summaries_storage[index] = summary
+            break
+    else:
+        summaries_storage.append(summary)
+    save_to_file()
+
+def _parse_timestamp(value: str) -> Optional[datetime]:
+    """Parse a stored ISO timestamp as an aware UTC datetime"""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def get_record_timestamps_local(collection_name: str, username: str, after: Optional[datetime] = None) -> List[str]:
+    """Get the timestamps of a user's conversations or journals newer than 'after', oldest first"""
+    records = conversations_storage if collection_name == "conversation" else journals_storage
+    timestamps = []
+    for record in records:
+        if record.get("username") != username:
+            continue
+        timestamp = _parse_timestamp(record.get("timestamp"))
+        if timestamp is not None and (after is None or timestamp > after):
+            timestamps.append(timestamp.astimezone(timezone.utc).isoformat(timespec="microseconds"))
+    return sorted(timestamps)
+
+def get_usernames_with_records_local() -> List[str]:
+    """Get every username with at least one conversation or journal entry"""
+    usernames = {record.get("username") for record in conversations_storage + journals_storage}
+    return sorted(username for username in usernames if username)
+
+def get_summary_watermark_local(username: str) -> Optional[str]:
+    """Get the timestamp of the newest record already summarized for a user"""
+    return summary_watermarks_storage.get(username)
+
+def set_summary_watermark_local(username: str, watermark: str):
+    """Store the timestamp of the newest record summarized for a user"""
+    summary_watermarks_storage[username] = watermark
+    save_to_file()
@@ -0,0 +1,127 @@
+"""
+Windowed sentiment for long texts (journal entries)
+The roberta sentiment model only sees 512 tokens. Long texts are tokenized once, cut into
+overlapping windows, all windows go through the model in a single batched call, and the
+per-window scores are combined into one length-weighted score.
+"""
+from typing import Dict, Any, List, Optional
+import os
+import logging
+
+import torch
+
+from sentiment_model_registry import get_sentiment_pipeline, normalize_sentiment
+
+# Texts shorter than this many characters always fit in one window, so skip tokenizing them
+LONG_TEXT_MIN_CHARS = int(os.getenv("SENTIMENT_LONG_TEXT_MIN_CHARS", "1500"))
+# Tokens shared by neighbouring windows
+WINDOW_OVERLAP_TOKENS = int(os.getenv("SENTIMENT_WINDOW_OVERLAP_TOKENS", "64"))
+# Upper bound on windows per text, which bounds the latency of very long entries (at least 1)
+MAX_WINDOWS = max(int(os.getenv("SENTIMENT_MAX_WINDOWS", "16")), 1)
+
+MODEL_MAX_TOKENS = 512
+
+
+def _window_size(tokenizer):
+    """Content tokens per window, leaving room for the special tokens"""
+    max_length = min(tokenizer.model_max_length or MODEL_MAX_TOKENS, MODEL_MAX_TOKENS)
+    return max_length - tokenizer.num_special_tokens_to_add(pair=False)
+
+
+def long_text_token_ids(text, tokenizer=None) -> Optional[List[int]]:
+    """
+    Tokenize a text if it may be longer than one model window
+    :param text: the text to check
+    :param tokenizer: tokenizer to count tokens with (the shared pipeline's by default)
+    :return: the token ids if the text needs windowed scoring (pass them on to the scorer), else None
+    """
+    if len(text) < LONG_TEXT_MIN_CHARS:
+        return None
+    tokenizer = tokenizer or get_sentiment_pipeline().tokenizer
+    token_ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+    return token_ids if len(token_ids) > _window_size(tokenizer) else None
+
+
+def is_long_text(text, tokenizer=None) -> bool:
+    """
+    Check whether a text is longer than one model window
+    :param text: the text to check
+    :param tokenizer: tokenizer to count tokens with (the shared pipeline's by default)
+    :return: True if the text needs windowed scoring
+    """
+    return long_text_token_ids(text, tokenizer) is not None
+
+
+def _window_spans(token_count, window_size, stride):
+    """Start/end token offsets of the windows, the last one ending at the end of the text"""
+    starts = list(range(0, max(token_count - window_size, 0) + 1, stride))
+    if starts[-1] + window_size < token_count:
+        starts.append(token_count - window_size)
+
+    # Keep latency bounded: spread MAX_WINDOWS windows evenly over the text
+    if len(starts) > MAX_WINDOWS:
+        last = len(starts) - 1
+        if MAX_WINDOWS == 1:
+            starts = [starts[last // 2]]
+        else:
+            starts = [starts[round(i * last / (MAX_WINDOWS - 1))] for i in range(MAX_WINDOWS)]
+
+    return [(start, min(start + window_size, token_count)) for start in starts]
+
+
+def analyze_long_text_sentiment_details(text, token_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+    """
+    Score a long text window by window in one batched model call
+    :param text: the text to score
+    :param token_ids: the text's token ids from long_text_token_ids (tokenized here if not given)
+    :return: dictionary with the length-weighted score, per-window scores and token counts
+    """
+    sentiment_analyzer = get_sentiment_pipeline()
+    tokenizer = sentiment_analyzer.tokenizer
+    model = sentiment_analyzer.model
+
+    # Tokenize once, then slice windows out of the token ids
+    if token_ids is None:
+        token_ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+    window_size = _window_size(tokenizer)
+    stride = max(window_size - WINDOW_OVERLAP_TOKENS, 1)
+    spans = _window_spans(len(token_ids), window_size, stride)
+
+    windows = [tokenizer.build_inputs_with_special_tokens(token_ids[start:end]) for start, end in spans]
+    inputs = tokenizer.pad({"input_ids": windows}, padding=True, return_tensors="pt")
+
+    with torch.no_grad():
+        logits = model(**inputs).logits
+    probabilities = torch.softmax(torch.as_tensor(logits), dim=-1)
+
+    id2label = model.config.id2label
+    window_scores = []
+    weights = []
+    previous_end = 0
+    for (start, end), window_probabilities in zip(spans, probabilities):
+        confidence, label_id = window_probabilities.max(dim=-1)
+        window_scores.append(normalize_sentiment(id2label[int(label_id)], float(confidence)))
+        # Weight each window by the tokens it adds, so overlapping tokens are not counted twice
+        weights.append(end - max(start, previous_end))
+        previous_end = end
+
+    score = sum(s * w for s, w in zip(window_scores, weights)) / max(sum(weights), 1)
+
+    return {
+        "score": score,
+        "tokens": len(token_ids),
+        "windows": len(spans),
+        "window_scores": window_scores
+    }
+
+
+def analyze_long_text_sentiment(text, token_ids: Optional[List[int]] = None):
+    """
+    Length-weighted sentiment of a text of any length
+    :param text: the text to score
+    :param token_ids: the text's token ids from long_text_token_ids (tokenized here if not given)
+    :return: a normalized sentiment score between -1 and 1
+    """
+    details = analyze_long_text_sentiment_details(text, token_ids)
+    logging.debug(f"Scored {details['tokens']} tokens in {details['windows']} windows")
+    return details["score"]
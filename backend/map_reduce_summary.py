@@ -0,0 +1,205 @@
+"""
+Map-reduce summarization of long inputs
+A long history is split into chunks (by date when the records have one, otherwise by token
+budget), the chunks are summarized in parallel (map), and the partial summaries are
+summarized together (reduce, repeated until they fit in one prompt). Unlike one prompt over
+everything this never overflows the model context, and since chunks are packed from the
+oldest day on, a history that grew by a day only changes its last chunk: the other chunks hit
+the summary memo and only the last chunk and the reduce cost LLM calls. Below
+SUMMARY_MAP_REDUCE_MIN_TOKENS a single prompt is faster (see benchmark_summarization.py).
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import json
+import os
+import logging
+
+from chat_context import count_tokens
+from llm_rate_limiter import get_llm_limiter, LLM_LIMITER_ENABLED
+from llm_providers import get_primary_provider_name
+
+SUMMARY_MAP_REDUCE_ENABLED = os.getenv("SUMMARY_MAP_REDUCE_ENABLED", "true").lower() == "true"
+# Inputs above this many tokens are summarized with map-reduce
+# (kept below the 128k context of the smallest model in the fallback chain, gpt-4o-mini)
+SUMMARY_MAP_REDUCE_MIN_TOKENS = int(os.getenv("SUMMARY_MAP_REDUCE_MIN_TOKENS", "100000"))
+# Token budget of one map chunk
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "8000"))
+# Upper bound of parallel map calls (also capped by the provider's current concurrency limit)
+SUMMARY_MAX_PARALLEL = int(os.getenv("SUMMARY_MAX_PARALLEL", "4"))
+
+# Reduce levels before giving up on shrinking the partial summaries further
+MAX_REDUCE_LEVELS = 5
+
+
+class Chunk:
+    """A piece of the input to summarize on its own"""
+    __slots__ = ("label", "text", "tokens")
+
+    def __init__(self, label: str, text: str, tokens: int):
+        self.label = label
+        self.text = text
+        self.tokens = tokens
+
+
+def _split_text(text: str, chunk_tokens: int, label: str = "") -> List[Chunk]:
+    """Pack lines into chunks of at most chunk_tokens (a single longer line is cut by characters)"""
+    chunks = []
+    lines = []
+    tokens = 0
+
+    def flush():
+        nonlocal lines, tokens
+        if lines:
+            chunks.append(Chunk(label, "\n".join(lines), tokens))
+        lines, tokens = [], 0
+
+    for line in text.splitlines():
+        line_tokens = count_tokens(line) + 1
+        if line_tokens > chunk_tokens:
+            flush()
+            # About 4 characters per token
+            step = chunk_tokens * 4
+            for start in range(0, len(line), step):
+                piece = line[start:start + step]
+                chunks.append(Chunk(label, piece, count_tokens(piece)))
+            continue
+        if tokens + line_tokens > chunk_tokens:
+            flush()
+        lines.append(line)
+        tokens += line_tokens
+    flush()
+    return chunks
+
+
+def _record_date(record: Dict[str, Any]) -> str:
+    return str(record.get("date") or record.get("timestamp") or "")[:10]
+
+
+def split_records_by_date(records: List[Dict[str, Any]], chunk_tokens: int = SUMMARY_CHUNK_TOKENS) -> List[Chunk]:
+    """
+    Split dated records into chunks of whole days (consecutive days are packed together up to
+    the token budget; a day larger than the budget is split by tokens)
+    :param records: list of dicts with a date (or timestamp) field
+    :param chunk_tokens: token budget of one chunk
+    :return: list of chunks labeled with their date range
+    """
+    days: Dict[str, List[str]] = {}
+    for record in sorted(records, key=_record_date):
+        days.setdefault(_record_date(record), []).append(json.dumps(record, default=str, ensure_ascii=False))
+
+    chunks = []
+    dates, lines, tokens = [], [], 0
+
+    def flush():
+        nonlocal dates, lines, tokens
+        if lines:
+            label = dates[0] if dates[0] == dates[-1] else f"{dates[0]} to {dates[-1]}"
+            chunks.append(Chunk(label, "\n".join(lines), tokens))
+        dates, lines, tokens = [], [], 0
+
+    for date, day_lines in days.items():
+        day_text = "\n".join(day_lines)
+        day_tokens = count_tokens(day_text)
+        if day_tokens > chunk_tokens:
+            flush()
+            chunks.extend(_split_text(day_text, chunk_tokens, label=date))
+            continue
+        if tokens + day_tokens > chunk_tokens:
+            flush()
+        dates.append(date)
+        lines.append(day_text)
+        tokens += day_tokens
+    flush()
+    return chunks
+
+
+def split_for_summary(content: Union[str, List[Dict[str, Any]]], chunk_tokens: int = SUMMARY_CHUNK_TOKENS) -> List[Chunk]:
+    """
+    Split the input of a summary into chunks
+    :param content: text, or list of dated records
+    :param chunk_tokens: token budget of one chunk
+    :return: list of chunks
+    """
+    if isinstance(content, str):
+        return _split_text(content, chunk_tokens)
+    return split_records_by_date(content, chunk_tokens)
+
+
+def needs_map_reduce(text: str) -> bool:
+    """
+    Check whether a text is long enough for map-reduce
+    :param text: the text to summarize
+    :return: True if it is above SUMMARY_MAP_REDUCE_MIN_TOKENS (and more than one chunk)
+    """
+    if not SUMMARY_MAP_REDUCE_ENABLED:
+        return False
+    return count_tokens(text) > max(SUMMARY_MAP_REDUCE_MIN_TOKENS, SUMMARY_CHUNK_TOKENS)
+
+
+def map_parallelism(provider: Optional[str] = None) -> int:
+    """Parallel map calls: SUMMARY_MAX_PARALLEL, capped by the (primary) provider's current concurrency limit"""
+    parallel = SUMMARY_MAX_PARALLEL
+    if LLM_LIMITER_ENABLED:
+        limiter = get_llm_limiter(provider or get_primary_provider_name())
+        parallel = min(parallel, int(limiter.get_state()["concurrency_limit"]))
+    return max(parallel, 1)
+
+
+def _labeled(chunk: Chunk, summary: str) -> str:
+    return f"Date: {chunk.label}\n{summary}" if chunk.label else summary
+
+
+def _pack(partials: List[str], chunk_tokens: int) -> List[str]:
+    """Pack whole partial summaries into groups of at most chunk_tokens"""
+    groups, current, tokens = [], [], 0
+    for partial in partials:
+        partial_tokens = count_tokens(partial) + 2
+        if current and tokens + partial_tokens > chunk_tokens:
+            groups.append("\n\n".join(current))
+            current, tokens = [], 0
+        current.append(partial)
+        tokens += partial_tokens
+    if current:
+        groups.append("\n\n".join(current))
+    return groups
+
+
+def summarize_map_reduce(content: Union[str, List[Dict[str, Any]]], summarize_chunk: Callable[[str], str],
+                         chunk_tokens: int = SUMMARY_CHUNK_TOKENS,
+                         max_parallel: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Summarize a long input with map-reduce
+    :param content: text, or list of dated records
+    :param summarize_chunk: function summarizing one chunk of text (raises on failure)
+    :param chunk_tokens: token budget of one chunk
+    :param max_parallel: parallel summary calls (default: map_parallelism())
+    :return: tuple (summary, stats with the number of chunks, calls and reduce levels)
+    """
+    chunks = split_for_summary(content, chunk_tokens)
+    if not chunks:
+        return "", {"chunks": 0, "calls": 0, "levels": 0}
+    parallel = max_parallel or map_parallelism()
+    stats = {"chunks": len(chunks), "calls": len(chunks), "levels": 0, "parallel": parallel}
+
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="summary-map") as executor:
+        # Map: summarize every chunk
+        summaries = list(executor.map(summarize_chunk, [chunk.text for chunk in chunks]))
+        if len(summaries) == 1:
+            return summaries[0], stats
+        partials = [_labeled(chunk, summary) for chunk, summary in zip(chunks, summaries)]
+
+        # Reduce: merge groups of partial summaries in parallel until one prompt holds them all
+        while len(partials) > 1:
+            stats["levels"] += 1
+            groups = _pack(partials, chunk_tokens)
+            if len(groups) == 1 or len(groups) >= len(partials) or stats["levels"] >= MAX_REDUCE_LEVELS:
+                # Fits in one prompt (or doesn't shrink any further): final reduce
+                stats["calls"] += 1
+                partials = [summarize_chunk("\n\n".join(partials))]
+                break
+            partials = list(executor.map(summarize_chunk, groups))
+            stats["calls"] += len(groups)
+
+    logging.info(f"📝 Map-reduce summary: {stats['chunks']} chunks, {stats['calls']} calls, "
+                 f"{stats['levels']} reduce levels, {parallel} in parallel")
+    return partials[0], stats
@@ -4,6 +4,7 @@ from contextlib import contextmanager
 from dotenv import load_dotenv
 import os
 import ssl
+from request_deadline import stage_timeout
 from local_storage import (
     save_journal_entry_local, 
     get_journals_by_username_local, 
@@ -11,9 +12,26 @@ from local_storage import (
     upload_chat_in_conversation_local,
     get_past_conversations_local,
     get_chats_by_date_local,
-    get_all_summaries_local
+    get_all_summaries_local,
+    upsert_daily_summary_local,
+    get_record_timestamps_local,
+    get_usernames_with_records_local,
+    get_summary_watermark_local,
+    set_summary_watermark_local
 )
 
+# MongoDB timeouts (ms), shortened to the time left before the request's deadline but never below the floor
+MONGO_TIMEOUT_MS = 3000
+MONGO_MIN_TIMEOUT_MS = 250
+
+
+def mongo_timeout_ms():
+    """
+    MongoDB timeout for the current request
+    :return: MONGO_TIMEOUT_MS, or the time left before the deadline if that is shorter
+    """
+    return int(max(stage_timeout(MONGO_TIMEOUT_MS / 1000) * 1000, MONGO_MIN_TIMEOUT_MS))
+
 
 @contextmanager 
 def get_mongo_client():
@@ -27,11 +45,12 @@ def get_mongo_client():
         raise ValueError("MONGO_URI not found in environment variables")
     
     # Simple, fast connection for production
+    timeout_ms = mongo_timeout_ms()
     client = MongoClient(
         MONGO_URI,
-        connectTimeoutMS=3000,  # Very short timeout
-        serverSelectionTimeoutMS=3000,
-        socketTimeoutMS=3000
+        connectTimeoutMS=timeout_ms,  # Very short timeout
+        serverSelectionTimeoutMS=timeout_ms,
+        socketTimeoutMS=timeout_ms
     )
     try:
         yield client
@@ -52,11 +71,13 @@ def get_mongo_collection(collection_name="conversation"):
     
     # Fast MongoDB connection without ping test
     try:
+        # 3 second timeout, or less when the request's deadline is closer
+        timeout_ms = mongo_timeout_ms()
         client = MongoClient(
             MONGO_URI,
-            connectTimeoutMS=3000,  # 3 second timeout
-            serverSelectionTimeoutMS=3000,
-            socketTimeoutMS=3000
+            connectTimeoutMS=timeout_ms,
+            serverSelectionTimeoutMS=timeout_ms,
+            socketTimeoutMS=timeout_ms
         )
         db = client["chatbot_db"]
         collection = db[collection_name]
@@ -67,19 +88,93 @@ def get_mongo_collection(collection_name="conversation"):
         raise Exception(f"MongoDB connection failed: {e}")
 
 
-def get_all_summaries():
+def get_all_summaries(username=None, limit=None):
     """
-    Function to get all summaries from the database sorted in descending order by date
-    :return: list of all summaries
+    Function to get a user's daily summaries sorted in descending order by date
+    :param username: Username to filter summaries by
+    :param limit: Maximum number of summaries to return (all if None)
+    :return: list of the user's summaries
     """
     # Use local storage directly for production
     try:
-        return get_all_summaries_local()
+        return get_all_summaries_local(username, limit)
     except Exception as e:
         print(f"Failed to get summaries: {e}")
         return []
 
 
+def upsert_daily_summary(summary):
+    """
+    Insert or replace the summary of one user and date
+    Summaries are kept in local storage, where get_all_summaries reads them.
+    :param summary: summary dict with at least username and date (YYYY-MM-DD)
+    :return: None
+    """
+    upsert_daily_summary_local(summary)
+
+
+def get_record_timestamps(collection_name, username, after=None):
+    """
+    Get the timestamps of a user's records newer than a watermark, oldest first
+    :param collection_name: conversation or journal
+    :param username: Username to filter records by
+    :param after: aware UTC datetime; only records strictly newer are returned (all if None)
+    :return: list of ISO timestamps (UTC)
+    """
+    try:
+        # Try MongoDB first
+        collection = get_mongo_collection(collection_name)
+        query = {"username": username}
+        if after is not None:
+            # Timestamps are stored as naive UTC datetimes
+            query["timestamp"] = {"$gt": after.astimezone(timezone.utc).replace(tzinfo=None)}
+        records = collection.find(query, {"timestamp": 1, "_id": 0}).sort([("timestamp", 1)])
+        # Records without a (datetime) timestamp can't be placed on a day and are skipped
+        return [record["timestamp"].replace(tzinfo=timezone.utc).isoformat(timespec="microseconds")
+                for record in records if isinstance(record.get("timestamp"), datetime)]
+    except Exception as e:
+        print(f"MongoDB failed, using local storage: {e}")
+        # Fallback to local storage
+        return get_record_timestamps_local(collection_name, username, after)
+
+
+def get_usernames_with_records():
+    """
+    Get every username with at least one conversation or journal entry
+    :return: sorted list of usernames
+    """
+    try:
+        # Try MongoDB first
+        usernames = set()
+        for collection_name in ("conversation", "journal"):
+            usernames.update(get_mongo_collection(collection_name).distinct("username"))
+        return sorted(username for username in usernames if username)
+    except Exception as e:
+        print(f"MongoDB failed, using local storage: {e}")
+        # Fallback to local storage
+        return get_usernames_with_records_local()
+
+
+def get_summary_watermark(username):
+    """
+    Get the timestamp of the newest record already summarized for a user
+    Watermarks are kept in local storage next to the summaries they describe.
+    :param username: Username of the watermark
+    :return: ISO timestamp, or None if nothing was summarized yet
+    """
+    return get_summary_watermark_local(username)
+
+
+def set_summary_watermark(username, watermark):
+    """
+    Store the timestamp of the newest record summarized for a user
+    :param username: Username of the watermark
+    :param watermark: ISO timestamp (UTC)
+    :return: None
+    """
+    set_summary_watermark_local(username, watermark)
+
+
 def get_past_conversations(limit=10, username=None):
     """
     Return a list of past messages for a specific user. Sorted in descending order by date.
@@ -174,11 +269,12 @@ def get_journals_by_username(username: str):
         return get_journals_by_username_local(username)
 
 
-def get_journals_by_date(date: str):
+def get_journals_by_date(date: str, username=None):
     """
     Retrieve all journal entries that match the given date string (YYYY-MM-DD).
 
     :param date: Date in YYYY-MM-DD format.
+    :param username: Username to filter journals by (all users if None)
     :return: List of journal entries for that date.
     """
     try:
@@ -191,12 +287,15 @@ def get_journals_by_date(date: str):
         end_date = start_date + timedelta(days=1)
 
         # Query using datetime comparison
-        journals = list(collection.find({
+        query = {
             "timestamp": {
                 "$gte": start_date,
                 "$lt": end_date
             }
-        }).sort("timestamp", 1))  # Sort by timestamp in ascending order
+        }
+        if username is not None:
+            query["username"] = username
+        journals = list(collection.find(query).sort("timestamp", 1))  # Sort by timestamp in ascending order
 
         # Convert ObjectId to string (but do not modify timestamp)
         for journal in journals:
@@ -249,31 +348,33 @@ def get_chats_by_date(date: str, username=None):
             return []
 
 
-def upload_chat_in_conversation(user_prompt, sentiment_score, result, username=None):
+def upload_chat_in_conversation(user_prompt, sentiment_score, result, username=None, analysis=None):
     """
     Upload the chat in the conversation collection
     :param user_prompt: prompt given by the user
     :param sentiment_score: sentiment score of the prompt
     :param result: response by the chatbot
     :param username: username of the logged-in user
+    :param analysis: structured analysis of the prompt (sentiment, emotions, risk), if available
     :return: None
     """
     try:
         # Try MongoDB first
         collection = get_mongo_collection("conversation")
-        collection.insert_one(
-            {"user_input": user_prompt,
-             "sentiment_score": sentiment_score,
-             "response": result,
-             "username": username,  # Add username to conversation
-             "timestamp": datetime.now(timezone.utc)}
-        )
+        conversation = {"user_input": user_prompt,
+                        "sentiment_score": sentiment_score,
+                        "response": result,
+                        "username": username,  # Add username to conversation
+                        "timestamp": datetime.now(timezone.utc)}
+        if analysis is not None:
+            conversation["analysis"] = analysis
+        collection.insert_one(conversation)
         print("Chat saved to MongoDB successfully")
     except Exception as e:
         print(f"MongoDB failed, using local storage: {e}")
         # Fallback to local storage
         try:
-            upload_chat_in_conversation_local(user_prompt, sentiment_score, result, username)
+            upload_chat_in_conversation_local(user_prompt, sentiment_score, result, username, analysis)
             print("Chat saved to local storage successfully")
         except Exception as e2:
             print(f"Local storage also failed: {e2}")
\ No newline at end of file
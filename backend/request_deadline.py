@@ -0,0 +1,139 @@
+"""
+End-to-end request deadlines
+Every HTTP request gets one deadline (REQUEST_DEADLINE_SECONDS, or less if the client asks for
+it with an X-Request-Timeout header), kept in a context variable so every stage of the chat
+pipeline sees it: tasks inherit it and run_blocking copies it into the thread pool. Stages
+shrink their own timeouts to the time left (chat context stages, MongoDB, the direct Gemini
+HTTP calls), optional work (summaries, retrieval, scoring a fallback reply) is skipped when
+the time left must be kept for the LLM call, and LLM attempts, limiter waits and retry
+backoffs stop at the deadline (see llm_retry). A streamed response is never cut off once it
+has started.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+import os
+import time
+import logging
+import threading
+
+REQUEST_DEADLINE_ENABLED = os.getenv("REQUEST_DEADLINE_ENABLED", "true").lower() == "true"
+# Time budget of one request (also the longest a client may ask for)
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "25"))
+# Time kept for the LLM call: optional stages are skipped (or cut short) so that this much is left
+REQUEST_DEADLINE_LLM_RESERVE_SECONDS = float(os.getenv("REQUEST_DEADLINE_LLM_RESERVE_SECONDS", "8"))
+
+DEADLINE_HEADER = b"x-request-timeout"
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Any] = {"requests": 0, "exceeded": 0, "skipped_stages": {}}
+
+
+def get_deadline() -> Optional[float]:
+    """
+    Get the deadline of the current request
+    :return: time.monotonic() by which the request must be answered, or None outside a request
+    """
+    return _deadline.get()
+
+
+def time_remaining() -> Optional[float]:
+    """Seconds left until the current request's deadline (negative once it passed), or None without one"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def deadline_exceeded() -> bool:
+    """Check whether the current request's deadline has passed"""
+    remaining = time_remaining()
+    return remaining is not None and remaining <= 0
+
+
+def stage_timeout(timeout: float, reserve: float = 0.0) -> float:
+    """
+    Timeout of a stage within the current request's deadline
+    :param timeout: the stage's own timeout in seconds
+    :param reserve: seconds to keep for later stages (e.g. REQUEST_DEADLINE_LLM_RESERVE_SECONDS)
+    :return: the timeout, shortened to the time left minus the reserve (0 or less: skip the stage)
+    """
+    remaining = time_remaining()
+    if remaining is None:
+        return timeout
+    return min(timeout, remaining - reserve)
+
+
+def record_skipped_stage(name: str):
+    """Count a stage skipped because the deadline left no time for it"""
+    logging.warning(f"Skipping '{name}', not enough time left before the request deadline")
+    with _stats_lock:
+        _stats["skipped_stages"][name] = _stats["skipped_stages"].get(name, 0) + 1
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float] = None):
+    """
+    Run a block under a deadline (nested deadlines can only shorten the outer one)
+    :param seconds: time budget (default: REQUEST_DEADLINE_SECONDS)
+    """
+    deadline = time.monotonic() + (REQUEST_DEADLINE_SECONDS if seconds is None else seconds)
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(deadline, outer))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def _requested_seconds(scope) -> float:
+    """The client's X-Request-Timeout (seconds), capped at REQUEST_DEADLINE_SECONDS"""
+    for name, value in scope.get("headers") or []:
+        if name == DEADLINE_HEADER:
+            try:
+                return min(max(float(value), 0.0), REQUEST_DEADLINE_SECONDS)
+            except ValueError:
+                break
+    return REQUEST_DEADLINE_SECONDS
+
+
+class RequestDeadlineMiddleware:
+    """
+    ASGI middleware that sets the deadline of every HTTP request
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not REQUEST_DEADLINE_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        with _stats_lock:
+            _stats["requests"] += 1
+        with request_deadline(_requested_seconds(scope)):
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                if deadline_exceeded():
+                    with _stats_lock:
+                        _stats["exceeded"] += 1
+                    logging.warning(f"Request {scope.get('path')} finished after its deadline")
+
+
+def get_deadline_stats() -> Dict[str, Any]:
+    """
+    Get the deadline settings and counters
+    :return: dictionary with requests, requests that finished late and skipped stages
+    """
+    with _stats_lock:
+        return {
+            "enabled": REQUEST_DEADLINE_ENABLED,
+            "deadline_seconds": REQUEST_DEADLINE_SECONDS,
+            "llm_reserve_seconds": REQUEST_DEADLINE_LLM_RESERVE_SECONDS,
+            "requests": _stats["requests"],
+            "exceeded": _stats["exceeded"],
+            "exceeded_rate": round(_stats["exceeded"] / _stats["requests"], 4) if _stats["requests"] else 0,
+            "skipped_stages": dict(_stats["skipped_stages"])
+        }
@@ -0,0 +1,213 @@
+"""
+Semantic response cache (opt-in)
+Near-duplicate opening messages ("I feel anxious today", "hello") get near-identical answers,
+so a response generated for one user can be served instantly to the next. Prompts are
+embedded with the shared encoder and a cached response is reused when a prior prompt is
+similar enough and was answered in the same context class:
+- only messages answered without personal history (no past conversations or summaries),
+  so a cached response never carries another user's context
+- the same sentiment bucket, so a cheerful "hello" is not answered like a sad one
+- never for messages with a crisis risk flag, so the cache only runs with TEXT_ANALYSIS_ENABLED
+Entries expire after a TTL and the cache is size-bounded (least recently used evicted first).
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import os
+import time
+import logging
+import threading
+
+import torch
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+# Minimum cosine similarity of the prompt embeddings to reuse a response
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2000"))
+# Longer messages are too specific to be worth caching
+SEMANTIC_CACHE_MAX_PROMPT_CHARS = int(os.getenv("SEMANTIC_CACHE_MAX_PROMPT_CHARS", "300"))
+
+# Sentiment scores at or beyond these bounds are negative / positive, neutral in between
+NEGATIVE_BUCKET_MAX = -0.25
+POSITIVE_BUCKET_MIN = 0.25
+
+
+def sentiment_bucket(sentiment_score: Optional[float]) -> Optional[str]:
+    """
+    Bucket a normalized sentiment score
+    :param sentiment_score: score between -1 and 1
+    :return: "negative", "neutral", "positive" or None if the score is unknown
+    """
+    if sentiment_score is None:
+        return None
+    if sentiment_score <= NEGATIVE_BUCKET_MAX:
+        return "negative"
+    if sentiment_score >= POSITIVE_BUCKET_MIN:
+        return "positive"
+    return "neutral"
+
+
+def context_class(user_prompt: str, sentiment_score: Optional[float], analysis: Optional[Dict[str, Any]],
+                  has_personal_history: bool) -> Optional[str]:
+    """
+    Get the cache context class of a chat message
+    :param user_prompt: the user's message
+    :param sentiment_score: normalized sentiment score of the message
+    :param analysis: structured analysis of the message, if available
+    :param has_personal_history: whether the prompt includes the user's past conversations or summaries
+    :return: the context class, or None if the message must not be served from / stored in the cache
+    """
+    if has_personal_history or not user_prompt or len(user_prompt) > SEMANTIC_CACHE_MAX_PROMPT_CHARS:
+        return None
+    # Without the risk analysis we can't rule out a crisis message
+    if not analysis or analysis["risk"]["flag"]:
+        return None
+    return sentiment_bucket(sentiment_score)
+
+
+class SemanticCache:
+    """
+    Thread-safe cache of LLM responses looked up by prompt embedding similarity
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        """
+        :param threshold: minimum cosine similarity to reuse a response
+        :param ttl_seconds: how long a response may be reused
+        :param max_entries: maximum number of cached responses over all context classes
+        """
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(int(max_entries), 1)
+
+        self._lock = threading.Lock()
+        # id -> (context class, created_at, embedding, prompt, response), least recently used first
+        self._entries: "OrderedDict[int, Tuple[str, float, torch.Tensor, str, str]]" = OrderedDict()
+        # context class -> (entry ids, stacked embeddings), rebuilt when the class changes
+        self._matrices: Dict[str, Tuple[list, torch.Tensor]] = {}
+        self._next_id = 0
+
+        # Counters
+        self._lookups = 0
+        self._hits = 0
+        self._ineligible = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    def _remove(self, entry_id):
+        context, *_ = self._entries.pop(entry_id)
+        self._matrices.pop(context, None)
+
+    def _class_matrix(self, context):
+        matrix = self._matrices.get(context)
+        if matrix is None:
+            ids = [entry_id for entry_id, entry in self._entries.items() if entry[0] == context]
+            if not ids:
+                return [], None
+            matrix = (ids, torch.stack([self._entries[entry_id][2] for entry_id in ids]))
+            self._matrices[context] = matrix
+        return matrix
+
+    def record_ineligible(self):
+        """Count a message that was not cacheable (personal history, crisis risk, too long)"""
+        with self._lock:
+            self._ineligible += 1
+
+    def lookup(self, embedding: torch.Tensor, context: str) -> Optional[Tuple[str, float]]:
+        """
+        Find the response of the most similar cached prompt of the same context class
+        :param embedding: L2-normalized prompt embedding
+        :param context: context class of the message
+        :return: tuple (response, similarity) or None on a miss
+        """
+        with self._lock:
+            self._lookups += 1
+            while True:
+                ids, matrix = self._class_matrix(context)
+                if matrix is None:
+                    return None
+                similarities = matrix @ embedding
+                best = int(torch.argmax(similarities))
+                similarity = float(similarities[best])
+                if similarity < self.threshold:
+                    return None
+                entry_id = ids[best]
+                _, created_at, _, _, response = self._entries[entry_id]
+                if time.time() - created_at <= self.ttl_seconds:
+                    break
+                # Expired: drop it and look again
+                self._remove(entry_id)
+                self._expirations += 1
+
+            self._entries.move_to_end(entry_id)
+            self._hits += 1
+            return response, similarity
+
+    def store(self, user_prompt: str, embedding: torch.Tensor, context: str, response: str):
+        """
+        Cache the response to a prompt
+        :param user_prompt: the user's message (kept for debugging)
+        :param embedding: L2-normalized prompt embedding
+        :param context: context class of the message
+        :param response: the LLM response
+        """
+        with self._lock:
+            self._entries[self._next_id] = (context, time.time(), embedding.detach().clone(), user_prompt, response)
+            self._next_id += 1
+            self._matrices.pop(context, None)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get hit-rate counters and current size
+        :return: dictionary of cache statistics
+        """
+        with self._lock:
+            classes = {}
+            for context, *_ in self._entries.values():
+                classes[context] = classes.get(context, 0) + 1
+            return {
+                "enabled": SEMANTIC_CACHE_ENABLED,
+                "threshold": self.threshold,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "entries_per_class": classes,
+                "lookups": self._lookups,
+                "hits": self._hits,
+                "misses": self._lookups - self._hits,
+                "hit_rate": round(self._hits / self._lookups, 4) if self._lookups else 0,
+                "ineligible": self._ineligible,
+                "evictions": self._evictions,
+                "expirations": self._expirations
+            }
+
+
+_cache: Optional[SemanticCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticCache:
+    """Get the process-wide semantic response cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticCache()
+                logging.info(f"Semantic response cache ready (threshold {_cache.threshold}, "
+                             f"ttl {_cache.ttl_seconds}s, max {_cache.max_entries} entries)")
+    return _cache
+
+
+def get_semantic_cache_stats() -> Dict[str, Any]:
+    """Get the semantic cache counters"""
+    return get_semantic_cache().get_stats()
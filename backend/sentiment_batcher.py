@@ -0,0 +1,238 @@
+"""
+Micro-batching for model inference
+Collects single inputs from concurrent requests for a short window (or until a maximum
+batch size is reached) and runs them through the model as one padded batch.
+Batches run in a bounded thread or process pool so inference never blocks the event loop.
+"""
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import logging
+import time
+
+# Number of recent batches kept for the rolling metrics
+METRICS_WINDOW = 500
+
+
+class BatcherOverloadedError(Exception):
+    """Raised when too many inputs are already waiting to be processed"""
+    pass
+
+
+def create_inference_executor(pool_type: str = "thread", max_workers: int = 1, name: str = "inference") -> Executor:
+    """
+    Create a bounded pool for running model inference off the event loop
+    :param pool_type: "thread" (shares the loaded model) or "process" (one model copy per process)
+    :param max_workers: number of workers in the pool
+    :param name: prefix for worker thread names
+    :return: the executor
+    """
+    max_workers = max(int(max_workers), 1)
+
+    if pool_type == "process":
+        return ProcessPoolExecutor(max_workers=max_workers)
+
+    if pool_type != "thread":
+        logging.warning(f"Unknown pool type '{pool_type}', using a thread pool")
+
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+
+class MicroBatcher:
+    """
+    Asyncio micro-batcher that turns many single-item calls into batched calls.
+    A single background collector per event loop drains the queue, so while one batch is
+    running the next one keeps filling up. At most max_concurrent_batches run at once.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], window_ms: float = 10,
+                 max_batch_size: int = 32, name: str = "batcher", executor: Optional[Executor] = None,
+                 max_concurrent_batches: int = 1, max_pending: Optional[int] = None):
+        """
+        :param batch_fn: blocking function that takes a list of inputs and returns a list of results
+        :param window_ms: how long to wait for more inputs after the first one arrives
+        :param max_batch_size: maximum number of inputs per batch
+        :param name: name used in logs and metrics
+        :param executor: pool the batches run in (the loop's default executor if None)
+        :param max_concurrent_batches: how many batches may run in the executor at the same time
+        :param max_pending: maximum number of queued + running inputs before new ones are rejected
+        """
+        self.batch_fn = batch_fn
+        self.window_seconds = max(window_ms, 0) / 1000
+        self.max_batch_size = max(int(max_batch_size), 1)
+        self.name = name
+        self.executor = executor
+        self.max_concurrent_batches = max(int(max_concurrent_batches), 1)
+        self.max_pending = max_pending
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._batch_slots: Optional[asyncio.Semaphore] = None
+        self._running_batches = set()
+        self._pending = 0
+
+        # Metrics
+        self._rejected_total = 0
+        self._items_total = 0
+        self._batches_total = 0
+        self._errors_total = 0
+        self._max_queue_depth = 0
+        self._batch_sizes = deque(maxlen=METRICS_WINDOW)
+        self._wait_times = deque(maxlen=METRICS_WINDOW)
+        self._inference_times = deque(maxlen=METRICS_WINDOW)
+
+    def _ensure_worker(self):
+        """Start the background worker on the running event loop if needed"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._batch_slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Queue one input and wait for its result
+        :param item: the input to process
+        :return: the result for this input
+        :raises BatcherOverloadedError: if max_pending inputs are already waiting
+        """
+        if self.max_pending is not None and self._pending >= self.max_pending:
+            self._rejected_total += 1
+            raise BatcherOverloadedError(f"{self.name} has {self._pending} pending inputs")
+
+        self._ensure_worker()
+
+        future = self._loop.create_future()
+        self._pending += 1
+        try:
+            self._queue.put_nowait((item, future, time.perf_counter()))
+            self._max_queue_depth = max(self._max_queue_depth, self._queue.qsize())
+            return await future
+        finally:
+            self._pending -= 1
+
+    async def _collect_batch(self) -> list:
+        """Wait for the first input, then keep collecting until the window closes or the batch is full"""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.window_seconds
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        # Anything already waiting goes into this batch as well
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+        return batch
+
+    async def _run(self):
+        """Background collector: wait for a free batch slot, collect a batch, start it"""
+        while True:
+            await self._batch_slots.acquire()
+            try:
+                batch = await self._collect_batch()
+            except BaseException:
+                self._batch_slots.release()
+                raise
+
+            task = self._loop.create_task(self._process_batch(batch))
+            self._running_batches.add(task)
+            task.add_done_callback(self._running_batches.discard)
+
+    async def _process_batch(self, batch: list):
+        """Run one batch in the executor and hand the results back to the callers"""
+        try:
+            # Callers that gave up (e.g. request cancelled) don't need to be scored
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                return
+
+            started_at = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                self._wait_times.append(started_at - enqueued_at)
+
+            items = [entry[0] for entry in batch]
+            try:
+                results = await self._loop.run_in_executor(self.executor, self.batch_fn, items)
+                if len(results) != len(items):
+                    raise ValueError(f"{self.name} returned {len(results)} results for {len(items)} inputs")
+            except Exception as e:
+                self._errors_total += 1
+                logging.error(f"{self.name} batch of {len(items)} failed: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            finally:
+                self._inference_times.append(time.perf_counter() - started_at)
+                self._batch_sizes.append(len(items))
+                self._batches_total += 1
+                self._items_total += len(items)
+
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._batch_slots.release()
+
+    async def close(self):
+        """Stop the background collector and wait for running batches to finish"""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
+        if self._running_batches:
+            await asyncio.gather(*self._running_batches, return_exceptions=True)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Get queue depth, batch size and wait time metrics for tuning the batching window
+        :return: dictionary of metrics (times in milliseconds)
+        """
+        def average(values):
+            return round(sum(values) / len(values), 3) if values else 0
+
+        def percentile(values, pct):
+            if not values:
+                return 0
+            ordered = sorted(values)
+            index = min(int(len(ordered) * pct / 100), len(ordered) - 1)
+            return round(ordered[index], 3)
+
+        wait_ms = [t * 1000 for t in self._wait_times]
+        inference_ms = [t * 1000 for t in self._inference_times]
+
+        return {
+            "name": self.name,
+            "window_ms": self.window_seconds * 1000,
+            "max_batch_size": self.max_batch_size,
+            "max_concurrent_batches": self.max_concurrent_batches,
+            "max_pending": self.max_pending,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue_depth": self._max_queue_depth,
+            "pending": self._pending,
+            "running_batches": len(self._running_batches),
+            "rejected_total": self._rejected_total,
+            "items_total": self._items_total,
+            "batches_total": self._batches_total,
+            "errors_total": self._errors_total,
+            "avg_batch_size": average(self._batch_sizes),
+            "max_batch_size_seen": max(self._batch_sizes) if self._batch_sizes else 0,
+            "avg_wait_ms": average(wait_ms),
+            "p95_wait_ms": percentile(wait_ms, 95),
+            "avg_inference_ms": average(inference_ms),
+            "p95_inference_ms": percentile(inference_ms, 95)
+        }
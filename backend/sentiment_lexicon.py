@@ -0,0 +1,160 @@
+"""
+Fast lexicon/rule-based sentiment scorer
+Used as the first tier of tiered sentiment: it scores short, clearly positive or negative
+messages in microseconds and asks for the transformer model when it is not confident
+(near neutral, long, mixed or negated text).
+"""
+from typing import Dict, Optional, Tuple, Any
+import math
+import os
+import re
+import threading
+
+# Word valences between -1 (very negative) and 1 (very positive)
+LEXICON: Dict[str, float] = {
+    # Positive
+    "good": 0.5, "great": 0.7, "amazing": 0.8, "awesome": 0.8, "wonderful": 0.8, "fantastic": 0.8,
+    "excellent": 0.8, "nice": 0.4, "fine": 0.2, "okay": 0.1, "ok": 0.1, "better": 0.4, "best": 0.7,
+    "happy": 0.7, "glad": 0.6, "joy": 0.7, "joyful": 0.7, "excited": 0.6, "calm": 0.4, "relaxed": 0.5,
+    "peaceful": 0.5, "grateful": 0.7, "thankful": 0.7, "thanks": 0.4, "thank": 0.4, "love": 0.7,
+    "loved": 0.7, "lovely": 0.6, "proud": 0.6, "hopeful": 0.5, "hope": 0.3, "confident": 0.5,
+    "motivated": 0.5, "energized": 0.5, "rested": 0.4, "content": 0.4, "enjoy": 0.5, "enjoyed": 0.5,
+    "fun": 0.5, "smile": 0.5, "laugh": 0.5, "safe": 0.4, "supported": 0.5, "relieved": 0.5,
+    "optimistic": 0.6, "accomplished": 0.6, "productive": 0.5, "progress": 0.4, "helpful": 0.4,
+    "beautiful": 0.6, "cheerful": 0.6, "delighted": 0.7, "blessed": 0.6, "thrilled": 0.8,
+    "appreciate": 0.5, "appreciated": 0.5,
+    # Negative
+    "bad": -0.5, "terrible": -0.8, "awful": -0.8, "horrible": -0.8, "worse": -0.6, "worst": -0.8,
+    "sad": -0.6, "unhappy": -0.6, "depressed": -0.8, "depressing": -0.7, "down": -0.3, "low": -0.3,
+    "lonely": -0.6, "alone": -0.4, "isolated": -0.6, "anxious": -0.6, "anxiety": -0.6, "worried": -0.5,
+    "worry": -0.5, "nervous": -0.5, "scared": -0.6, "afraid": -0.6, "fear": -0.6, "panic": -0.7,
+    "stressed": -0.6, "stress": -0.5, "overwhelmed": -0.7, "overwhelming": -0.6, "exhausted": -0.6,
+    "tired": -0.4, "drained": -0.6, "hopeless": -0.9, "helpless": -0.8, "worthless": -0.9,
+    "empty": -0.6, "numb": -0.6, "angry": -0.6, "mad": -0.5, "furious": -0.8, "frustrated": -0.6,
+    "frustrating": -0.6, "annoyed": -0.4, "upset": -0.6, "hurt": -0.6, "pain": -0.6, "painful": -0.6,
+    "cry": -0.5, "crying": -0.6, "cried": -0.5, "miserable": -0.8, "hate": -0.7, "guilty": -0.6,
+    "ashamed": -0.7, "shame": -0.6, "struggling": -0.5, "struggle": -0.5, "difficult": -0.4,
+    "hard": -0.3, "dread": -0.7, "dreading": -0.7, "disconnected": -0.5, "pointless": -0.7,
+    "failure": -0.7, "failed": -0.6, "sick": -0.5, "broken": -0.6, "lost": -0.4, "confused": -0.3,
+    "insecure": -0.5, "rejected": -0.6, "grief": -0.7, "grieving": -0.7, "suicidal": -1.0,
+    "stuck": -0.5, "burden": -0.6, "awkward": -0.4, "hurts": -0.6,
+}
+
+NEGATIONS = {"not", "no", "never", "none", "nothing", "nobody", "neither", "nor", "cannot",
+             "can't", "cant", "don't", "dont", "doesn't", "doesnt", "didn't", "didnt", "isn't",
+             "isnt", "wasn't", "wasnt", "aren't", "arent", "won't", "wont", "haven't", "havent",
+             "hardly", "barely"}
+
+INTENSIFIERS = {"very": 1.3, "so": 1.3, "really": 1.3, "extremely": 1.5, "incredibly": 1.5,
+                "totally": 1.3, "completely": 1.4, "super": 1.3, "too": 1.2, "absolutely": 1.4,
+                "slightly": 0.6, "somewhat": 0.7, "little": 0.7, "kinda": 0.7, "kind": 0.8}
+
+# Clause after a contrast word usually carries the real sentiment ("I'm fine but ...")
+CONTRAST_WORDS = {"but", "however", "although", "though", "yet"}
+
+TOKEN_PATTERN = re.compile(r"[a-z']+")
+
+# Tiering thresholds: below this |score| the text is treated as near neutral and escalated
+LEXICON_CONFIDENT_SCORE = float(os.getenv("SENTIMENT_LEXICON_CONFIDENT_SCORE", "0.35"))
+# Texts longer than this many words go straight to the transformer model
+LEXICON_MAX_WORDS = int(os.getenv("SENTIMENT_LEXICON_MAX_WORDS", "25"))
+
+_stats_lock = threading.Lock()
+_tier_stats = {"fast": 0, "escalated": 0}
+
+
+def score_lexicon(text: str) -> Tuple[float, Dict[str, Any]]:
+    """
+    Score a text with the lexicon rules
+    :param text: the text to score
+    :return: tuple (score between -1 and 1, details used for the escalation decision)
+    """
+    tokens = TOKEN_PATTERN.findall((text or "").lower().replace("’", "'"))
+
+    total = 0.0
+    positive_hits = 0
+    negative_hits = 0
+    negated = False
+    clause_weight = 1.0
+
+    for index, token in enumerate(tokens):
+        if token in CONTRAST_WORDS:
+            # Words before the contrast count less, words after it count more
+            total *= 0.5
+            clause_weight = 1.5
+            continue
+
+        valence = LEXICON.get(token)
+        if valence is None:
+            continue
+
+        # Look at the three previous words for negations and intensifiers
+        window = tokens[max(0, index - 3):index]
+        if any(word in NEGATIONS for word in window):
+            valence *= -0.6
+            negated = True
+        for word in window:
+            valence *= INTENSIFIERS.get(word, 1.0)
+
+        if valence > 0:
+            positive_hits += 1
+        elif valence < 0:
+            negative_hits += 1
+        total += valence * clause_weight
+
+    # Squash the sum into -1..1 (same idea as VADER's compound score)
+    score = total / math.sqrt(total * total + 1) if total else 0.0
+
+    return score, {
+        "words": len(tokens),
+        "positive_hits": positive_hits,
+        "negative_hits": negative_hits,
+        "negated": negated
+    }
+
+
+def needs_escalation(score: float, details: Dict[str, Any]) -> bool:
+    """
+    Decide whether the lexicon score is too uncertain to use
+    :param score: the lexicon score
+    :param details: details returned by score_lexicon
+    :return: True if the transformer model should score the text
+    """
+    if details["words"] > LEXICON_MAX_WORDS:
+        return True
+    if abs(score) < LEXICON_CONFIDENT_SCORE:
+        return True
+    if details["positive_hits"] and details["negative_hits"]:
+        return True
+    if details["negated"]:
+        return True
+    return False
+
+
+def fast_sentiment(text: str) -> Optional[float]:
+    """
+    First tier of tiered sentiment
+    :param text: the text to score
+    :return: a normalized score between -1 and 1, or None if the text needs the transformer model
+    """
+    score, details = score_lexicon(text)
+    escalate = needs_escalation(score, details)
+
+    with _stats_lock:
+        _tier_stats["escalated" if escalate else "fast"] += 1
+
+    return None if escalate else round(score, 4)
+
+
+def get_tier_stats() -> Dict[str, Any]:
+    """
+    Get how many texts were answered by the fast tier and how many were escalated
+    :return: dictionary of counters and the escalation rate
+    """
+    with _stats_lock:
+        total = _tier_stats["fast"] + _tier_stats["escalated"]
+        return {
+            "fast": _tier_stats["fast"],
+            "escalated": _tier_stats["escalated"],
+            "escalation_rate": round(_tier_stats["escalated"] / total, 4) if total else 0
+        }
@@ -0,0 +1,238 @@
+"""
+Sentiment Model Registry
+Loads the Hugging Face sentiment pipeline once per process and shares it between requests,
+so that scoring a message is a forward pass instead of a full model load.
+
+Supported inference backends (SENTIMENT_BACKEND):
+- pytorch: full-precision model (default)
+- int8: dynamic int8 quantization of the Linear layers for CPU inference
+- onnx: ONNX graph exported with optimum and run with onnxruntime
+"""
+from dotenv import load_dotenv
+from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
+from datetime import datetime, timezone
+from typing import Dict, Any
+import os
+import time
+import logging
+import threading
+
+# ONNX Runtime imports (optional)
+try:
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+load_dotenv()
+
+# Current model used: cardiffnlp/twitter-roberta-base-sentiment-latest
+SENTIMENT_MODEL_NAME = os.getenv("SENTIMENT_MODEL_NAME", "cardiffnlp/twitter-roberta-base-sentiment-latest")
+
+SENTIMENT_BACKENDS = ("pytorch", "int8", "onnx")
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "pytorch").lower()
+
+# Where the exported ONNX graph is kept so it is only exported once
+SENTIMENT_ONNX_DIR = os.getenv("SENTIMENT_ONNX_DIR", os.path.join("models", "sentiment-onnx"))
+
+# Short text used to run one forward pass right after loading
+WARMUP_TEXT = "I am feeling okay today, thank you for asking."
+
+# Process-wide shared pipeline (one per gunicorn worker)
+_sentiment_pipeline = None
+_load_lock = threading.Lock()
+
+_model_status: Dict[str, Any] = {
+    "state": "not_loaded",  # not_loaded, loading, loaded, ready, failed
+    "model": SENTIMENT_MODEL_NAME,
+    "backend": SENTIMENT_BACKEND,
+    "load_seconds": None,
+    "warmup_seconds": None,
+    "loaded_at": None,
+    "error": None
+}
+
+
+def normalize_sentiment(label, score):
+    """
+    Convert a sentiment label and its confidence into a single score
+    :param label: the predicted label (positive, negative or neutral)
+    :param score: the confidence of the predicted label
+    :return: a normalized sentiment score between -1 and 1
+    """
+    label = label.lower()
+
+    # Normalize the sentiment score
+    sentiment_mapping = {
+        "positive": 1,
+        "negative": -1,
+        "neutral": 0
+    }
+
+    normalized_score = sentiment_mapping[label] * score
+
+    if label == "neutral":
+        if score > 0.7:
+            normalized_score = 0.2
+        elif normalized_score < 0.3:
+            normalized_score = -0.2
+        else:
+            normalized_score = 0
+
+    return normalized_score
+
+
+def _load_int8_pipeline(model_name):
+    """
+    Build a pipeline around a dynamically int8-quantized copy of the model
+    :param model_name: Hugging Face model name
+    :return: the sentiment-analysis pipeline
+    """
+    import torch
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+
+    # Weights of the Linear layers are stored as int8, activations are quantized on the fly
+    quantized_model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    return pipeline("sentiment-analysis", model=quantized_model, tokenizer=tokenizer)
+
+
+def _load_onnx_pipeline(model_name):
+    """
+    Build a pipeline around an ONNX export of the model run with onnxruntime.
+    The graph is exported on first use and reused from SENTIMENT_ONNX_DIR afterwards.
+    :param model_name: Hugging Face model name
+    :return: the sentiment-analysis pipeline
+    """
+    if os.path.exists(os.path.join(SENTIMENT_ONNX_DIR, "model.onnx")):
+        model = ORTModelForSequenceClassification.from_pretrained(SENTIMENT_ONNX_DIR)
+        tokenizer = AutoTokenizer.from_pretrained(SENTIMENT_ONNX_DIR)
+    else:
+        logging.info(f"Exporting '{model_name}' to ONNX in {SENTIMENT_ONNX_DIR}...")
+        model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model.save_pretrained(SENTIMENT_ONNX_DIR)
+        tokenizer.save_pretrained(SENTIMENT_ONNX_DIR)
+
+    return pipeline("sentiment-analysis", model=model, tokenizer=tokenizer)
+
+
+def load_sentiment_pipeline(backend="pytorch", model_name=SENTIMENT_MODEL_NAME):
+    """
+    Build a new sentiment pipeline for the given inference backend (not shared).
+    Falls back to the full-precision pytorch model if the backend is unknown or unavailable.
+    :param backend: pytorch, int8 or onnx
+    :param model_name: Hugging Face model name
+    :return: tuple (pipeline, backend actually used)
+    """
+    backend = backend.lower()
+
+    if backend not in SENTIMENT_BACKENDS:
+        logging.warning(f"Unknown sentiment backend '{backend}', using pytorch")
+        backend = "pytorch"
+
+    if backend == "onnx" and not ONNX_AVAILABLE:
+        logging.warning("optimum[onnxruntime] not installed - using pytorch sentiment backend")
+        backend = "pytorch"
+
+    if backend == "int8":
+        try:
+            return _load_int8_pipeline(model_name), "int8"
+        except Exception as e:
+            logging.warning(f"int8 quantization failed, using pytorch sentiment backend: {e}")
+            backend = "pytorch"
+
+    if backend == "onnx":
+        try:
+            return _load_onnx_pipeline(model_name), "onnx"
+        except Exception as e:
+            logging.warning(f"ONNX export failed, using pytorch sentiment backend: {e}")
+            backend = "pytorch"
+
+    return pipeline("sentiment-analysis", model=model_name), "pytorch"
+
+
+def get_sentiment_pipeline():
+    """
+    Return the shared sentiment analysis pipeline, loading it on first use.
+    Loading is guarded by a lock so concurrent first requests only load the model once.
+    :return: the Hugging Face sentiment-analysis pipeline
+    """
+    global _sentiment_pipeline
+
+    if _sentiment_pipeline is not None:
+        return _sentiment_pipeline
+
+    with _load_lock:
+        # Another thread may have finished loading while we were waiting
+        if _sentiment_pipeline is not None:
+            return _sentiment_pipeline
+
+        _model_status["state"] = "loading"
+        _model_status["error"] = None
+        start_time = time.perf_counter()
+
+        try:
+            logging.info(f"Loading sentiment model '{SENTIMENT_MODEL_NAME}' ({SENTIMENT_BACKEND} backend)...")
+            _sentiment_pipeline, _model_status["backend"] = load_sentiment_pipeline(SENTIMENT_BACKEND)
+        except Exception as e:
+            _model_status["state"] = "failed"
+            _model_status["error"] = str(e)
+            logging.error(f"Failed to load sentiment model: {e}")
+            raise
+
+        _model_status["state"] = "loaded"
+        _model_status["load_seconds"] = round(time.perf_counter() - start_time, 3)
+        _model_status["loaded_at"] = datetime.now(timezone.utc).isoformat()
+        logging.info(f"Sentiment model loaded in {_model_status['load_seconds']}s")
+
+    return _sentiment_pipeline
+
+
+def get_sentiment_backend() -> str:
+    """
+    Get the inference backend of the shared pipeline. It differs from SENTIMENT_BACKEND when
+    int8 or onnx fell back to pytorch; until the pipeline is loaded it is the requested backend.
+    :return: pytorch, int8 or onnx
+    """
+    return _model_status["backend"]
+
+
+def warmup_sentiment_model() -> bool:
+    """
+    Load the sentiment model (if needed) and run one forward pass so the first real
+    request does not pay for lazy initialization.
+    :return: True if the model is ready, False otherwise
+    """
+    try:
+        sentiment_analyzer = get_sentiment_pipeline()
+
+        start_time = time.perf_counter()
+        sentiment_analyzer(WARMUP_TEXT)
+        _model_status["warmup_seconds"] = round(time.perf_counter() - start_time, 3)
+        _model_status["state"] = "ready"
+
+        logging.info(f"Sentiment model warmed up in {_model_status['warmup_seconds']}s")
+        return True
+
+    except Exception as e:
+        _model_status["state"] = "failed"
+        _model_status["error"] = str(e)
+        logging.error(f"Sentiment model warmup failed: {e}")
+        return False
+
+
+def is_sentiment_model_ready() -> bool:
+    """Check whether the shared sentiment model is loaded and warmed up"""
+    return _model_status["state"] == "ready"
+
+
+def get_sentiment_model_status() -> Dict[str, Any]:
+    """
+    Get a snapshot of the sentiment model readiness
+    :return: dictionary with state, model name and load/warmup timings
+    """
+    return dict(_model_status)
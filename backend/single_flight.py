@@ -0,0 +1,118 @@
+"""
+Single-flight call coalescing
+Concurrent calls with the same key share one execution: the first caller runs the function
+and every caller that arrives while it is in flight waits for and gets the same result (or
+exception). Works from threads (do) and from the event loop (ado).
+"""
+from typing import Any, Awaitable, Callable, Dict
+import asyncio
+import threading
+
+
+class _Call:
+    """One in-flight execution and its outcome"""
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls by key
+    """
+
+    def __init__(self, name: str = "single_flight"):
+        """
+        :param name: name used in stats
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[Any, Dict[str, asyncio.Future]] = {}
+
+        # Counters
+        self._executions = 0
+        self._coalesced = 0
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        """
+        Run func once for all concurrent callers with the same key (blocking)
+        :param key: the call's key (e.g. a content hash)
+        :param func: function to run if no call with this key is in flight
+        :return: the shared result
+        :raises: the shared exception if the call failed
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._executions += 1
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await func once for all concurrent callers on this event loop with the same key
+        :param key: the call's key (e.g. a content hash)
+        :param func: coroutine function to await if no call with this key is in flight
+        :return: the shared result
+        :raises: the shared exception if the call failed
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            calls = self._async_calls.setdefault(loop, {})
+            future = calls.get(key)
+            if future is not None:
+                self._coalesced += 1
+            else:
+                # The call runs as its own task, so a cancelled caller doesn't cancel it for the others
+                future = asyncio.ensure_future(func())
+                calls[key] = future
+                self._executions += 1
+                future.add_done_callback(lambda done: self._forget(loop, key, done))
+        return await asyncio.shield(future)
+
+    def _forget(self, loop, key, future):
+        with self._lock:
+            calls = self._async_calls.get(loop)
+            if calls is not None and calls.get(key) is future:
+                del calls[key]
+                if not calls:
+                    del self._async_calls[loop]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get coalescing counters
+        :return: dictionary with executions, coalesced calls and calls in flight
+        """
+        with self._lock:
+            total = self._executions + self._coalesced
+            return {
+                "name": self.name,
+                "executions": self._executions,
+                "coalesced": self._coalesced,
+                "coalesced_rate": round(self._coalesced / total, 4) if total else 0,
+                "in_flight": len(self._calls) + sum(len(calls) for calls in self._async_calls.values())
+            }
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Circuit breaker test: the breaker opens when too many calls in its window fail or are slow,
+rejects calls while open, half-opens after its cool down to let a probe through, and closes
+again if the probe succeeds (or reopens if it fails). Cancelled calls release their probe slot.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+
+OPEN_SECONDS = 0.1
+
+
+def new_breaker(name):
+    return CircuitBreaker(name, window_seconds=60, min_calls=4, failure_rate=0.5, slow_call_seconds=0.05,
+                          slow_call_rate=0.8, open_seconds=OPEN_SECONDS, half_open_calls=1)
+
+
+def failing_call():
+    raise ConnectionError("provider down")
+
+
+def run(breaker, func):
+    """Run a call through the breaker, returning the result or the exception"""
+    try:
+        return breaker.call(func)
+    except Exception as e:
+        return e
+
+
+def check_open_and_close():
+    """closed -> open -> half_open -> closed"""
+    success = True
+    breaker = new_breaker("transitions")
+
+    # Below min_calls failures don't open the breaker; at a 50% failure rate they do
+    run(breaker, failing_call)
+    run(breaker, lambda: "ok")
+    run(breaker, failing_call)
+    before_min_calls = breaker.get_state()["state"]
+    run(breaker, lambda: "ok")
+    opened = breaker.get_state()["state"]
+
+    rejected = run(breaker, lambda: "ok")
+
+    # After the cool down one probe goes through; a second one at the same time is rejected
+    time.sleep(OPEN_SECONDS * 1.5)
+    probe_allowed = breaker.allow_request()
+    half_open = breaker.get_state()["state"]
+    second_probe_allowed = breaker.allow_request()
+    breaker.record_success(0.01)
+    closed = breaker.get_state()
+
+    print(f"Transitions: {before_min_calls} before min calls, {opened} at 50% failures, "
+          f"rejected with {type(rejected).__name__}, {half_open} after the cool down "
+          f"(probe {probe_allowed}, second probe {second_probe_allowed}), {closed['state']} after the probe")
+    success &= before_min_calls == CLOSED and opened == OPEN
+    success &= isinstance(rejected, CircuitOpenError)
+    success &= probe_allowed and half_open == HALF_OPEN and not second_probe_allowed
+    success &= closed["state"] == CLOSED and closed["calls_in_window"] == 0
+    return success
+
+
+def check_failed_probe_and_slow_calls():
+    """A failed or slow probe reopens the breaker, and slow calls open it too"""
+    success = True
+    breaker = new_breaker("probes")
+    for _ in range(4):
+        run(breaker, failing_call)
+    time.sleep(OPEN_SECONDS * 1.5)
+    run(breaker, failing_call)
+    after_failed_probe = breaker.get_state()["state"]
+
+    time.sleep(OPEN_SECONDS * 1.5)
+    breaker.allow_request()
+    breaker.record_success(1.0)
+    after_slow_probe = breaker.get_state()["state"]
+
+    slow = new_breaker("slow")
+    for _ in range(4):
+        slow.allow_request()
+        slow.record_success(0.1)
+    slow_state = slow.get_state()["state"]
+
+    print(f"Probes: {after_failed_probe} after a failed probe, {after_slow_probe} after a slow probe, "
+          f"{slow_state} after slow calls")
+    success &= after_failed_probe == OPEN and after_slow_probe == OPEN and slow_state == OPEN
+    return success
+
+
+async def check_cancelled_probe():
+    """A probe cancelled by the caller frees the slot without closing or reopening the breaker"""
+    breaker = new_breaker("cancelled")
+    for _ in range(4):
+        run(breaker, failing_call)
+    await asyncio.sleep(OPEN_SECONDS * 1.5)
+
+    task = asyncio.create_task(breaker.acall(asyncio.sleep, 10))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    after_cancel = breaker.get_state()["state"]
+    next_probe = await breaker.acall(asyncio.sleep, 0, result="ok")
+    print(f"Cancelled probe: {after_cancel} after the cancellation, next probe {next_probe!r}, "
+          f"{breaker.get_state()['state']} after it")
+    return after_cancel == HALF_OPEN and next_probe == "ok" and breaker.get_state()["state"] == CLOSED
+
+
+async def main():
+    success = check_open_and_close()
+    success &= check_failed_probe_and_slow_calls()
+    success &= await check_cancelled_probe()
+    return success
+
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    print(f"\nResult: {'SUCCESS' if success else 'FAILED'}")
+    sys.exit(0 if success else 1)
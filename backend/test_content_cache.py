@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Content cache test: keys ignore case and whitespace (unless normalize=False) and differ by
+namespace, the memory tier evicts the least recently used entry beyond max_entries, entries
+expire after their TTL in memory and on disk, and caches on the same disk file (other workers,
+restarts) share its entries.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from content_cache import ContentCache
+
+
+def check_keys():
+    """Normalized and exact keys, and namespaces"""
+    cache = ContentCache(name="keys", namespace="model-a")
+    exact = ContentCache(name="exact", namespace="model-a", normalize=False)
+    other = ContentCache(name="other", namespace="model-b")
+    cache.set("I'm  fine", 0.5)
+    found_normalized, value = cache.get("i'm fine")
+    exact.set("I'm  fine", 0.5)
+    found_exact, _ = exact.get("i'm fine")
+    print(f"Keys: normalized hit {found_normalized} ({value}), exact-text hit {found_exact}, "
+          f"same key across namespaces {cache.make_key('hi') == other.make_key('hi')}")
+    return found_normalized and value == 0.5 and not found_exact and cache.make_key("hi") != other.make_key("hi")
+
+
+def check_lru():
+    """The least recently used entry is evicted first"""
+    cache = ContentCache(name="lru", max_entries=3, ttl_seconds=None)
+    for text in ("a", "b", "c"):
+        cache.set(text, text.upper())
+    # Reading "a" makes "b" the least recently used
+    cache.get("a")
+    cache.set("d", "D")
+    present = [text for text in ("a", "b", "c", "d") if cache.get(text)[0]]
+    stats = cache.get_stats()
+    print(f"LRU: kept {present}, size {stats['size']}, evictions {stats['evictions']}")
+    return present == ["a", "c", "d"] and stats["size"] == 3 and stats["evictions"] == 1
+
+
+def check_ttl(disk_path):
+    """Entries expire after the TTL, in memory and on disk"""
+    cache = ContentCache(name="ttl", max_entries=10, ttl_seconds=0.1, disk_path=disk_path)
+    cache.set("hello", 1)
+    fresh = cache.get("hello")[0]
+    time.sleep(0.15)
+    expired_memory = not cache.get("hello", use_disk=False)[0]
+    expired_disk = not cache.get("hello")[0]
+    stats = cache.get_stats()
+    print(f"TTL: fresh hit {fresh}, expired in memory {expired_memory}, expired on disk {expired_disk}, "
+          f"expirations {stats['expirations']}")
+    return fresh and expired_memory and expired_disk and stats["expirations"] == 2
+
+
+def check_disk_tier(disk_path):
+    """A second cache on the same file (another worker or a restart) is served from disk"""
+    writer = ContentCache(name="writer", namespace="ns", ttl_seconds=None, disk_path=disk_path)
+    writer.set("thanks", {"score": 0.8})
+    reader = ContentCache(name="reader", namespace="ns", ttl_seconds=None, disk_path=disk_path)
+    found, value = reader.get("Thanks")
+    stats = reader.get_stats()
+    print(f"Disk tier: found {found} ({value}), disk hits {stats['disk_hits']}")
+    return found and value == {"score": 0.8} and stats["disk_hits"] == 1
+
+
+def main():
+    success = check_keys()
+    success &= check_lru()
+    with tempfile.TemporaryDirectory() as directory:
+        success &= check_ttl(os.path.join(directory, "ttl.sqlite3"))
+        success &= check_disk_tier(os.path.join(directory, "shared.sqlite3"))
+    return success
+
+
+if __name__ == "__main__":
+    success = main()
+    print(f"\nResult: {'SUCCESS' if success else 'FAILED'}")
+    sys.exit(0 if success else 1)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Daily summary pipeline test: the watermark moves to the newest summarized record, stops before
+a day that failed (so it is retried on the next run), and --rebuild redoes every day.
+Storage and the LLM are replaced by in-memory fakes, so no database or API key is needed.
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import daily_summary_pipeline as pipeline
+from daily_summary_pipeline import summarize_user
+
+USER = "alice"
+
+# (collection, timestamp, text) of the user's records over three days
+RECORDS = [
+    ("conversation", "2026-10-01T09:00:00.000000+00:00", "I slept badly"),
+    ("journal", "2026-10-01T21:00:00.000000+00:00", "A long day"),
+    ("conversation", "2026-10-02T10:00:00.000000+00:00", "Work was fine"),
+    ("conversation", "2026-10-03T08:30:00.000000+00:00", "Feeling better today"),
+]
+
+
+class FakeStorage:
+    """In-memory records, summaries and watermarks"""
+
+    def __init__(self, failing_day=None):
+        self.records = list(RECORDS)
+        self.summaries = {}
+        self.watermarks = {}
+        self.failing_day = failing_day
+
+    def get_record_timestamps(self, collection_name, username, after=None):
+        return sorted(timestamp for collection, timestamp, _ in self.records
+                      if collection == collection_name
+                      and (after is None or pipeline.parse_timestamp(timestamp) > after))
+
+    def _by_date(self, collection_name, date):
+        return [{"timestamp": timestamp, "user_input": text, "entry": text, "sentiment_score": None}
+                for collection, timestamp, text in self.records
+                if collection == collection_name and timestamp.startswith(date)]
+
+    def get_chats_by_date(self, date, username=None):
+        if date == self.failing_day:
+            raise Exception("MongoDB connection failed")
+        return self._by_date("conversation", date)
+
+    def get_journals_by_date(self, date, username=None):
+        return self._by_date("journal", date)
+
+    def upsert_daily_summary(self, summary):
+        self.summaries[(summary["username"], summary["date"])] = summary
+
+    def get_summary_watermark(self, username):
+        return self.watermarks.get(username)
+
+    def set_summary_watermark(self, username, watermark):
+        self.watermarks[username] = watermark
+
+    def install(self):
+        for name in ("get_record_timestamps", "get_chats_by_date", "get_journals_by_date", "upsert_daily_summary",
+                     "get_summary_watermark", "set_summary_watermark"):
+            setattr(pipeline, name, getattr(self, name))
+
+
+summarized_texts = []
+
+
+def fake_summarize(text):
+    summarized_texts.append(text)
+    return f"summary of {len(text)} characters"
+
+
+def fake_score(texts):
+    return [0.5 for _ in texts]
+
+
+def run(**kwargs):
+    return summarize_user(USER, summarize_text=fake_summarize, score_texts=fake_score, **kwargs)
+
+
+def main():
+    success = True
+
+    # First run: every day is summarized and the watermark moves to the newest record
+    storage = FakeStorage()
+    storage.install()
+    report = run()
+    print(f"First run: summarized {report['summarized']}, watermark {report['watermark']}")
+    success &= report["summarized"] == ["2026-10-01", "2026-10-02", "2026-10-03"]
+    success &= storage.watermarks[USER] == RECORDS[-1][1]
+    success &= storage.summaries[(USER, "2026-10-01")]["sentiment_score"] == 0.5
+
+    # Second run without new records: nothing to do, no LLM call
+    calls = len(summarized_texts)
+    report = run()
+    print(f"Second run: pending {report['pending']}, LLM calls {len(summarized_texts) - calls}")
+    success &= report["pending"] == [] and len(summarized_texts) == calls
+
+    # A new record only rebuilds its own day
+    storage.records.append(("journal", "2026-10-03T22:00:00.000000+00:00", "Went for a walk"))
+    report = run()
+    print(f"New record: summarized {report['summarized']}, watermark {report['watermark']}")
+    success &= report["summarized"] == ["2026-10-03"]
+    success &= storage.watermarks[USER] == "2026-10-03T22:00:00.000000+00:00"
+
+    # A failed day stops the run: the watermark stays before it and later days wait
+    storage = FakeStorage(failing_day="2026-10-02")
+    storage.install()
+    report = run()
+    print(f"Failed day: summarized {report['summarized']}, failed {report['failed']}, "
+          f"watermark {report['watermark']}")
+    success &= report["summarized"] == ["2026-10-01"] and report["failed"] == "2026-10-02"
+    success &= storage.watermarks[USER] == RECORDS[1][1]
+    success &= (USER, "2026-10-03") not in storage.summaries
+
+    # The next run retries the failed day and the ones after it
+    storage.failing_day = None
+    report = run()
+    print(f"Retry: summarized {report['summarized']}, watermark {report['watermark']}")
+    success &= report["summarized"] == ["2026-10-02", "2026-10-03"]
+    success &= storage.watermarks[USER] == RECORDS[-1][1]
+
+    # --rebuild ignores the watermark and redoes every day
+    report = run(rebuild=True)
+    print(f"Rebuild: summarized {report['summarized']}, watermark {report['watermark']}")
+    success &= report["summarized"] == ["2026-10-01", "2026-10-02", "2026-10-03"]
+    success &= storage.watermarks[USER] == RECORDS[-1][1]
+
+    # --dry-run only reports
+    storage.records.append(("conversation", "2026-10-04T07:00:00.000000+00:00", "Good morning"))
+    report = run(dry_run=True)
+    print(f"Dry run: pending {report['pending']}, watermark {storage.watermarks[USER]}")
+    success &= report["pending"] == ["2026-10-04"] and (USER, "2026-10-04") not in storage.summaries
+    success &= storage.watermarks[USER] == RECORDS[-1][1]
+    return success
+
+
+if __name__ == "__main__":
+    success = main()
+    print(f"\nResult: {'SUCCESS' if success else 'FAILED'}")
+    sys.exit(0 if success else 1)
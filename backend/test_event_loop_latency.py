@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Latency test: /receive_hello/ must stay fast while chat messages are being scored.
+Runs the FastAPI app in-process, keeps the sentiment pool busy with concurrent messages
+and measures /receive_hello/ latency, compared with scoring directly on the event loop.
+"""
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fast_api import app
+from llm_handler import analyze_sentiment, analyze_sentiment_async, sentiment_batcher
+from sentiment_model_registry import warmup_sentiment_model
+
+MESSAGES = [
+    "I feel exhausted all the time, even when I haven't done much.",
+    "Today was actually a good day, I went for a walk with a friend.",
+    "I'm fine, thanks.",
+    "Mornings are the hardest. Getting out of bed feels impossible.",
+] * 25
+
+# /receive_hello/ should answer well within this while chats are scored
+MAX_P95_MS = 50
+
+
+async def measure_hello(client, stop_event, latencies):
+    """Call /receive_hello/ every 20ms until stopped"""
+    while not stop_event.is_set():
+        start_time = time.perf_counter()
+        response = await client.get("/receive_hello/")
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        assert response.status_code == 200
+        await asyncio.sleep(0.02)
+
+
+async def score_on_event_loop():
+    """Old behaviour: blocking model calls inside the async handler"""
+    for text in MESSAGES:
+        analyze_sentiment(text)
+        await asyncio.sleep(0)
+
+
+async def score_off_event_loop():
+    """New behaviour: batched scoring in the bounded inference pool"""
+    await asyncio.gather(*[analyze_sentiment_async(text) for text in MESSAGES])
+
+
+async def run_scenario(name, scorer):
+    """Score all messages while measuring /receive_hello/ latency"""
+    latencies = []
+    stop_event = asyncio.Event()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        hello_task = asyncio.create_task(measure_hello(client, stop_event, latencies))
+        start_time = time.perf_counter()
+        await scorer()
+        scoring_seconds = time.perf_counter() - start_time
+        stop_event.set()
+        await hello_task
+
+    latencies.sort()
+    p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+    print(f"{name}: scored {len(MESSAGES)} messages in {scoring_seconds:.2f}s, "
+          f"/receive_hello/ calls={len(latencies)} p50={latencies[len(latencies) // 2]:.1f}ms "
+          f"p95={p95:.1f}ms max={latencies[-1]:.1f}ms")
+    return p95
+
+
+async def main():
+    print("Warming up sentiment model...")
+    warmup_sentiment_model()
+
+    await run_scenario("on event loop ", score_on_event_loop)
+    p95 = await run_scenario("off event loop", score_off_event_loop)
+    print(f"Batching: {sentiment_batcher.get_metrics()}")
+
+    await sentiment_batcher.close()
+    return p95 <= MAX_P95_MS
+
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    print(f"\nResult: {'SUCCESS' if success else 'FAILED'} (p95 limit {MAX_P95_MS}ms)")
+    sys.exit(0 if success else 1)
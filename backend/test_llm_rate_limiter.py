@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Adaptive limiter test: the concurrency limit halves on a 429 (once per burst) and grows back
+additively, calls waiting for a permit are served first come first served, and calls that
+can't get a permit before their deadline (or find the queue full) are rejected.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from llm_errors import OverloadedError
+from llm_rate_limiter import AdaptiveLimiter, SUCCESS, RATE_LIMITED, CANCELLED
+
+
+def check_aimd():
+    """429s shrink the limit multiplicatively, healthy calls grow it additively"""
+    success = True
+    limiter = AdaptiveLimiter("aimd", initial_limit=8, min_limit=1, max_limit=16)
+
+    limiter.acquire()
+    limiter.release(0.2, RATE_LIMITED)
+    halved = limiter.get_state()["concurrency_limit"]
+
+    # A second 429 from the same burst doesn't shrink it again
+    limiter.acquire()
+    limiter.release(0.2, RATE_LIMITED)
+    after_burst = limiter.get_state()
+
+    # Cancelled calls don't move the limit
+    limiter.acquire()
+    limiter.release(0.2, CANCELLED)
+    after_cancel = limiter.get_state()["concurrency_limit"]
+
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release(0.2, SUCCESS)
+    grown = limiter.get_state()
+
+    print(f"AIMD: 8 -> {halved} on a 429, {after_burst['concurrency_limit']} after the burst "
+          f"({after_burst['decreases']} decrease), {after_cancel} after a cancellation, "
+          f"{grown['concurrency_limit']} after 4 healthy calls")
+    success &= halved == 4 and after_burst["concurrency_limit"] == 4 and after_burst["decreases"] == 1
+    success &= after_cancel == 4
+    success &= 4.9 < grown["concurrency_limit"] < 5 and grown["in_flight"] == 0
+    return success
+
+
+async def check_fifo():
+    """Waiting calls get their permits in arrival order"""
+    limiter = AdaptiveLimiter("fifo", initial_limit=1, min_limit=1, max_limit=1)
+    order = []
+
+    async def call(name):
+        await limiter.acquire_async()
+        order.append(name)
+        await asyncio.sleep(0.01)
+        limiter.release(0.01, SUCCESS)
+
+    await limiter.acquire_async()
+    tasks = []
+    for name in ("a", "b", "c", "d"):
+        tasks.append(asyncio.create_task(call(name)))
+        # Let the call reach the queue before the next one arrives
+        await asyncio.sleep(0.005)
+    queued = limiter.get_state()["queue_depth"]
+    limiter.release(0.01, SUCCESS)
+    await asyncio.gather(*tasks)
+
+    print(f"FIFO: {queued} queued, served in order {order}")
+    return queued == 4 and order == ["a", "b", "c", "d"] and limiter.get_state()["in_flight"] == 0
+
+
+async def check_deadline_rejection():
+    """A call that can't be served before its deadline is rejected at once or when it passes"""
+    success = True
+    limiter = AdaptiveLimiter("deadline", initial_limit=1, min_limit=1, max_limit=1, max_queue=1)
+
+    # With no latency known yet, the call waits and gives up at its deadline
+    await limiter.acquire_async()
+    start_time = time.monotonic()
+    try:
+        await limiter.acquire_async(deadline=time.monotonic() + 0.1)
+        timed_out = False
+    except OverloadedError:
+        timed_out = True
+    waited = time.monotonic() - start_time
+    limiter.release(1.0, SUCCESS)
+
+    # Once calls are known to take ~1s, a call with 0.1s left is rejected without waiting
+    await limiter.acquire_async()
+    start_time = time.monotonic()
+    try:
+        await limiter.acquire_async(deadline=time.monotonic() + 0.1)
+        rejected = False
+    except OverloadedError:
+        rejected = True
+    rejected_after = time.monotonic() - start_time
+
+    # A full queue rejects right away
+    waiter = asyncio.create_task(limiter.acquire_async(deadline=time.monotonic() + 5))
+    await asyncio.sleep(0.01)
+    try:
+        await limiter.acquire_async(deadline=time.monotonic() + 5)
+        queue_full = False
+    except OverloadedError:
+        queue_full = True
+    limiter.release(1.0, SUCCESS)
+    await waiter
+    limiter.release(1.0, SUCCESS)
+
+    state = limiter.get_state()
+    print(f"Deadline: timed out {timed_out} after {waited * 1000:.0f}ms, rejected {rejected} after "
+          f"{rejected_after * 1000:.0f}ms, queue full {queue_full}, state {state}")
+    success &= timed_out and 0.09 <= waited < 0.5 and state["timed_out"] == 1
+    success &= rejected and rejected_after < 0.05 and state["rejected_deadline"] == 1
+    success &= queue_full and state["rejected_queue_full"] == 1
+    success &= state["in_flight"] == 0 and state["queue_depth"] == 0
+    return success
+
+
+async def main():
+    success = check_aimd()
+    success &= await check_fifo()
+    success &= await check_deadline_rejection()
+    return success
+
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    print(f"\nResult: {'SUCCESS' if success else 'FAILED'}")
+    sys.exit(0 if success else 1)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Map-reduce summary test: text is packed into chunks within the token budget without losing or
+reordering lines, dated records are chunked by whole days (so a new day only changes the last
+chunk), partial summaries are reduced level by level until one prompt holds them, and a
+failed chunk summary fails the whole summary. The LLM is replaced by a fake summarizer.
+"""
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from chat_context import count_tokens
+from map_reduce_summary import (summarize_map_reduce, split_for_summary, needs_map_reduce,
+                                SUMMARY_MAP_REDUCE_MIN_TOKENS)
+
+CHUNK_TOKENS = 200
+
+
+def text_of_tokens(tokens, word="calm"):
+    """A text of about the given number of tokens"""
+    words = []
+    while count_tokens(" ".join(words)) < tokens:
+        words.append(word)
+    return " ".join(words)
+
+
+class FakeSummarizer:
+    """Summarizes any text into a fixed-size summary, counting the calls"""
+
+    def __init__(self, summary_tokens, fail_on=None):
+        self.summary = text_of_tokens(summary_tokens, word="summary")
+        self.fail_on = fail_on
+        self.inputs = []
+        self._lock = threading.Lock()
+
+    def __call__(self, text):
+        with self._lock:
+            self.inputs.append(text)
+        if self.fail_on is not None and self.fail_on in text:
+            raise RuntimeError("summary failed")
+        return self.summary
+
+
+def check_text_chunking():
+    """Chunks stay within the budget and keep every line in order"""
+    lines = [f"line{index} " + text_of_tokens(50) for index in range(24)]
+    chunks = split_for_summary("\n".join(lines), CHUNK_TOKENS)
+    rebuilt = "\n".join(chunk.text for chunk in chunks).splitlines()
+    long_line = split_for_summary(text_of_tokens(CHUNK_TOKENS * 3), CHUNK_TOKENS)
+    print(f"Text chunking: {len(lines)} lines in {len(chunks)} chunks of at most "
+          f"{max(count_tokens(chunk.text) for chunk in chunks)} tokens, a {CHUNK_TOKENS * 3}-token line "
+          f"in {len(long_line)} pieces")
+    return (rebuilt == lines and all(count_tokens(chunk.text) <= CHUNK_TOKENS for chunk in chunks)
+            and len(chunks) > 1 and len(long_line) >= 3)
+
+
+def check_record_chunking():
+    """Records are chunked by whole days, and a new day only changes the last chunk"""
+    records = [{"date": f"2026-10-{day:02d}", "summary": text_of_tokens(70)} for day in range(1, 7)]
+    chunks = split_for_summary(records, CHUNK_TOKENS)
+    grown = split_for_summary(records + [{"date": "2026-10-07", "summary": text_of_tokens(70)}], CHUNK_TOKENS)
+    unchanged = [old.text for old in chunks[:-1]] == [new.text for new in grown[:len(chunks) - 1]]
+    print(f"Record chunking: labels {[chunk.label for chunk in chunks]}, earlier chunks unchanged "
+          f"after a new day: {unchanged}")
+    return (all(chunk.label.count("2026-10-") in (1, 2) for chunk in chunks)
+            and sum(chunk.text.count('"date"') for chunk in chunks) == len(records)
+            and unchanged and grown[-1].label.endswith("2026-10-07"))
+
+
+def check_reduce_depth():
+    """Partial summaries are merged level by level until they fit in one prompt"""
+    success = True
+    text = "\n".join(text_of_tokens(60) for _ in range(24))
+    chunks = len(split_for_summary(text, CHUNK_TOKENS))
+
+    # Short partial summaries all fit in one reduce prompt
+    short = FakeSummarizer(10)
+    _, stats = summarize_map_reduce(text, short, chunk_tokens=CHUNK_TOKENS, max_parallel=4)
+    print(f"Short partials: {stats}")
+    success &= stats["chunks"] == chunks and stats["levels"] == 1 and stats["calls"] == chunks + 1
+
+    # Partials of ~40% of the budget pair up: 8 -> 4 -> 2 -> 1
+    long = FakeSummarizer(int(CHUNK_TOKENS * 0.4))
+    summary, stats = summarize_map_reduce(text, long, chunk_tokens=CHUNK_TOKENS, max_parallel=4)
+    print(f"Long partials: {stats}, {len(long.inputs)} summarizer calls")
+    success &= chunks == 8 and stats["levels"] == 3 and stats["calls"] == 8 + 4 + 2 + 1
+    success &= stats["calls"] == len(long.inputs) and summary == long.summary
+
+    # A single chunk needs no reduce
+    _, stats = summarize_map_reduce(text_of_tokens(50), FakeSummarizer(10), chunk_tokens=CHUNK_TOKENS)
+    print(f"Single chunk: {stats}")
+    success &= stats["chunks"] == 1 and stats["levels"] == 0 and stats["calls"] == 1
+    return success
+
+
+def check_failure():
+    """A failed chunk summary fails the whole summary instead of dropping the chunk"""
+    text = "\n".join(text_of_tokens(60) for _ in range(12)) + "\nbroken line"
+    try:
+        summarize_map_reduce(text, FakeSummarizer(10, fail_on="broken"), chunk_tokens=CHUNK_TOKENS, max_parallel=2)
+        failed = False
+    except RuntimeError:
+        failed = True
+    print(f"Failure: raised {failed}")
+    return failed
+
+
+def check_threshold():
+    """Only texts above SUMMARY_MAP_REDUCE_MIN_TOKENS use map-reduce"""
+    block = text_of_tokens(1000)
+    short = needs_map_reduce(block)
+    long = needs_map_reduce("\n".join(block for _ in range(SUMMARY_MAP_REDUCE_MIN_TOKENS // 1000 + 1)))
+    print(f"Threshold: 1k tokens {short}, above {SUMMARY_MAP_REDUCE_MIN_TOKENS} tokens {long}")
+    return not short and long
+
+
+def main():
+    success = check_text_chunking()
+    success &= check_record_chunking()
+    success &= check_reduce_depth()
+    success &= check_failure()
+    success &= check_threshold()
+    return success
+
+
+if __name__ == "__main__":
+    success = main()
+    print(f"\nResult: {'SUCCESS' if success else 'FAILED'}")
+    sys.exit(0 if success else 1)
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Deadline test: LLM calls cut off by a request's deadline must not count against the provider.
+A client can ask for any deadline with X-Request-Timeout, so calls it cuts short must leave
+the circuit breaker closed, the limiter's limits untouched and the timeout counter at zero,
+while real provider timeouts are still recorded as failures.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from circuit_breaker import get_circuit_breaker, CLOSED, OPEN, BREAKER_MIN_CALLS
+from llm_errors import DeadlineExceededError, DEADLINE, TIMEOUT
+from llm_rate_limiter import get_llm_limiter
+from llm_retry import acall_with_retries, call_with_retries, get_retry_stats
+from request_deadline import request_deadline
+
+CALLS = BREAKER_MIN_CALLS * 2
+
+
+async def slow_call():
+    """A provider that answers after the client's deadline"""
+    await asyncio.sleep(0.5)
+    return "late answer"
+
+
+def blocking_call_cut_off():
+    """A blocking call whose HTTP timeout was shortened to the deadline (see direct_gemini_handler)"""
+    time.sleep(0.15)
+    raise DeadlineExceededError("cut off at the request deadline")
+
+
+async def timing_out_call():
+    """A provider whose own client times out"""
+    await asyncio.sleep(0.01)
+    raise asyncio.TimeoutError()
+
+
+async def cut_off_by_deadline(provider):
+    """Run CALLS slow async calls under a 0.1s deadline"""
+    cut_off = 0
+    for _ in range(CALLS):
+        with request_deadline(0.1):
+            try:
+                await acall_with_retries(provider, slow_call)
+            except DeadlineExceededError:
+                cut_off += 1
+    return cut_off
+
+
+def blocking_cut_off_by_deadline(provider):
+    """Run CALLS blocking calls that hit a 0.1s deadline"""
+    cut_off = 0
+    for _ in range(CALLS):
+        with request_deadline(0.1):
+            try:
+                call_with_retries(provider, blocking_call_cut_off)
+            except DeadlineExceededError:
+                cut_off += 1
+    return cut_off
+
+
+async def timing_out(provider):
+    """Run CALLS calls that time out at the provider, with a deadline far away"""
+    for _ in range(CALLS):
+        with request_deadline(30):
+            try:
+                await acall_with_retries(provider, timing_out_call)
+            except Exception:
+                pass
+
+
+async def main():
+    success = True
+
+    cut_off = await cut_off_by_deadline("gemini") + blocking_cut_off_by_deadline("gemini")
+    breaker = get_circuit_breaker("gemini").get_state()
+    limiter = get_llm_limiter("gemini").get_state()
+    errors = get_retry_stats()["errors_by_class"]
+    print(f"Deadline cut-offs: {cut_off}/{CALLS * 2}, breaker {breaker['state']} "
+          f"(calls in window {breaker['calls_in_window']}), limiter in flight {limiter['in_flight']} "
+          f"decreases {limiter['decreases']}, errors {errors}")
+    success &= cut_off == CALLS * 2
+    success &= breaker["state"] == CLOSED and breaker["calls_in_window"] == 0
+    success &= limiter["in_flight"] == 0 and limiter["decreases"] == 0
+    success &= errors.get(DEADLINE) == CALLS * 2 and TIMEOUT not in errors
+
+    # Control: the provider's own timeouts still open the breaker
+    await timing_out("openai")
+    breaker = get_circuit_breaker("openai").get_state()
+    errors = get_retry_stats()["errors_by_class"]
+    print(f"Provider timeouts: breaker {breaker['state']}, errors {errors}")
+    success &= breaker["state"] == OPEN and errors.get(TIMEOUT, 0) > 0
+    return success
+
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    print(f"\nResult: {'SUCCESS' if success else 'FAILED'}")
+    sys.exit(0 if success else 1)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Micro-batcher test: concurrent single inputs are coalesced into one batch call, batches are
+capped at max_batch_size, every caller gets its own result, a failed batch fails each of its
+callers, and inputs beyond max_pending are rejected.
+"""
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sentiment_batcher import MicroBatcher, BatcherOverloadedError, create_inference_executor
+
+executor = create_inference_executor("thread", max_workers=1, name="test-batcher")
+
+
+class RecordingBatchFn:
+    """Batch function recording the batches it was called with"""
+
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.fail_on = fail_on
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        if self.fail_on is not None and self.fail_on in items:
+            raise ValueError(f"cannot score {self.fail_on}")
+        return [item * 10 for item in items]
+
+
+async def check_coalescing():
+    """Inputs arriving within the window share one batch call"""
+    batch_fn = RecordingBatchFn()
+    batcher = MicroBatcher(batch_fn, window_ms=50, max_batch_size=32, name="coalesce", executor=executor)
+    results = await asyncio.gather(*(batcher.submit(i) for i in range(20)))
+    metrics = batcher.get_metrics()
+    await batcher.close()
+    print(f"Coalescing: 20 inputs in {len(batch_fn.batches)} batch call(s) of sizes "
+          f"{[len(batch) for batch in batch_fn.batches]}, avg batch size {metrics['avg_batch_size']}")
+    return len(batch_fn.batches) == 1 and results == [i * 10 for i in range(20)]
+
+
+async def check_max_batch_size():
+    """A burst larger than max_batch_size is split, and results still match their inputs"""
+    batch_fn = RecordingBatchFn()
+    batcher = MicroBatcher(batch_fn, window_ms=50, max_batch_size=4, name="split", executor=executor)
+    results = await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+    await batcher.close()
+    sizes = sorted((len(batch) for batch in batch_fn.batches), reverse=True)
+    print(f"Max batch size 4: batch sizes {sizes}")
+    return sizes == [4, 4, 2] and results == [i * 10 for i in range(10)]
+
+
+async def check_errors_and_overload():
+    """A failed batch raises in each of its callers; a full batcher rejects new inputs"""
+    success = True
+    batch_fn = RecordingBatchFn(fail_on=3)
+    batcher = MicroBatcher(batch_fn, window_ms=20, max_batch_size=32, name="errors", executor=executor,
+                           max_pending=5)
+    results = await asyncio.gather(*(batcher.submit(i) for i in range(7)), return_exceptions=True)
+    failed = [result for result in results if isinstance(result, ValueError)]
+    rejected = [result for result in results if isinstance(result, BatcherOverloadedError)]
+    metrics = batcher.get_metrics()
+
+    # The batcher keeps working after a failed batch
+    after = await batcher.submit(1)
+    await batcher.close()
+    print(f"Errors: {len(failed)} callers got the batch error, {len(rejected)} rejected over max_pending, "
+          f"{metrics['errors_total']} failed batch, next result {after}")
+    success &= len(failed) == 5 and len(rejected) == 2 and metrics["rejected_total"] == 2
+    success &= metrics["errors_total"] == 1 and after == 10
+    return success
+
+
+async def main():
+    success = await check_coalescing()
+    success &= await check_max_batch_size()
+    success &= await check_errors_and_overload()
+    executor.shutdown(wait=False)
+    return success
+
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    print(f"\nResult: {'SUCCESS' if success else 'FAILED'}")
+    sys.exit(0 if success else 1)
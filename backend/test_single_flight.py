@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Single-flight test: concurrent calls with the same key run the function once and share its
+result, from threads (do) and from the event loop (ado); a failure is raised in every waiting
+caller; different keys don't wait for each other; and a key can run again once its call ended.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from single_flight import SingleFlight
+
+CALLERS = 8
+
+
+def check_threads():
+    """Blocking callers: one execution per key, shared result and shared error"""
+    success = True
+    flight = SingleFlight("threads")
+    executions = []
+    started = threading.Event()
+
+    def summarize(text):
+        executions.append(text)
+        started.set()
+        time.sleep(0.1)
+        return f"summary of {text}"
+
+    def fail():
+        executions.append("fail")
+        time.sleep(0.1)
+        raise RuntimeError("provider down")
+
+    def call(key, func):
+        try:
+            return flight.do(key, func)
+        except RuntimeError as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=CALLERS * 2) as pool:
+        leader = pool.submit(call, "same", lambda: summarize("same"))
+        started.wait()
+        followers = [pool.submit(call, "same", lambda: summarize("same")) for _ in range(CALLERS - 1)]
+        results = [leader.result()] + [future.result() for future in followers]
+
+        failing = [pool.submit(call, "bad", fail) for _ in range(CALLERS)]
+        errors = [future.result() for future in failing]
+
+    # The key is free again once its call finished
+    again = flight.do("same", lambda: summarize("same"))
+    stats = flight.get_stats()
+    print(f"Threads: {executions.count('same')} executions for {CALLERS + 1} calls of one key, "
+          f"{sum(isinstance(error, RuntimeError) for error in errors)}/{CALLERS} callers got the error "
+          f"({executions.count('fail')} execution), stats {stats}")
+    success &= results == ["summary of same"] * CALLERS and again == "summary of same"
+    success &= executions.count("same") == 2
+    success &= all(isinstance(error, RuntimeError) for error in errors) and executions.count("fail") == 1
+    success &= stats["in_flight"] == 0
+    return success
+
+
+async def check_async():
+    """Async callers: one execution per key, distinct keys in parallel, a cancelled caller doesn't cancel the call"""
+    success = True
+    flight = SingleFlight("async")
+    executions = []
+
+    async def summarize(text):
+        executions.append(text)
+        await asyncio.sleep(0.1)
+        return f"summary of {text}"
+
+    async def fail():
+        executions.append("fail")
+        await asyncio.sleep(0.05)
+        raise RuntimeError("provider down")
+
+    start_time = time.perf_counter()
+    results = await asyncio.gather(*(flight.ado(key, lambda key=key: summarize(key))
+                                     for key in ["a"] * CALLERS + ["b"] * CALLERS))
+    elapsed = time.perf_counter() - start_time
+
+    errors = await asyncio.gather(*(flight.ado("bad", fail) for _ in range(CALLERS)), return_exceptions=True)
+
+    # The first caller gives up; the others still get the result
+    first = asyncio.create_task(flight.ado("c", lambda: summarize("c")))
+    await asyncio.sleep(0.01)
+    others = [asyncio.create_task(flight.ado("c", lambda: summarize("c"))) for _ in range(2)]
+    first.cancel()
+    shared = await asyncio.gather(*others)
+
+    print(f"Async: executions {executions}, {len(results)} results in {elapsed * 1000:.0f}ms, "
+          f"{sum(isinstance(error, RuntimeError) for error in errors)}/{CALLERS} callers got the error, "
+          f"after a cancelled caller {shared}")
+    success &= results == ["summary of a"] * CALLERS + ["summary of b"] * CALLERS
+    success &= executions.count("a") == 1 and executions.count("b") == 1 and elapsed < 0.19
+    success &= all(isinstance(error, RuntimeError) for error in errors) and executions.count("fail") == 1
+    success &= shared == ["summary of c"] * 2 and executions.count("c") == 1
+    success &= flight.get_stats()["in_flight"] == 0
+    return success
+
+
+async def main():
+    success = check_threads()
+    success &= await check_async()
+    return success
+
+
+if __name__ == "__main__":
+    success = asyncio.run(main())
+    print(f"\nResult: {'SUCCESS' if success else 'FAILED'}")
+    sys.exit(0 if success else 1)
@@ -0,0 +1,271 @@
+"""
+Multi-task text analysis (sentiment + emotion + crisis risk)
+Runs a single forward pass of the shared roberta sentiment encoder per batch and reads all
+heads from it:
+- sentiment: the model's own classification head, normalized like analyze_sentiment
+- emotion: trained linear heads from TEXT_ANALYSIS_HEADS_PATH if available, otherwise
+  similarity of the pooled embedding to emotion prototype phrases
+- risk: crisis phrase rules combined with the risk head / prototypes and the sentiment
+"""
+from typing import Any, Dict, List
+import os
+import re
+import logging
+import threading
+
+import torch
+
+from sentiment_model_registry import get_sentiment_pipeline, load_sentiment_pipeline, normalize_sentiment
+
+TEXT_ANALYSIS_VERSION = 1
+
+# Optional trained heads on top of the shared encoder (torch.save of a dict with
+# emotion_weight, emotion_bias, emotion_labels and optionally risk_weight, risk_bias)
+TEXT_ANALYSIS_HEADS_PATH = os.getenv("TEXT_ANALYSIS_HEADS_PATH", os.path.join("models", "text_analysis_heads.pt"))
+
+# Emotions are reported when their probability is at least this high
+EMOTION_THRESHOLD = float(os.getenv("TEXT_ANALYSIS_EMOTION_THRESHOLD", "0.25"))
+# Risk is "elevated" above this score
+RISK_THRESHOLD = float(os.getenv("TEXT_ANALYSIS_RISK_THRESHOLD", "0.6"))
+
+MAX_TOKENS = 512
+
+EMOTION_PROTOTYPES = {
+    "joy": ["I feel so happy today", "I'm really excited and cheerful", "Things are going great for me"],
+    "gratitude": ["Thank you so much for your help", "I really appreciate that", "I'm grateful for my friends"],
+    "calm": ["I feel peaceful and relaxed", "I'm calm right now", "Everything feels settled and quiet"],
+    "sadness": ["I feel so sad and down", "I can't stop crying", "I feel empty and heartbroken"],
+    "anxiety": ["I'm anxious and can't stop worrying", "I feel nervous and panicky", "My mind keeps racing with fear"],
+    "anger": ["I'm so angry about this", "This makes me furious", "I'm frustrated and annoyed with everyone"],
+    "loneliness": ["I feel so alone", "Nobody understands me", "I have no one to talk to"],
+    "exhaustion": ["I'm exhausted all the time", "I feel drained and have no energy", "I'm too tired to do anything"],
+    "guilt": ["I feel guilty about it", "It's all my fault", "I'm ashamed of myself"],
+    "neutral": ["I went to the store today", "What time is it", "I had lunch and then did some work"]
+}
+
+RISK_PROTOTYPES = [
+    "I don't want to live anymore",
+    "I want to end it all",
+    "Everyone would be better off without me",
+    "I have been thinking about hurting myself",
+    "There is no point in going on"
+]
+
+# Explicit crisis language always raises the risk flag
+CRISIS_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
+    r"\bkill(ing)? myself\b",
+    r"\bend(ing)? (my|it) (life|all)\b",
+    r"\bsuicid(e|al)\b",
+    r"\bself[- ]?harm\b",
+    r"\bhurt(ing)? myself\b",
+    r"\bcut(ting)? myself\b",
+    r"\b(want|wanna) to die\b",
+    r"\bdon'?t want to (live|be alive|wake up)\b",
+    r"\bno reason to live\b",
+    r"\bbetter off (dead|without me)\b",
+]]
+
+_init_lock = threading.Lock()
+_state: Dict[str, Any] = {"encoder": None, "emotion_labels": None, "emotion_matrix": None,
+                          "emotion_bias": None, "risk_matrix": None, "risk_bias": None,
+                          "heads": None}
+
+
+def _get_encoder():
+    """
+    Return (tokenizer, model) of the shared sentiment pipeline. The ONNX backend does not
+    expose hidden states, so in that case a pytorch copy is loaded once for analysis.
+    """
+    sentiment_analyzer = get_sentiment_pipeline()
+    if not isinstance(sentiment_analyzer.model, torch.nn.Module):
+        sentiment_analyzer, _ = load_sentiment_pipeline("pytorch")
+    return sentiment_analyzer.tokenizer, sentiment_analyzer.model
+
+
+def _encode(tokenizer, model, texts: List[str]):
+    """
+    One forward pass for a batch of texts
+    :return: tuple (sentiment logits, L2-normalized mean-pooled embeddings)
+    """
+    inputs = tokenizer(texts, padding=True, truncation=True, max_length=MAX_TOKENS, return_tensors="pt")
+    with torch.no_grad():
+        outputs = model(**inputs, output_hidden_states=True)
+
+    hidden = outputs.hidden_states[-1]
+    mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+    pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+    return outputs.logits, torch.nn.functional.normalize(pooled, dim=-1)
+
+
+def _prototype_matrix(tokenizer, model, phrase_groups: List[List[str]]):
+    """Embed every phrase group and average it into one unit vector per group"""
+    phrases = [phrase for group in phrase_groups for phrase in group]
+    _, embeddings = _encode(tokenizer, model, phrases)
+
+    rows = []
+    offset = 0
+    for group in phrase_groups:
+        rows.append(embeddings[offset:offset + len(group)].mean(dim=0))
+        offset += len(group)
+    return torch.nn.functional.normalize(torch.stack(rows), dim=-1)
+
+
+def _ensure_initialized():
+    """Load the encoder and build the emotion/risk heads once per process"""
+    if _state["encoder"] is not None:
+        return
+
+    with _init_lock:
+        if _state["encoder"] is not None:
+            return
+
+        tokenizer, model = _get_encoder()
+
+        heads = None
+        if os.path.exists(TEXT_ANALYSIS_HEADS_PATH):
+            try:
+                heads = torch.load(TEXT_ANALYSIS_HEADS_PATH, map_location="cpu")
+                logging.info(f"Loaded text analysis heads from {TEXT_ANALYSIS_HEADS_PATH}")
+            except Exception as e:
+                logging.warning(f"Failed to load text analysis heads, using prototypes: {e}")
+                heads = None
+
+        if heads is not None:
+            _state["emotion_labels"] = list(heads["emotion_labels"])
+            _state["emotion_matrix"] = heads["emotion_weight"]
+            _state["emotion_bias"] = heads["emotion_bias"]
+            _state["risk_matrix"] = heads.get("risk_weight")
+            _state["risk_bias"] = heads.get("risk_bias")
+            _state["heads"] = "trained"
+
+        if _state["risk_matrix"] is None:
+            _state["emotion_labels"] = _state["emotion_labels"] or list(EMOTION_PROTOTYPES)
+            if _state["emotion_matrix"] is None:
+                _state["emotion_matrix"] = _prototype_matrix(tokenizer, model, list(EMOTION_PROTOTYPES.values()))
+                _state["heads"] = "prototypes"
+            _state["risk_matrix"] = _prototype_matrix(tokenizer, model, [RISK_PROTOTYPES])
+
+        _state["encoder"] = (tokenizer, model)
+
+
+def _emotion_probabilities(embeddings):
+    """Emotion probabilities from the trained head or from prototype similarity"""
+    if _state["emotion_bias"] is not None:
+        logits = embeddings @ _state["emotion_matrix"].T + _state["emotion_bias"]
+    else:
+        # Cosine similarities are close together, so sharpen them before the softmax
+        logits = (embeddings @ _state["emotion_matrix"].T) * 20
+    return torch.softmax(logits, dim=-1)
+
+
+def _risk_scores(embeddings):
+    """Risk score between 0 and 1 from the trained head or from prototype similarity"""
+    if _state["risk_bias"] is not None:
+        return torch.sigmoid(embeddings @ _state["risk_matrix"].T + _state["risk_bias"]).squeeze(-1)
+    similarity = (embeddings @ _state["risk_matrix"].T).squeeze(-1)
+    # Map cosine similarity (mostly 0.5..1 for this encoder) onto 0..1
+    return ((similarity - 0.5) * 2).clamp(0, 1)
+
+
+def analyze_texts(texts: List[str]) -> List[Dict[str, Any]]:
+    """
+    Analyze a batch of texts with one shared-encoder forward pass
+    :param texts: list of texts
+    :return: list of structured results with sentiment, emotions and risk, in the same order
+    """
+    if not texts:
+        return []
+
+    _ensure_initialized()
+    tokenizer, model = _state["encoder"]
+    id2label = model.config.id2label
+
+    logits, embeddings = _encode(tokenizer, model, list(texts))
+    sentiment_probabilities = torch.softmax(logits, dim=-1)
+    emotion_probabilities = _emotion_probabilities(embeddings)
+    risk_scores = _risk_scores(embeddings)
+
+    results = []
+    for index, text in enumerate(texts):
+        confidence, label_id = sentiment_probabilities[index].max(dim=-1)
+        label = id2label[int(label_id)].lower()
+        sentiment_score = normalize_sentiment(label, float(confidence))
+
+        emotion_scores = {emotion: round(float(probability), 4)
+                          for emotion, probability in zip(_state["emotion_labels"], emotion_probabilities[index])}
+        ranked_emotions = sorted(emotion_scores, key=emotion_scores.get, reverse=True)
+
+        matched_phrases = [match.group(0) for pattern in CRISIS_PATTERNS for match in [pattern.search(text)] if match]
+        risk_score = float(risk_scores[index])
+        if matched_phrases:
+            risk_level = "high"
+        elif risk_score >= RISK_THRESHOLD and sentiment_score < 0:
+            risk_level = "elevated"
+        else:
+            risk_level = "none"
+
+        results.append({
+            "sentiment": {
+                "score": sentiment_score,
+                "label": label,
+                "confidence": round(float(confidence), 4)
+            },
+            "emotions": {
+                "top": ranked_emotions[0],
+                "labels": [emotion for emotion in ranked_emotions if emotion_scores[emotion] >= EMOTION_THRESHOLD],
+                "scores": emotion_scores
+            },
+            "risk": {
+                "flag": risk_level != "none",
+                "level": risk_level,
+                "score": round(risk_score, 4),
+                "matched_phrases": matched_phrases
+            },
+            "version": TEXT_ANALYSIS_VERSION
+        })
+
+    return results
+
+
+def analyze_text(text: str) -> Dict[str, Any]:
+    """
+    Analyze one text (sentiment, emotions and crisis risk)
+    :param text: the text to analyze
+    :return: the structured analysis result
+    """
+    return analyze_texts([text])[0]
+
+
+def embed_texts(texts: List[str]) -> torch.Tensor:
+    """
+    Embed texts with the shared encoder (used e.g. for semantic caching)
+    :param texts: list of texts
+    :return: tensor of L2-normalized mean-pooled embeddings, one row per text
+    """
+    _ensure_initialized()
+    tokenizer, model = _state["encoder"]
+    _, embeddings = _encode(tokenizer, model, list(texts))
+    return embeddings
+
+
+def warmup_text_analysis() -> bool:
+    """
+    Build the emotion and risk heads before serving traffic
+    :return: True if analysis is ready
+    """
+    try:
+        analyze_text("I am feeling okay today, thank you for asking.")
+        return True
+    except Exception as e:
+        logging.error(f"Text analysis warmup failed: {e}")
+        return False
+
+
+def get_text_analysis_status() -> Dict[str, Any]:
+    """Get which heads are in use"""
+    return {
+        "ready": _state["encoder"] is not None,
+        "heads": _state["heads"],
+        "emotion_labels": _state["emotion_labels"],
+        "version": TEXT_ANALYSIS_VERSION
+    }